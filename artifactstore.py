@@ -0,0 +1,248 @@
+"""Content-addressed store de-duplicating report artifacts between runs
+
+Most of what a nightly run writes under LPReports (the logo, the charts, the
+HTML tables and their .gz siblings) is byte-identical to the night before.
+ArtifactStore keeps one copy of each distinct file under <root>/.objects,
+named by its SHA-1, and every run directory holds hard links to those
+objects, so a file only takes space (and, when written through put(), disk
+writes) the first time its content appears.
+
+Objects are made read-only: a linked file is shared by every run holding it,
+so it may be replaced (written to a new name and renamed over) but never
+rewritten in place. make_report.py and precompress.py only ever write new
+files or rename over old ones.
+
+compact() applies the retention policy to old runs, links the files of runs
+written before the store (or outside it) and drops the objects no run links to
+any more:
+
+Usage: python artifactstore.py <reports root> compact [--keep N] [--keep-days N]
+       python artifactstore.py <reports root> stats
+
+Dependent Packages: lpmanifest (this repository)
+"""
+
+from optparse import OptionParser
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import time
+
+import lpmanifest
+
+OBJECTS = '.objects'
+
+def _sha1(path):
+    return lpmanifest.checksum(path)
+
+class ArtifactStore(object):
+    """Objects shared by the run directories under root; root and the runs must be on one filesystem"""
+
+    def __init__(self, root):
+        self.root = root
+        self.objects = os.path.join(root, OBJECTS)
+        if not os.path.isdir(self.objects):
+            os.makedirs(self.objects)
+        self.stats = {'files': 0, 'linked': 0, 'stored': 0, 'bytes_saved': 0}
+        # Path -> digest of the files already put, copied or added, so they are not hashed again
+        self.known = {}
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def _store(self, path, digest):
+        """Make the file at path the object for digest"""
+        obj = self.object_path(digest)
+        if not os.path.isdir(os.path.dirname(obj)):
+            try:
+                os.mkdir(os.path.dirname(obj))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(obj)):
+                    raise
+        os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        try:
+            os.link(path, obj)
+        except OSError:
+            # Another run stored the same content first
+            if not os.path.exists(obj):
+                raise
+            return False
+        self.stats['stored'] += 1
+        return True
+
+    def _replace_with_link(self, obj, path):
+        temp = '%s.%s.link' % (path, os.getpid())
+        os.link(obj, temp)
+        os.rename(temp, path)
+
+    def add(self, path, digest=None):
+        """De-duplicate the file at path: link it to the object holding the same content, or make
+        it that object. digest is its SHA-1 when already known (e.g. from the manifest).
+        Returns the digest."""
+        st = os.lstat(path)
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = os.path.normpath(path)
+        if key in self.known:
+            return self.known[key]
+        if digest is None:
+            digest = _sha1(path)
+        self.known[key] = digest
+        self.stats['files'] += 1
+        obj = self.object_path(digest)
+        try:
+            ost = os.stat(obj)
+        except OSError:
+            ost = None
+        if ost is not None and (ost.st_ino, ost.st_dev) == (st.st_ino, st.st_dev):
+            return digest
+        if ost is None and self._store(path, digest):
+            return digest
+        self._replace_with_link(obj, path)
+        self.stats['linked'] += 1
+        self.stats['bytes_saved'] += st.st_size
+        return digest
+
+    def put(self, path, data):
+        """Write data (a string) to path, as a link to its object when the content is already
+        stored, without writing it again. Returns the digest."""
+        digest = self.known[os.path.normpath(path)] = hashlib.sha1(data).hexdigest()
+        obj = self.object_path(digest)
+        self.stats['files'] += 1
+        if os.path.exists(obj):
+            self._replace_with_link(obj, path)
+            self.stats['linked'] += 1
+            self.stats['bytes_saved'] += len(data)
+            return digest
+        temp = '%s.%s.tmp' % (path, os.getpid())
+        out = open(temp, 'wb')
+        try:
+            out.write(data)
+        finally:
+            out.close()
+        os.rename(temp, path)
+        if not self._store(path, digest):
+            self._replace_with_link(obj, path)
+        return digest
+
+    def copy(self, source, path):
+        """Copy the file at source to path, through the store (as a link) rather than as a new copy"""
+        digest = self.known[os.path.normpath(path)] = _sha1(source)
+        obj = self.object_path(digest)
+        self.stats['files'] += 1
+        if not os.path.exists(obj):
+            shutil.copy2(source, path)
+            if self._store(path, digest):
+                return digest
+        self._replace_with_link(obj, path)
+        self.stats['linked'] += 1
+        self.stats['bytes_saved'] += os.path.getsize(path)
+        return digest
+
+    def add_tree(self, directory, digests=None):
+        """De-duplicate every file under directory; digests maps paths relative to it to their
+        known SHA-1. Returns {relative path: digest}."""
+        found = {}
+        digests = digests or {}
+        for dirpath, dirnames, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                relative = os.path.relpath(path, directory)
+                digest = self.add(path, digests.get(relative))
+                if digest is not None:
+                    found[relative] = digest
+        return found
+
+    def collect(self):
+        """Remove the objects no run links to any more; returns (objects, bytes) removed"""
+        removed = freed = 0
+        for dirpath, dirnames, names in os.walk(self.objects):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                st = os.lstat(path)
+                if st.st_nlink == 1:
+                    os.remove(path)
+                    removed += 1
+                    freed += st.st_size
+        return removed, freed
+
+    def usage(self):
+        """(files, bytes) under root as stored on disk, each hard linked file counted once"""
+        seen = set()
+        files = total = 0
+        for dirpath, dirnames, names in os.walk(self.root):
+            for name in names:
+                st = os.lstat(os.path.join(dirpath, name))
+                files += 1
+                if (st.st_ino, st.st_dev) not in seen:
+                    seen.add((st.st_ino, st.st_dev))
+                    total += st.st_size
+        return files, total
+
+    def summary(self):
+        return "%(files)s files, %(stored)s new objects, %(linked)s linked to an existing one (%(bytes_saved)s bytes not kept twice)" % self.stats
+
+def run_directories(root, manifest=None):
+    """[(time, name)] of the run directories under root, oldest first: the time bugseeker
+    recorded for the run in manifest, or the directory's mtime for runs it does not know"""
+    runs = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith('.') or os.path.islink(path) or not os.path.isdir(path):
+            continue
+        entry = manifest and manifest.get(name)
+        runs.append((entry['time'] if entry else int(os.path.getmtime(path)), name))
+    return sorted(runs)
+
+def compact(root, keep=0, keep_days=0, now=None):
+    """Remove the runs beyond the retention policy (all but the keep most recent, those older
+    than keep_days; 0 keeps everything), never the one 'latest' points to, link the files of
+    the remaining runs to the store and drop unused objects. Returns a summary dict."""
+    manifest = lpmanifest.Manifest(root)
+    store = ArtifactStore(root)
+    latest = os.path.join(root, lpmanifest.LATEST)
+    published = os.path.basename(os.path.realpath(latest)) if os.path.islink(latest) else None
+    runs = run_directories(root, manifest)
+    now = now or time.time()
+    expired = set()
+    if keep:
+        expired.update(name for when, name in runs[:-keep])
+    if keep_days:
+        expired.update(name for when, name in runs if when < now - keep_days * 86400)
+    expired.discard(published)
+    for when, name in runs:
+        if name in expired:
+            shutil.rmtree(os.path.join(root, name))
+            manifest.append({'run': name, 'stage': 'removed', 'dir': name, 'time': int(now)})
+            continue
+        digests = {}
+        for stage in (lpmanifest.BUGSEEKER, lpmanifest.REPORT):
+            entry = manifest.get(name, stage)
+            if entry is not None:
+                digests.update((path, info['sha1']) for path, info in entry['artifacts'].items())
+        store.add_tree(os.path.join(root, name), digests)
+    objects, freed = store.collect()
+    manifest.close()
+    return {'runs': len(runs), 'removed': len(expired), 'objects_removed': objects, 'bytes_freed': freed,
+            'store': store.summary()}
+
+def main():
+    usage = "usage: %prog root compact [--keep N] [--keep-days N]\n       %prog root stats"
+    parser = OptionParser(usage=usage)
+    parser.add_option("--keep", help="Keep only the N most recent runs, 0 for all. Default: 0", dest="keep", type="int", default=0)
+    parser.add_option("--keep-days", help="Remove runs older than N days, 0 for none. Default: 0", dest="keep_days", type="int", default=0)
+    (options, args) = parser.parse_args()
+    if len(args) != 2 or args[1] not in ('compact', 'stats'):
+        sys.exit(parser.print_usage())
+    root = args[0]
+    start = time.time()
+    if args[1] == 'compact':
+        result = compact(root, options.keep, options.keep_days)
+        print "%(runs)s runs, %(removed)s removed; %(store)s; %(objects_removed)s unused objects dropped (%(bytes_freed)s bytes)" % result
+    files, total = ArtifactStore(root).usage()
+    print "%s files in %.1f MB on disk (%.1f s)" % (files, total / (1024.0 * 1024.0), time.time() - start)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1234 @@
+#!/usr/bin/env python
+"""Benchmarks for the report pipeline
+
+Usage: python benchmark.py <name> [options]
+Run without a name to list the available benchmarks.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from multiprocessing.pool import ThreadPool
+from optparse import OptionParser
+import hashlib
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import markup
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer the response so headers and body leave in one segment
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.count('requests')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = self.document()
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def document(self):
+        """The JSON body served for self.path, or None for a 404"""
+        return json.dumps({'self_link': self.server.url(self.path)})
+
+    def log_message(self, *args):
+        pass
+
+def first_bug(project):
+    """Bugs of the fake Launchpad's projects do not overlap: each gets its own block of ids"""
+    return (int(hashlib.md5(project).hexdigest()[:6], 16) % 1000) * 100000
+
+class FakeLaunchpadHandler(StandInHandler):
+    """Serves a synthetic bug graph shaped like the Launchpad API's:
+    tasks -> bug, people, milestone -> users affected, linked branches -> landing targets -> preview diff"""
+    page_size = 75
+
+    def document(self):
+        url = self.server.url
+        path, _, query = self.path.partition('?')
+        parts = path.strip('/').split('/')[1:]
+        tasks = self.server.tasks
+        if parts[-1] == 'tasks':
+            # /1.0/<project>/tasks lists another project's bugs, numbered from first_bug(project),
+            # except for the first server.overlap of them, which every project has a task on
+            start = int(dict(q.split('=') for q in query.split('&') if q).get('ws.start', 0))
+            project = parts[0] if len(parts) > 1 else 'nova'
+            first = first_bug(project) if len(parts) > 1 else 0
+            shared = int(tasks * self.server.overlap)
+            entries = []
+            for n in range(start, min(start + self.page_size, tasks)):
+                i = n if n < shared else first + n
+                entries.append({'self_link': url('/1.0/%s/+bug/%s' % (project, i)), 'resource_type_link': url('/1.0/#bug_task'),
+                                'bug_link': url('/1.0/bugs/%s' % i), 'owner_link': url('/1.0/~person%s' % (i % 40)),
+                                'assignee_link': url('/1.0/~person%s' % (i % 25)), 'milestone_link': url('/1.0/nova/+milestone/m%s' % (i % 6)),
+                                'status': 'Fix Released', 'importance': 'High', 'date_created': '2011-06-01T10:00:00.000000+00:00',
+                                'date_fix_committed': '2011-06-03T10:00:00.000000+00:00', 'date_fix_released': None})
+            doc = {'total_size': tasks, 'start': start, 'entries': entries}
+            if start + self.page_size < tasks:
+                doc['next_collection_link'] = url('%s?ws.start=%s' % (path, start + self.page_size))
+        elif parts[0] == 'bugs' and len(parts) == 2:
+            i = parts[1]
+            doc = {'self_link': url(path), 'id': int(i), 'title': 'Bug %s' % i, 'users_affected_count': 2,
+                   'users_affected_collection_link': url('/1.0/bugs/%s/users_affected' % i),
+                   'linked_branches_collection_link': url('/1.0/bugs/%s/linked_branches' % i)}
+        elif parts[0] == 'bugs' and parts[2] == 'users_affected':
+            doc = {'entries': [{'self_link': url('/1.0/~person%s' % n), 'name': 'person%s' % n} for n in (1, 2)]}
+        elif parts[0] == 'bugs' and parts[2] == 'linked_branches':
+            # The first branch goes to trunk, the others are backports to stable series
+            names = ['fix-%s' % parts[1]] + ['fix-%s-%s' % (parts[1], k) for k in range(1, self.server.branches)]
+            doc = {'entries': [{'branch_link': url('/1.0/~dev/nova/%s' % name)} for name in names]}
+        elif parts[0].startswith('~person'):
+            doc = {'self_link': url(path), 'name': parts[0][1:]}
+        elif parts[0] == 'nova':
+            doc = {'self_link': url(path), 'title': 'OpenStack Compute %s' % parts[-1]}
+        elif parts[0] == '~dev' and len(parts) == 3:
+            doc = {'self_link': url(path), 'landing_targets_collection_link': url(path + '/landing_targets')}
+        elif parts[0] == '~dev' and parts[3] == 'landing_targets':
+            branch = '/'.join([''] + ['1.0'] + parts[:3])
+            k = self.branch_number(parts[2])
+            entries = [{'self_link': url(branch + '/+merge/1'), 'queue_status': 'Merged', 'merged_revno': 1000 + k,
+                        'date_merged': '2011-06-%02dT10:00:00.000000+00:00' % (2 + k),
+                        'preview_diff_link': url(branch + '/+merge/1/+preview-diff/1')}]
+            if self.server.branches > 1 and k == 0:
+                # An earlier attempt at the fix, never merged
+                entries.insert(0, {'self_link': url(branch + '/+merge/2'), 'queue_status': 'Superseded', 'merged_revno': None,
+                                   'date_merged': None, 'preview_diff_link': url(branch + '/+merge/2/+preview-diff/1')})
+            doc = {'entries': entries}
+        elif parts[-2] == '+preview-diff':
+            k = self.branch_number(parts[2])
+            if parts[4] == '2':
+                diffstat = {'nova/compute/manager.py': [80, 40]}
+            else:
+                diffstat = {'nova/compute/manager.py': [10 + k, 2], 'nova/tests/test_compute.py': [30, 0]}
+                if k:
+                    diffstat['nova/compute/compat_%s.py' % k] = [5, 0]
+            doc = {'self_link': url(path), 'diffstat': diffstat}
+        else:
+            return None
+        return json.dumps(doc)
+
+    def branch_number(self, name):
+        """0 for a bug's trunk branch fix-<bug>, k for its backport fix-<bug>-<k>"""
+        return int(name.split('-')[2]) if name.count('-') == 2 else 0
+
+class OverloadedLaunchpadHandler(FakeLaunchpadHandler):
+    """The fake Launchpad, answering 503 to a random share (server.error_rate) of requests
+    and to every request beyond server.capacity concurrent ones"""
+
+    def do_GET(self):
+        server = self.server
+        server.count('active')
+        try:
+            if server.counters['active'] > server.capacity or random.random() < server.error_rate:
+                server.count('unavailable')
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            FakeLaunchpadHandler.do_GET(self)
+        finally:
+            server.count('active', -1)
+
+class MovedHandler(StandInHandler):
+    """Answers <collection>/moved/<id> with a redirect to <collection>/<id>"""
+
+    def do_GET(self):
+        if '/moved/' not in self.path:
+            return StandInHandler.do_GET(self)
+        self.server.count('redirects')
+        self.send_response(302)
+        self.send_header('Location', self.server.url(self.path.replace('/moved/', '/')))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """A local stand-in for the Launchpad API that counts accepted connections and requests"""
+    daemon_threads = True
+
+    request_queue_size = 256
+
+    def __init__(self, latency=0.0, handler=StandInHandler, tasks=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), handler)
+        self.latency = latency
+        self.tasks = tasks
+        self.capacity = None
+        self.error_rate = 0.0
+        self.overlap = 0.0
+        self.branches = 1
+        self.counters = {'connections': 0, 'requests': 0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def count(self, name, delta=1):
+        self._lock.acquire()
+        self.counters[name] = self.counters.get(name, 0) + delta
+        self._lock.release()
+
+    def process_request(self, request, client_address):
+        self.count('connections')
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients that give up mid-run reset their connections; that is not a server error
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def url(self, path='/'):
+        return 'http://%s:%s%s' % (self.server_address + (path,))
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def _timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+def _random_path(rnd):
+    dirs = ['nova', 'nova/compute', 'nova/api/openstack', 'nova/virt/libvirt', 'nova/tests', 'swift/common', 'glance/store']
+    return '%s/%s_%s.py' % (rnd.choice(dirs), rnd.choice(['manager', 'api', 'utils', 'driver', 'test']), rnd.randint(0, 500))
+
+def _write_table(path, rows):
+    """Write an HTML table shaped like the ones make_report produces"""
+    page = markup.page()
+    page.init(title="Launchpad Bug report")
+    page.table(border="2", cellspacing="0", cellpadding="4", width="50%", style="font-family:Verdana, sans-serif; text-align:left")
+    page.th("S/N")
+    page.th("Modified File")
+    page.th("# of times modified")
+    count = 1
+    for item in rows:
+        page.tr()
+        page.td(count)
+        page.td(str(item[0]))
+        page.td(str(item[1]))
+        page.tr.close()
+        count = count + 1
+    page.table.close()
+    html = open(path, 'w')
+    html.write(str(page))
+    html.close()
+
+def bench_precompress(options):
+    """Artifact size and generation overhead of precompressed report siblings"""
+    import precompress
+    if options.brotli and precompress.brotli is None:
+        sys.exit(precompress.BROTLI_MISSING)
+    rnd = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix='lpbench')
+    try:
+        tables = [[(_random_path(rnd), rnd.randint(1, 300)) for j in range(options.rows)] for i in range(options.tables)]
+        start = time.time()
+        for i, rows in enumerate(tables):
+            _write_table(os.path.join(workdir, 'table%s.html' % i), rows)
+        print "HTML generation: %.3f seconds" % (time.time() - start)
+        for level in (1, 6, 9):
+            results, elapsed = _timed(precompress.precompress, workdir, level, options.brotli, options.jobs, True)
+            size, gz_size, br_size = precompress.summarize(results)
+            line = "level %s: %s files, %s -> %s bytes gzip (%.1f%%)" % (level, len(results), size, gz_size, 100.0 * gz_size / size)
+            if options.brotli:
+                line += ", %s bytes brotli (%.1f%%)" % (br_size, 100.0 * br_size / size)
+            print line + ", %.3f seconds" % elapsed
+        results, elapsed = _timed(precompress.precompress, workdir, 9, options.brotli, options.jobs)
+        print "re-run with up to date siblings: %.3f seconds" % elapsed
+    finally:
+        shutil.rmtree(workdir)
+
+def bench_pool(options):
+    """Connections opened vs requests sent, with and without the shared connection pool"""
+    import httplib2
+    import lphttp
+    server = StandInServer(latency=0.002)
+    urls = [server.url('/1.0/~person%s' % i) for i in range(options.requests)]
+    workers = ThreadPool(options.jobs or 8)
+    try:
+        # Without pooling every worker request pays for its own connection, as
+        # happens when an httplib2.Http is not reused between threads
+        def unpooled(url):
+            return httplib2.Http().request(url)
+        results, elapsed = _timed(workers.map, unpooled, urls)
+        print "unpooled: %s requests over %s connections, %.3f seconds" % (len(urls), server.counters['connections'], elapsed)
+
+        server.counters['connections'] = 0
+        pool = lphttp.ConnectionPool(options.jobs or 8)
+        http = lphttp.PooledHttp(pool=pool)
+        results, elapsed = _timed(workers.map, http.request, urls)
+        print "pooled:   %s requests over %s connections (server accepted %s), %.3f seconds" % (pool.requests_sent, pool.connections_opened, server.counters['connections'], elapsed)
+        pool.close()
+    finally:
+        workers.close()
+        server.stop()
+
+def bench_cache(options):
+    """Network requests saved by the revalidating response cache on repeated runs"""
+    import lphttp
+    server = StandInServer(latency=0.002)
+    urls = [server.url('/1.0/bugs/%s' % i) for i in range(options.requests)]
+    cachedir = tempfile.mkdtemp(prefix='lpcache')
+    workers = ThreadPool(options.jobs or 8)
+    try:
+        for run, max_bytes in (('cold', lphttp.DEFAULT_CACHE_SIZE), ('warm', lphttp.DEFAULT_CACHE_SIZE), ('bounded to 32KB', 32 * 1024)):
+            server.counters = {'connections': 0, 'requests': 0, 'not_modified': 0}
+            pool = lphttp.ConnectionPool(options.jobs or 8)
+            cache = lphttp.BoundedFileCache(cachedir, max_bytes)
+            http = lphttp.PooledHttp(cache, pool=pool)
+            results, elapsed = _timed(workers.map, http.request, urls)
+            print "%s run: server saw %s requests (%s answered 304), %.3f seconds" % (run, server.counters['requests'], server.counters['not_modified'], elapsed)
+            print "    cache: %s" % cache.summary()
+            pool.close()
+    finally:
+        workers.close()
+        server.stop()
+        shutil.rmtree(cachedir)
+
+def bench_pipeline(options):
+    """Page fetch / hydration overlap of bugseeker.pipelined"""
+    import bugseeker
+    fetch, hydrate, pages = 0.05, 0.05, 20
+    def fetch_pages():
+        for i in range(pages):
+            time.sleep(fetch)
+            yield i
+    def run(iterable):
+        for page in iterable:
+            time.sleep(hydrate)
+    result, sequential = _timed(run, fetch_pages())
+    result, overlapped = _timed(run, bugseeker.pipelined(fetch_pages(), 2))
+    print "%s pages, %.2fs fetch + %.2fs hydrate each: sequential %.2f seconds, pipelined %.2f seconds (ideal %.2f)" % (
+        pages, fetch, hydrate, sequential, overlapped, pages * max(fetch, hydrate) + min(fetch, hydrate))
+
+def bench_artifacts(options):
+    """Disk usage and bytes written by a month of nightly report runs, as plain copies and through the artifact store"""
+    import artifactstore
+    rnd = random.Random(5)
+    nights = 30
+    # (name, size, chance the content changes from one night to the next)
+    layout = ([('BugReport.xls', 400000, 1.0), ('images/vertex_ntt.png', 20000, 0.0), ('index.html', 6000, 1.0)] +
+              [('charts/chart%s.png' % i, 40000, 0.2) for i in range(9)] +
+              [('table%s.html' % i, 80000, 0.3) for i in range(5)])
+    contents = dict((name, os.urandom(size)) for name, size, change in layout)
+    nightly = []
+    for night in range(nights):
+        for name, size, change in layout:
+            if night and rnd.random() < change:
+                contents[name] = os.urandom(size)
+        nightly.append(dict(contents))
+    for label in ('plain copies', 'artifact store'):
+        root = tempfile.mkdtemp()
+        try:
+            store = artifactstore.ArtifactStore(root) if label == 'artifact store' else None
+            written = 0
+            start = time.time()
+            for night, files in enumerate(nightly):
+                run_dir = os.path.join(root, 'run%02d' % night)
+                for name, data in sorted(files.items()):
+                    path = os.path.join(run_dir, name)
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    if store is None:
+                        open(path, 'wb').write(data)
+                        written += len(data)
+                    else:
+                        linked = store.stats['linked']
+                        store.put(path, data)
+                        if store.stats['linked'] == linked:
+                            written += len(data)
+            elapsed = time.time() - start
+            files, total = artifactstore.ArtifactStore(root).usage()
+            print "%-15s %s runs: %.1f MB on disk, %.1f MB written, %.2f seconds" % (
+                label + ':', nights, total / 1048576.0, written / 1048576.0, elapsed)
+        finally:
+            shutil.rmtree(root)
+
+def bench_async(options):
+    """Single-threaded asynchronous hydration against a fake Launchpad with per-request latency"""
+    import bugseeker
+    import lpasync
+    server = StandInServer(latency=0.05, handler=FakeLaunchpadHandler, tasks=options.bugs)
+    try:
+        for max_in_flight in (10, 50, 200):
+            server.counters = {'connections': 0, 'requests': 0}
+            client = lpasync.AsyncClient(max_in_flight)
+            first_page = json.loads(httplib_get(server.url('/1.0/tasks')))
+            bugs, elapsed = _timed(lpasync.hydrate, client, first_page, bugseeker.Bug.from_json)
+            client.close()
+            print "max in flight %3s: %s bugs, %s requests over %s connections, %.2f seconds" % (
+                max_in_flight, len(bugs), client.counters['requests'], server.counters['connections'], elapsed)
+    finally:
+        server.stop()
+
+def bench_scheduler(options):
+    """Hydration against a fake Launchpad that sheds load with 503s, with and without lpscheduler"""
+    import bugseeker
+    import lpasync
+    import lphttp
+    import lpscheduler
+    server = StandInServer(latency=0.05, handler=OverloadedLaunchpadHandler, tasks=options.bugs)
+    server.capacity = 20
+    server.error_rate = 0.02
+    def scheduler():
+        # A short cool-down keeps a tripped circuit from dominating the timing
+        return lpscheduler.RequestScheduler(rate=0, max_retries=8, backoff_base=0.05, cooldown=1.0)
+    try:
+        first_page = json.loads(httplib_get(server.url('/1.0/tasks')))
+        for label, sched in (('async, no scheduler', None), ('async, scheduler', scheduler())):
+            server.counters = {'connections': 0, 'requests': 0, 'unavailable': 0, 'active': 0}
+            client = lpasync.AsyncClient(200, scheduler=sched)
+            start = time.time()
+            try:
+                bugs = lpasync.hydrate(client, first_page, bugseeker.Bug.from_json)
+                outcome = "%s bugs" % len(bugs)
+            except lpasync.HTTPError as e:
+                outcome = "aborted (%s)" % e
+            elapsed = time.time() - start
+            client.close()
+            print "%-22s %s, %s requests served, %s answered 503, %.2f seconds" % (
+                label + ':', outcome, server.counters['requests'], server.counters['unavailable'], elapsed)
+            if sched is not None:
+                print sched.summary()
+
+        urls = [server.url('/1.0/bugs/%s' % i) for i in range(options.bugs)]
+        for label, sched in (('threads, no scheduler', None), ('threads, scheduler', scheduler())):
+            server.counters = {'connections': 0, 'requests': 0, 'unavailable': 0, 'active': 0}
+            pool = lphttp.ConnectionPool(64)
+            http = lphttp.PooledHttp(pool=pool, scheduler=sched)
+            workers = ThreadPool(64)
+            responses, elapsed = _timed(workers.map, lambda url: http.request(url)[0].status, urls)
+            workers.close()
+            pool.close()
+            print "%-22s %s of %s bugs loaded, %s requests served, %s answered 503, %.2f seconds" % (
+                label + ':', responses.count(200), len(urls), server.counters['requests'], server.counters['unavailable'], elapsed)
+            if sched is not None:
+                print sched.summary()
+
+        # Errors the scheduler does not retry (a response that fails to parse, an auth error)
+        # must give their slot back, or an endpoint with one slot left is blocked for good
+        sched = lpscheduler.RequestScheduler(rate=0, initial_limit=1, min_limit=1, max_limit=1)
+        def unparsable():
+            raise ValueError("not JSON")
+        errors = 0
+        for i in range(5):
+            try:
+                sched.call('bugs', unparsable, max_wait=2)
+            except ValueError:
+                errors += 1
+        result, elapsed = _timed(sched.call, 'bugs', lambda: 'ok', None, (socket.error,), 2)
+        assert errors == 5 and result == 'ok' and sched.stats()['bugs']['failures'] == 0
+        print "%s non-retried errors on a one-slot endpoint, then a request served in %.1f ms" % (errors, elapsed * 1000)
+    finally:
+        server.stop()
+
+    # httplib2 follows a redirect with a nested request(); it must not wait for a second
+    # slot while the first one is held, so run it aside and give up after a few seconds
+    server = StandInServer(handler=MovedHandler)
+    try:
+        sched = lpscheduler.RequestScheduler(rate=0, initial_limit=1, min_limit=1, max_limit=1)
+        pool = lphttp.ConnectionPool(1)
+        http = lphttp.PooledHttp(pool=pool, scheduler=sched)
+        statuses = []
+        worker = threading.Thread(target=lambda: statuses.append(http.request(server.url('/1.0/bugs/moved/1'))[0].status))
+        worker.setDaemon(True)
+        start = time.time()
+        worker.start()
+        worker.join(5)
+        assert statuses == [200], "redirected request stuck waiting for a slot on a one-slot endpoint"
+        assert sched.stats()['bugs']['requests'] == 1 and server.counters['redirects'] == 1
+        print "redirect followed on a one-slot endpoint in %.1f ms" % ((time.time() - start) * 1000)
+        pool.close()
+    finally:
+        server.stop()
+
+def bench_projects(options):
+    """Several projects hydrated one after the other with a client each, as separate bugseeker
+    runs do, against all of them on one shared client"""
+    import bugseeker
+    import lpasync
+    projects = ['nova', 'swift', 'glance', 'keystone']
+    server = StandInServer(latency=0.05, handler=FakeLaunchpadHandler, tasks=options.bugs)
+    build = lambda parts: bugseeker.Bug.from_json(parts).record()
+    try:
+        first_pages = dict((project, json.loads(httplib_get(server.url('/1.0/%s/tasks' % project)))) for project in projects)
+        server.counters = {'connections': 0, 'requests': 0}
+        start = time.time()
+        total = 0
+        for project in projects:
+            client = lpasync.AsyncClient(50)
+            total += len(lpasync.hydrate(client, first_pages[project], build))
+            client.close()
+        print "one client per project: %s bugs, %s requests, %.2f seconds" % (total, server.counters['requests'], time.time() - start)
+
+        server.counters = {'connections': 0, 'requests': 0}
+        start = time.time()
+        client = lpasync.AsyncClient(50 * len(projects))
+        results = [lpasync.spawn_hydration(client, first_pages[project], build) for project in projects]
+        client.run()
+        client.close()
+        print "one shared client:      %s bugs, %s requests, %.2f seconds" % (
+            sum(len(records) for records in results), server.counters['requests'], time.time() - start)
+    finally:
+        server.stop()
+
+def bench_immutable(options):
+    """Hydration run twice with the store of merged proposals and preview diffs, cold then warm"""
+    import bugseeker
+    import lpasync
+    import lpimmutable
+    server = StandInServer(latency=0.05, handler=FakeLaunchpadHandler, tasks=options.bugs)
+    tmpdir = tempfile.mkdtemp()
+    build = lambda parts: bugseeker.Bug.from_json(parts).record()
+    try:
+        first_page = json.loads(httplib_get(server.url('/1.0/nova/tasks')))
+        merges = []
+        for label in ('cold store', 'warm store'):
+            immutable = lpimmutable.ImmutableStore(os.path.join(tmpdir, 'immutable.sqlite'))
+            server.counters = {'connections': 0, 'requests': 0}
+            client = lpasync.AsyncClient(50)
+            bugs, elapsed = _timed(lpasync.hydrate, client, first_page, build, immutable=immutable)
+            client.close()
+            assert all(sorted(bug.files_modified) == ['nova/compute/manager.py', 'nova/tests/test_compute.py'] for bug in bugs)
+            # The warm run reads the merged proposals back from the store, dates included
+            merges.append([(bug.merged_revno, bug.date_merged) for bug in bugs])
+            assert merges[0] == merges[-1] and all(date is not None for revno, date in merges[-1])
+            print "%s: %s bugs, %s requests, %.2f seconds (%s)" % (label, len(bugs), server.counters['requests'], elapsed, immutable.summary())
+            immutable.close()
+    finally:
+        server.stop()
+        shutil.rmtree(tmpdir)
+
+def bench_branches(options):
+    """Latency of hydrating one bug alone, with its fix on one branch and spread over several"""
+    import bugseeker
+    import lpasync
+    latency = 0.05
+    server = StandInServer(latency=latency, handler=FakeLaunchpadHandler, tasks=options.bugs)
+    try:
+        tasks = json.loads(httplib_get(server.url('/1.0/nova/tasks')))['entries'][:20]
+        for branches in (1, 3, 6):
+            server.branches = branches
+            server.counters = {'connections': 0, 'requests': 0}
+            client = lpasync.AsyncClient(50)
+            start = time.time()
+            bugs = [bugseeker.Bug.from_json(client.run(lpasync.hydrate_task(task))) for task in tasks]
+            per_bug = (time.time() - start) / len(tasks)
+            client.close()
+            files = set(len(bug.files_modified) for bug in bugs)
+            # Each file once, as the last merged proposal changed it; the superseded one is left out
+            assert files == set([branches + 1]) and all(bug.merged_revno == 1000 + branches - 1 and
+                                                        bug.lines_added[bug.files_modified.index('nova/compute/manager.py')] == 9 + branches
+                                                        for bug in bugs)
+            print "%s branch(es) per bug: %.0f ms per bug (%.1f round trips), %s requests per bug, %s files each" % (
+                branches, per_bug * 1000, per_bug / latency, server.counters['requests'] / len(tasks), files.pop())
+    finally:
+        server.stop()
+
+def bench_dedup(options):
+    """Projects whose bugs half overlap, hydrated in one run with bugs shared between their tasks"""
+    import bugseeker
+    import lpasync
+    projects = ['nova', 'swift', 'glance', 'keystone']
+    server = StandInServer(latency=0.05, handler=FakeLaunchpadHandler, tasks=options.bugs)
+    server.overlap = 0.5
+    try:
+        first_pages = [json.loads(httplib_get(server.url('/1.0/%s/tasks' % project))) for project in projects]
+        server.counters = {'connections': 0, 'requests': 0}
+        shared_bugs = bugseeker.SharedBugs()
+        def build(parts):
+            shared_bugs.count(parts['reused'], parts['loads'])
+            return bugseeker.Bug.from_json(parts).record()
+        client = lpasync.AsyncClient(200)
+        start = time.time()
+        results = [lpasync.spawn_hydration(client, first_page, build) for first_page in first_pages]
+        client.run()
+        client.close()
+        print "%s tasks in %.2f seconds, %s requests: %s" % (
+            sum(len(records) for records in results), time.time() - start, server.counters['requests'], shared_bugs.summary())
+    finally:
+        server.stop()
+
+def _synthetic_records(count, rnd, paths_per_dir=30):
+    """count BugRecords with diffstats over a tree of nova paths"""
+    import bugseeker
+    dirs = ['nova/%s' % d for d in ('compute', 'network', 'api/openstack', 'api/ec2', 'tests', 'virt/libvirt', 'virt/xenapi',
+                                      'db/sqlalchemy', 'scheduler', 'volume', 'image', 'auth', 'objectstore')]
+    paths = ['%s/module%s.py' % (d, i) for d in dirs for i in range(paths_per_dir)]
+    milestones = ['diablo-%s' % i for i in range(1, 5)] + ['essex-%s' % i for i in range(1, 5)] + ['folsom-%s' % i for i in range(1, 5)]
+    records = []
+    for i in range(count):
+        files = rnd.sample(paths, rnd.randint(1, 8))
+        created = (734000 - 719163 + i * 3650 // count) * 86400 + rnd.randint(0, 86399)
+        fixed = created + int(rnd.expovariate(1 / (30 * 86400.0)))
+        records.append(bugseeker.BugRecord(
+            id=100000 + i, title=u'Bug %s' % i, owner=u'person', status=u'Fix Released', importance=u'High',
+            date_created=created, users_affected_count=1, users_affected=u'person', date_fix_committed=fixed,
+            date_fix_released=None, milestone=milestones[i * len(milestones) // count], fixed_by=u'person',
+            merged_revno=1000 + i, date_merged=fixed, has_multiple_branches='N', number_of_branches=1,
+            num_files_modified=len(files), preview_diff_link='N/A', task_link=u'nova/+bug/%s' % i,
+            files_modified=files, lines_added=[rnd.randint(0, 80) for f in files], lines_removed=[rnd.randint(0, 40) for f in files]))
+    return records
+
+def bench_diffstore(options):
+    """Churn under a directory per milestone from the diffstat store, against rescanning every record"""
+    import diffstore
+    rnd = random.Random(1)
+    records = _synthetic_records(options.bugs * 100, rnd)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = diffstore.DiffstatStore(os.path.join(tmpdir, 'diffstats.sqlite'))
+        elapsed = _timed(store.add_bugs, 'nova', records)[1]
+        print "stored %s bugs in %.2f seconds" % (len(records), elapsed)
+        prefix = u'nova/api/'
+        def rescan():
+            churn = {}
+            for bug in records:
+                for path, (added, removed) in bug.diffstat().items():
+                    if path.startswith(prefix):
+                        bucket = churn.setdefault(bug.milestone, [0, 0])
+                        bucket[0] += added
+                        bucket[1] += removed
+            return churn
+        indexed, indexed_time = _timed(store.churn, prefix)
+        scanned, scan_time = _timed(rescan)
+        assert dict((row[0], [row[3], row[4]]) for row in indexed) == scanned
+        # The empty prefix covers every file
+        assert sum(row[3] for row in store.churn(u'')) == sum(added for bug in records for added, removed in bug.diffstat().values())
+        history, history_time = _timed(store.history, u'nova/compute/module3.py')
+        print "churn under %s per milestone: index %.1f ms, rescanning records %.1f ms" % (prefix, indexed_time * 1000, scan_time * 1000)
+        print "history of one file (%s merges): %.1f ms" % (len(history), history_time * 1000)
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_manifest(options):
+    """Finding the latest report among many dated run directories: ls -t against the manifest index"""
+    import subprocess
+    import lpmanifest
+    root = tempfile.mkdtemp()
+    try:
+        manifest = lpmanifest.Manifest(root)
+        recorded = 0
+        for runs in (100, 1000, 5000):
+            for i in range(recorded, runs):
+                run = 'run%06d' % i
+                os.mkdir(os.path.join(root, run))
+                open(os.path.join(root, run, 'BugReport_nova_%s.xls' % run), 'wb').write('x' * 1024)
+                manifest.record(run, lpmanifest.BUGSEEKER, run, ['BugReport_nova_%s.xls' % run], {'total': 1.0})
+            recorded = runs
+            def ls_latest():
+                output = subprocess.Popen(["/bin/ls", "-t", root], stdout=subprocess.PIPE).communicate()[0]
+                folder = output.split()[0]
+                subprocess.Popen(["/bin/ls", "-t", os.path.join(root, folder)], stdout=subprocess.PIPE).communicate()
+            _, listed = _timed(ls_latest)
+            reopened, indexed = _timed(lambda: lpmanifest.Manifest(root).latest())
+            assert reopened['run'] == 'run%06d' % (runs - 1)
+            _, published = _timed(manifest.publish, reopened['run'])
+            print "%5s runs: ls -t %.1f ms, manifest lookup %.1f ms, publish %.1f ms" % (
+                runs, listed * 1000, indexed * 1000, published * 1000)
+        manifest.close()
+    finally:
+        shutil.rmtree(root)
+
+def bench_pathtrie(options):
+    """Top 10 directories per level over 100k distinct paths: PathTrie, against summing every directory prefix"""
+    import heapq
+    import pathtrie
+    rnd = random.Random(1)
+    count = max(options.bugs * 1000, 1000)
+    items = []
+    for i in range(count):
+        dirs = ['d%s' % rnd.randint(0, 8 >> level) for level in range(rnd.randint(1, 5))]
+        items.append(('/'.join(['nova'] + dirs + ['module%s.py' % i]), rnd.randint(1, 20), rnd.randint(1, 500)))
+    def trie():
+        rollup = pathtrie.PathTrie()
+        rollup.add_many(items)
+        return rollup, rollup.top_by_level(10)
+    def prefixes():
+        totals = {}
+        for path, modifications, lines in items:
+            end = path.find('/')
+            while end != -1:
+                total = totals.setdefault(path[:end + 1], [0, 0])
+                total[0] += modifications
+                total[1] += lines
+                end = path.find('/', end + 1)
+        levels = {}
+        for prefix, total in totals.iteritems():
+            levels.setdefault(prefix.count('/'), []).append((prefix, total))
+        return totals, [heapq.nlargest(10, levels[depth], key=lambda item: item[1][0]) for depth in sorted(levels)]
+    (rollup, levels), trie_time = _timed(trie)
+    (totals, prefix_levels), prefix_time = _timed(prefixes)
+    assert all(rollup.node(prefix).modifications == total[0] for prefix, total in totals.items())
+    assert [[node.modifications for path, node in top] for depth, top in levels] == [[total[0] for prefix, total in top] for top in prefix_levels]
+    tree, tree_time = _timed(rollup.to_tree, 3, 8)
+    print "%s paths in %s directories, top 10 of each of %s levels: trie %.2f s, prefix sums %.2f s" % (
+        count, len(totals), len(levels), trie_time, prefix_time)
+    print "sunburst tree (3 levels, 8 entries each) in %.1f ms" % (tree_time * 1000)
+    # A module replaced by a package of the same name keeps the counts of both, whichever comes first
+    clash = [('nova/db', 2, 20), ('nova/db/api.py', 3, 30), ('nova/db', 4, 40)]
+    for order in (clash, clash[::-1]):
+        rollup = pathtrie.PathTrie()
+        rollup.add_many(order)
+        node = rollup.node('nova/db')
+        assert (node.modifications, node.lines, node.files) == (9, 90, 2) and rollup.node('nova').modifications == 9
+
+def bench_trends(options):
+    """Summarizing a year of archived report runs for the trend charts: cold in one process and in a
+    pool, warm from the cached summaries, and after one more night"""
+    import bugseeker
+    import lpmanifest
+    import trends
+    rnd = random.Random(4)
+    nights = 24
+    records = _synthetic_records(options.bugs * 10, rnd)
+    root = tempfile.mkdtemp()
+    def night(n):
+        run = 'run%03d' % n
+        os.mkdir(os.path.join(root, run))
+        name = 'BugReport_nova_%s.xls' % run
+        # Every night's report lists the bugs fixed so far
+        report = bugseeker.Report([])
+        report.create_spreadsheet(os.path.join(root, run, name), 'nova', 0, [], records[:len(records) * (n + 1) // (nights + 1)])
+        manifest = lpmanifest.Manifest(root)
+        manifest.record(run, lpmanifest.BUGSEEKER, run, [name])
+        manifest.close()
+    try:
+        for n in range(nights):
+            night(n)
+        for label, processes in (('cold, 1 process', 1), ('cold, pool', options.jobs), ('warm', options.jobs), ('one new night', options.jobs)):
+            if label.startswith('cold'):
+                for name in os.listdir(root):
+                    if os.path.exists(os.path.join(root, name, trends.SUMMARY)):
+                        os.remove(os.path.join(root, name, trends.SUMMARY))
+            if label == 'one new night':
+                night(nights)
+            (summaries, computed), elapsed = _timed(trends.collect, root, processes)
+            print "%-16s %s runs, %s summarized, %.2f seconds" % (label + ':', len(summaries), computed, elapsed)
+        assert summaries[-1]['bugs'] == len(records) and summaries[-2]['bugs'] == len(records) * nights // (nights + 1)
+    finally:
+        shutil.rmtree(root)
+
+def bench_timetofix(options):
+    """Median days to fix of 100k bugs: numpy over the records' timestamps, against parsing 'dd-mm-yyyy' strings"""
+    from datetime import datetime
+    import numpy
+    import bugseeker
+    records = _synthetic_records(options.bugs * 1000 // 3, random.Random(1))
+    # The same dates as the records kept them before, formatted when the bug was hydrated
+    formatted = [(bugseeker.format_date(bug.date_created), bugseeker.format_date(bug.date_fix_committed)) for bug in records]
+    def timestamps():
+        fixed = numpy.fromiter((bug.date_fix_committed for bug in records), dtype=numpy.int64, count=len(records))
+        created = numpy.fromiter((bug.date_created for bug in records), dtype=numpy.int64, count=len(records))
+        return numpy.median((fixed // 86400 - created // 86400))
+    def strings():
+        days = []
+        for created, fixed in formatted:
+            if fixed != 'N/A':
+                days.append((datetime.strptime(fixed, "%d-%m-%Y") - datetime.strptime(created, "%d-%m-%Y")).days)
+        days.sort()
+        middle = len(days) // 2
+        return (days[middle] + days[~middle]) / 2.0
+    median, timestamp_time = _timed(timestamps)
+    string_median, string_time = _timed(strings)
+    assert median == string_median
+    print "median of %s bugs: %s days; timestamps %.1f ms, parsing strings %.1f ms" % (
+        len(records), median, timestamp_time * 1000, string_time * 1000)
+
+def bench_timeseries(options):
+    """Weekly and daily backlog, inflow/outflow and rolling time to fix over a decade of bugs"""
+    from datetime import date, datetime
+    import timeseries
+    rnd = random.Random(1)
+    count = options.bugs * 1000
+    first = date(2005, 1, 1).toordinal()
+    created, committed, released = [], [], []
+    for i in range(count):
+        day = first + rnd.randint(0, 3652)
+        created.append(date.fromordinal(day).strftime("%d-%m-%Y"))
+        fix = day + int(rnd.expovariate(1 / 60.0))
+        fixed = rnd.random() < 0.8 and fix <= first + 3652
+        committed.append(date.fromordinal(fix).strftime("%d-%m-%Y") if fixed and rnd.random() < 0.7 else 'N/A')
+        released.append(date.fromordinal(fix + 14).strftime("%d-%m-%Y") if fixed and committed[-1] == 'N/A' else 'N/A')
+    def loops(start, step, window=4):
+        # The same numbers with dictionaries and sorted lists
+        parsed = {}
+        def day_number(value):
+            if value not in parsed:
+                parsed[value] = datetime.strptime(value, "%d-%m-%Y").toordinal() - timeseries.EPOCH.toordinal()
+            return parsed[value]
+        inflow, outflow, fixes = {}, {}, {}
+        for c, fc, fr in zip(created, committed, released):
+            day = day_number(c)
+            inflow[(day - start) // step] = inflow.get((day - start) // step, 0) + 1
+            fix = fc if fc != 'N/A' else fr
+            if fix != 'N/A':
+                fix_day = max(day_number(fix), day)
+                outflow[(fix_day - start) // step] = outflow.get((fix_day - start) // step, 0) + 1
+                fixes.setdefault((fix_day - start) // step, []).append(fix_day - day)
+        bins = max(max(inflow), max(outflow)) + 1
+        backlog, open_bugs, medians = [], 0, []
+        for i in range(bins):
+            open_bugs += inflow.get(i, 0) - outflow.get(i, 0)
+            backlog.append(open_bugs)
+            window_days = sorted(d for b in range(max(i - window + 1, 0), i + 1) for d in fixes.get(b, []))
+            medians.append(window_days[len(window_days) // 2] if window_days else None)
+        return backlog
+    for step in ('week', 'day'):
+        def vectorized():
+            series = timeseries.from_columns(created, committed, released, timeseries.STEPS[step])
+            series.time_to_fix()
+            return series
+        series, numpy_time = _timed(vectorized)
+        if step == 'week':
+            backlog, loop_time = _timed(loops, series.start, series.step)
+            assert series.backlog.tolist() == backlog
+            print "%s bugs over %s %ss: numpy %.2f s, python loops %.2f s" % (count, series.bins, step, numpy_time, loop_time)
+        else:
+            print "%s bugs over %s %ss: numpy %.2f s" % (count, series.bins, step, numpy_time)
+
+def _deep_size(obj, seen):
+    """Bytes held by obj and everything it references that is not in seen yet"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_size(key, seen) + _deep_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += _deep_size(item, seen)
+    elif hasattr(obj, '__dict__'):
+        size += _deep_size(obj.__dict__, seen)
+    elif hasattr(obj, '__slots__'):
+        for name in obj.__slots__:
+            size += _deep_size(getattr(obj, name, None), seen)
+    return size
+
+def bench_records(options):
+    """Memory per bug of the hydrated Bug objects against the compact BugRecords kept for the report"""
+    import bugseeker
+    import lpimmutable
+    rnd = random.Random(1)
+    people = [{'name': u'person%s' % i} for i in range(200)]
+    milestones = [{'title': u'OpenStack Compute %s' % m} for m in ('diablo-1', 'diablo-2', 'diablo-3', 'essex-1')]
+    paths = [u'nova/%s/%s.py' % (d, f) for d in ('compute', 'network', 'api/openstack', 'tests', 'virt/libvirt') for f in range(30)]
+    parts_list = []
+    for i in range(options.bugs):
+        files = rnd.sample(paths, rnd.randint(0, 6))
+        parts_list.append({
+            'task': {'self_link': u'https://api.launchpad.net/1.0/nova/+bug/%s' % i, 'status': u'Fix Released',
+                     'importance': rnd.choice([u'High', u'Medium', u'Low']),
+                     'date_created': u'2011-%02d-%02dT10:00:00.000000+00:00' % (rnd.randint(1, 12), rnd.randint(1, 28)),
+                     'date_fix_committed': u'2011-06-03T10:00:00.000000+00:00', 'date_fix_released': None},
+            'bug': {'id': 700000 + i, 'title': u'Bug title number %s' % i, 'users_affected_count': 1},
+            'owner': rnd.choice(people), 'assignee': rnd.choice(people), 'milestone': rnd.choice(milestones),
+            'users': [rnd.choice(people)], 'branches': [{}],
+            'proposals': [(lpimmutable.proposal_record(u'https://api.launchpad.net/1.0/~dev/nova/fix-%s/+merge/1' % i,
+                                                       u'Merged', 1000 + i, 1307008800, None),
+                           lpimmutable.preview_record(u'https://api.launchpad.net/1.0/~dev/nova/fix-%s/+merge/1/+preview-diff/1' % i,
+                                                      dict((path, [rnd.randint(0, 50), rnd.randint(0, 50)]) for path in files)))]})
+    # Every bug gets its own copies of the strings, as when decoded from separate responses
+    parts_list = json.loads(json.dumps(parts_list))
+    bugs = [bugseeker.Bug.from_json(parts) for parts in parts_list]
+    records = [bug.record() for bug in bugs]
+    del parts_list
+    before = _deep_size(bugs, set())
+    after = _deep_size(records, set())
+    print "%s bugs: Bug %.0f bytes each, BugRecord %.0f bytes each (%.1fx smaller)" % (
+        len(bugs), before / float(len(bugs)), after / float(len(records)), before / float(after))
+
+def _records_for_rows(rows, rnd):
+    """Synthetic BugRecords filling about rows spreadsheet rows (a bug with several files takes one row more per file)"""
+    records = []
+    filled = 0
+    while filled < rows:
+        batch = _synthetic_records(1000, rnd)
+        for record in batch:
+            records.append(record)
+            files = len(record.files_modified)
+            filled += 1 + (files if files > 1 else 0)
+            if filled >= rows:
+                break
+    return records, filled
+
+def _in_child(func):
+    """Run func in a forked process; returns its result (JSON) and the peak RSS in MB the process reached"""
+    import resource
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = func()
+            result['peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+            os.write(write_end, json.dumps(result))
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    data = ''.join(iter(lambda: os.read(read_end, 65536), ''))
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+def bench_xlsx(options):
+    """Writing the bug report with xlwt against the streaming xlsx writer: time and peak RSS. xlwt stops
+    at 65,536 rows, so it is compared at 60k rows and the xlsx writer alone goes on to 500k."""
+    import bugseeker
+    import resource
+    directory = tempfile.mkdtemp()
+    def write(report_class, rows):
+        def run():
+            records, filled = _records_for_rows(rows, random.Random(6))
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+            report = report_class([])
+            path = os.path.join(directory, 'BugReport_nova' + report.extension)
+            start = time.time()
+            report.create_spreadsheet(path, 'nova', len(records), [], records)
+            report.close()
+            return {'rows': filled, 'bugs': len(records), 'seconds': time.time() - start, 'baseline_mb': baseline,
+                    'bytes': os.path.getsize(path), 'path': path}
+        return _in_child(run)
+    try:
+        for label, report_class, rows in (('xlwt', bugseeker.Report, 60000), ('xlsx', bugseeker.XlsxReport, 60000),
+                                          ('xlsx', bugseeker.XlsxReport, 500000)):
+            result = write(report_class, rows)
+            print "%s, %s rows (%s bugs): %.1f s, peak RSS %.0f MB (%.0f MB over the records), file %.1f MB" % (
+                label, result['rows'], result['bugs'], result['seconds'], result['peak_mb'],
+                result['peak_mb'] - result['baseline_mb'], result['bytes'] / (1024.0 * 1024.0))
+        try:
+            import xlrd
+        except ImportError:
+            return
+        sheet = xlrd.open_workbook(result['path']).sheet_by_index(0)
+        assert sheet.nrows == result['rows'] + 3 and sheet.cell_value(3, 1) == 100000
+        _check_xlsx_escaping(os.path.join(directory, 'escaping.xlsx'))
+    finally:
+        shutil.rmtree(directory)
+
+def _check_xlsx_escaping(path):
+    """Sheet names and hyperlink targets with '&' and '<' read back as written"""
+    import zipfile
+    from xml.etree import ElementTree
+    import xlrd
+    import xlsxstream
+    name, url = u'R&D <nova>', u'https://bugs.launchpad.net/nova/+bugs?field.status=New&orderby=-id'
+    writer = xlsxstream.XlsxWriter(path)
+    writer.add_sheet(name, {0: 20}, 0).write_row([(xlsxstream.Hyperlink(url, u'New & open'), xlsxstream.LINK)])
+    writer.close()
+    sheet = xlrd.open_workbook(path).sheet_by_index(0)
+    assert sheet.name == name and sheet.cell_value(0, 0) == u'New & open'
+    book = zipfile.ZipFile(path)
+    rels = ElementTree.fromstring(book.read('xl/worksheets/_rels/sheet1.xml.rels'))
+    assert [rel.get('Target') for rel in rels] == [url], [rel.get('Target') for rel in rels]
+    book.close()
+
+def bench_export(options):
+    """Exporting 100k bugs as csv, tsv and jsonl, plain and gzipped, against the xlsx spreadsheet; then
+    how soon the export of a hydration in progress has its first bugs on disk"""
+    import bugseeker
+    import csv
+    import gzip
+    import lpasync
+    import lpexport
+    rnd = random.Random(8)
+    records = _synthetic_records(100000, rnd)
+    # A title and paths needing every kind of escaping
+    tricky = dict(records[0].to_record(), title=u'Crash, "quoted"\ttab\nnew line \u00e9',
+                  files_modified=[u'nova/a;b.py', u'nova/"c",\td.py', u'nova/caf\u00e9.py'], lines_added=[1, 2, 3],
+                  lines_removed=[4, 5, 6])
+    records[0] = bugseeker.BugRecord.from_record(tricky)
+    directory = tempfile.mkdtemp()
+    try:
+        for fmt in lpexport.FORMATS:
+            for compress in (False, True):
+                path = os.path.join(directory, lpexport.export_name('bugs', fmt, compress))
+                start = time.time()
+                exporter = lpexport.Exporter(path, fmt, compress)
+                exporter.write_many(records)
+                exporter.close()
+                print "%-10s %s bugs: %.2f s, %.1f MB" % (os.path.basename(path)[5:], exporter.count, time.time() - start,
+                                                      os.path.getsize(path) / (1024.0 * 1024.0))
+                if fmt != 'jsonl':
+                    f = gzip.open(path, 'rb') if compress else open(path, 'rb')
+                    rows = list(csv.reader(f, dialect='excel-tab' if fmt == 'tsv' else 'excel'))
+                    f.close()
+                    assert len(rows) == len(records) + 1 and rows[1][1].decode('utf-8') == tricky['title']
+                    files = lpexport.COLUMNS.index('files_modified')
+                    assert [json.loads(field.decode('utf-8')) for field in rows[1][files:files + 3]] == [
+                        tricky['files_modified'], tricky['lines_added'], tricky['lines_removed']]
+        report = bugseeker.XlsxReport([], bugseeker.NORMALIZED)
+        start = time.time()
+        report.create_spreadsheet(os.path.join(directory, 'bugs.xlsx'), 'nova', len(records), [], records)
+        report.close()
+        print "xlsx       %s bugs: %.2f s (normalized layout)" % (len(records), time.time() - start)
+
+        server = StandInServer(latency=0.05, handler=FakeLaunchpadHandler, tasks=options.bugs)
+        try:
+            first_page = json.loads(httplib_get(server.url('/1.0/nova/tasks')))
+            path = os.path.join(directory, 'hydrated.csv')
+            exporter = lpexport.Exporter(path, 'csv')
+            first = []
+            start = time.time()
+            def progress(bug_obj):
+                exporter.write(bug_obj)
+                if not first and os.path.getsize(path) > 0:
+                    first.append(time.time() - start)
+            client = lpasync.AsyncClient(50)
+            hydrated = lpasync.hydrate(client, first_page, lambda parts: bugseeker.Bug.from_json(parts).record(), progress)
+            client.close()
+            exporter.close()
+            print "hydrating %s bugs: first bug in the export after %.2f s, all %s after %.2f s" % (
+                len(hydrated), first[0], exporter.count, time.time() - start)
+        finally:
+            server.stop()
+    finally:
+        shutil.rmtree(directory)
+
+def bench_columns(options):
+    """A columnar store of nightly runs: appending a run, then opening the whole store and
+    summarizing every run from it (in a fresh process, for its peak RSS), against loading the
+    runs' .jsonl data files"""
+    import bugseeker
+    import lpcolumns
+    import timeseries
+    import trends
+    runs, bugs = 40, 50000
+    records = _synthetic_records(bugs, random.Random(9))
+    directory = tempfile.mkdtemp()
+    try:
+        store = lpcolumns.ColumnStore(os.path.join(directory, 'columns'))
+        appended = []
+        for n in range(runs):
+            # Each night the same bugs again, as a report listing every fixed bug does
+            appended.append(_timed(store.append, 'run%03d' % n, 'nova', records)[1])
+        size = sum(os.path.getsize(os.path.join(dirpath, name)) for dirpath, dirnames, names in os.walk(store.root) for name in names)
+        print "appended %s runs of %s bugs: %.2f s per run, %s bug rows and %s file rows in %.0f MB" % (
+            runs, bugs, sum(appended) / runs, store.rows('bugs'), store.rows('files'), size / (1024.0 * 1024.0))
+        def analyse():
+            import numpy
+            import resource
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+            start = time.time()
+            store = lpcolumns.ColumnStore(os.path.join(directory, 'columns'))
+            opened = time.time() - start
+            statuses = numpy.bincount(store.column('bugs', 'status'))
+            counted = time.time() - start
+            summaries = [trends.summarize_columns(store, entry['run']) for entry in store.runs()]
+            assert summaries[-1]['bugs'] == bugs and statuses.sum() == runs * bugs
+            return {'opened': opened, 'counted': counted, 'summarized': time.time() - start, 'baseline_mb': baseline}
+        result = _in_child(analyse)
+        print "open the store %.4f s, bugs by status over all %s rows %.2f s, summaries of all %s runs %.2f s, RSS +%.0f MB" % (
+            result['opened'], runs * bugs, result['counted'], runs, result['summarized'], result['peak_mb'] - result['baseline_mb'])
+        data_file = os.path.join(directory, 'BugReport_nova.jsonl')
+        bugseeker.write_data_file(data_file, records)
+        def load():
+            import resource
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+            records, seconds = _timed(timeseries.load_records, [data_file])
+            return {'seconds': seconds, 'baseline_mb': baseline}
+        result = _in_child(load)
+        print "loading one run's .jsonl data file: %.2f s (%s runs: about %.0f s), RSS +%.0f MB" % (
+            result['seconds'], runs, result['seconds'] * runs, result['peak_mb'] - result['baseline_mb'])
+    finally:
+        shutil.rmtree(directory)
+
+def _read_columns(path):
+    """Read a report the way make_report.py does: the bug columns of the first sheet and the files
+    and lines, from the files sheet when there is one"""
+    import xlrd
+    workbook = xlrd.open_workbook(path)
+    sheet = workbook.sheet_by_index(0)
+    columns = [sheet.col_values(col) for col in (0, 3, 4, 5, 6, 7, 8, 9, 10)]
+    if workbook.nsheets > 1 and workbook.sheet_by_index(1).name == sheet.name + ' files':
+        sheet = workbook.sheet_by_index(1)
+        columns += [sheet.col_values(1), sheet.col_values(2)]
+    else:
+        columns += [sheet.col_values(17), sheet.col_values(18)]
+    return columns
+
+def bench_layout(options):
+    """Bugs with their files on blank-padded rows against the normalized layout (files on a second
+    sheet keyed by bug id): write time, file size, cells and make_report's parse time"""
+    import bugseeker
+    import xlrd
+    records, filled = _records_for_rows(60000, random.Random(6))
+    directory = tempfile.mkdtemp()
+    try:
+        for report_class in (bugseeker.Report, bugseeker.XlsxReport):
+            for layout in (bugseeker.PADDED, bugseeker.NORMALIZED):
+                report = report_class([], layout)
+                path = os.path.join(directory, layout + report.extension)
+                start = time.time()
+                report.create_spreadsheet(path, 'nova', len(records), [], records)
+                report.close()
+                written = time.time() - start
+                columns, parsed = _timed(_read_columns, path)
+                workbook = xlrd.open_workbook(path, ragged_rows=True)
+                cells = sum(sheet.row_len(row) for sheet in workbook.sheets() for row in range(sheet.nrows))
+                print "%-4s %-10s %s bugs: write %.1f s, %.1f MB, %s cells, parse %.1f s" % (
+                    report.extension[1:], layout, len(records), written, os.path.getsize(path) / (1024.0 * 1024.0), cells, parsed)
+    finally:
+        shutil.rmtree(directory)
+
+def bench_bugdb(options):
+    """Filters over a year of bugs in the local bug database, against scanning the records in memory"""
+    import bugseeker
+    import bugdb
+    rnd = random.Random(7)
+    statuses = sorted(set(bugseeker.STATUS_MAP.values()))
+    importances = sorted(set(bugseeker.IMP_MAP.values()))
+    people = [u'person%s' % i for i in range(500)]
+    records = []
+    for bug in _synthetic_records(options.bugs * 300, rnd):
+        record = bug.to_record()
+        record.update(status=rnd.choice(statuses), importance=rnd.choice(importances), owner=rnd.choice(people),
+                      fixed_by=rnd.choice(people), users_affected=u','.join(rnd.sample(people, rnd.randint(1, 4))))
+        records.append(bugseeker.BugRecord.from_record(record))
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'bugs.sqlite')
+        database = bugdb.BugDatabase(path)
+        elapsed = _timed(database.add_bugs, 'nova', records)[1]
+        print "loaded %s bugs in %.1f seconds, %.1f MB" % (len(records), elapsed, os.path.getsize(path) / (1024.0 * 1024.0))
+        since = records[len(records) // 2].date_created
+        queries = [
+            ('status and importance', {'statuses': [u'Fix Committed'], 'importances': [u'Critical']},
+             lambda bug: bug.status == u'Fix Committed' and bug.importance == u'Critical'),
+            ('milestone', {'milestones': [u'essex-2']}, lambda bug: bug.milestone == u'essex-2'),
+            ('assignee', {'assignee': u'person7'}, lambda bug: bug.fixed_by == u'person7'),
+            ('affecting', {'affecting': u'person7'}, lambda bug: u'person7' in bug.users_affected.split(',')),
+            ('file prefix', {'path_prefix': u'nova/scheduler/'},
+             lambda bug: any(f.startswith(u'nova/scheduler/') for f in bug.files_modified)),
+            # --file '': every path starts with the empty prefix, so it filters nothing
+            ('empty file prefix', {'path_prefix': u'', 'milestones': [u'essex-2']}, lambda bug: bug.milestone == u'essex-2'),
+            ('created since', {'since': since, 'importances': [u'High']},
+             lambda bug: bug.date_created >= since and bug.importance == u'High'),
+        ]
+        for name, filters, match in queries:
+            counted, count_time = _timed(database.count, **filters)
+            found, query_time = _timed(database.query, **filters)
+            scanned, scan_time = _timed(lambda: [bug.id for bug in records if match(bug)])
+            assert [record['id'] for record in found] == scanned and counted == len(scanned)
+            print "%-22s %6s bugs: count %6.1f ms, query with files %6.1f ms, scanning records in memory %6.1f ms" % (
+                name, len(found), count_time * 1000, query_time * 1000, scan_time * 1000)
+        database.close()
+    finally:
+        shutil.rmtree(directory)
+
+def bench_report(options):
+    """make_report.py end to end on a report in which a third of the bugs have no diff (their files
+    and lines cells read 'N/A'), for each spreadsheet format and layout"""
+    import subprocess
+    import bugseeker
+    import lpmanifest
+    records = []
+    for i, bug in enumerate(_synthetic_records(options.bugs * 10, random.Random(8))):
+        if i % 3 == 0:
+            record = bug.to_record()
+            record.update(files_modified=[], lines_added=[], lines_removed=[], num_files_modified='N/A', merged_revno='N/A')
+            bug = bugseeker.BugRecord.from_record(record)
+        records.append(bug)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'make_report.py')
+    images = tempfile.mkdtemp()
+    open(os.path.join(images, 'vertex_ntt.png'), 'wb').write('png')
+    for report_class in (bugseeker.Report, bugseeker.XlsxReport):
+        for layout in (bugseeker.PADDED, bugseeker.NORMALIZED):
+            root = tempfile.mkdtemp()
+            try:
+                report = report_class([], layout)
+                name = 'BugReport_nova' + report.extension
+                os.mkdir(os.path.join(root, 'run'))
+                report.create_spreadsheet(os.path.join(root, 'run', name), 'nova', len(records), [], records)
+                report.close()
+                manifest = lpmanifest.Manifest(root)
+                manifest.record('run', lpmanifest.BUGSEEKER, 'run', [name])
+                manifest.close()
+                start = time.time()
+                child = subprocess.Popen([sys.executable, script, '--reports-root', root, '--images-dir', images, '--gzip-level', '0'],
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                output = child.communicate()[0]
+                elapsed = time.time() - start
+                if child.returncode != 0:
+                    sys.exit("make_report.py failed on the %s %s report:\n%s" % (report.extension[1:], layout, output))
+                assert os.path.exists(os.path.join(root, 'run', 'dirs_count.html'))
+                print "%-4s %-10s %s bugs (%s without a diff): make_report %.1f s" % (
+                    report.extension[1:], layout, len(records), len(records[::3]), elapsed)
+            finally:
+                shutil.rmtree(root)
+    shutil.rmtree(images)
+
+def httplib_get(url):
+    import urllib2
+    return urllib2.urlopen(url).read()
+
+BENCHMARKS = {
+    'artifacts': bench_artifacts,
+    'async': bench_async,
+    'branches': bench_branches,
+    'bugdb': bench_bugdb,
+    'columns': bench_columns,
+    'pipeline': bench_pipeline,
+    'cache': bench_cache,
+    'dedup': bench_dedup,
+    'diffstore': bench_diffstore,
+    'export': bench_export,
+    'immutable': bench_immutable,
+    'layout': bench_layout,
+    'manifest': bench_manifest,
+    'pathtrie': bench_pathtrie,
+    'pool': bench_pool,
+    'precompress': bench_precompress,
+    'projects': bench_projects,
+    'records': bench_records,
+    'report': bench_report,
+    'scheduler': bench_scheduler,
+    'timetofix': bench_timetofix,
+    'timeseries': bench_timeseries,
+    'trends': bench_trends,
+    'xlsx': bench_xlsx,
+}
+
+def main():
+    usage = "usage: %prog benchmark [options]\nbenchmarks: " + ', '.join(sorted(BENCHMARKS.keys()))
+    parser = OptionParser(usage=usage)
+    parser.add_option("--tables", help="Number of HTML tables to generate. Default: 20", dest="tables", type="int", default=20)
+    parser.add_option("--rows", help="Rows per generated table. Default: 5000", dest="rows", type="int", default=5000)
+    parser.add_option("--requests", help="Number of requests sent to the local stand-in server. Default: 2000", dest="requests", type="int", default=2000)
+    parser.add_option("--bugs", help="Number of bugs served by the fake Launchpad. Default: 300", dest="bugs", type="int", default=300)
+    parser.add_option("--brotli", help="Include brotli output", dest="brotli", action="store_true", default=False)
+    parser.add_option("-j", "--jobs", help="Worker processes/threads. Default: one per CPU", dest="jobs", type="int", default=None)
+    (options, args) = parser.parse_args()
+    if len(args) != 1 or args[0] not in BENCHMARKS:
+        sys.exit(parser.print_usage())
+    BENCHMARKS[args[0]](options)
+
+if __name__ == '__main__':
+    main()
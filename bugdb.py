@@ -0,0 +1,309 @@
+"""Local SQLite database of hydrated bugs for ad-hoc queries
+
+Every -s/-i variation of bugseeker.py queries Launchpad again for bugs an
+earlier run already hydrated. bugseeker.py --bug-db adds the bugs of a run
+(best a broad one, -s all) to an SQLite database kept between runs:
+
+    bugs      one row per project and bug: every field of the report
+    people    owners, assignees and affected users, by name
+    affected  the users each bug affects
+    files     the files each bug's merge modified, with lines added and removed
+
+with indexes on status (with importance), importance, milestone, owner, assignee, the dates and
+file paths. The query subcommand then filters locally, with bugseeker's
+status and importance codes, in milliseconds, and prints the bugs or writes
+them out as a spreadsheet (.xls, .xlsx) or an export (.csv, .tsv, .jsonl).
+Existing .jsonl data files can be loaded too.
+
+Usage: python bugdb.py <db> query [-s fc,fr] [-i h] [--milestone M] [--owner NAME] [--assignee NAME]
+                                  [--affecting NAME] [--file PATH/] [--date created --since YYYY-MM-DD]
+                                  [--project P] [-o bugs.xlsx|.xls|.csv|.tsv|.jsonl]
+       python bugdb.py <db> load <project> <BugReport_project_date.jsonl> [...]
+
+Dependent Packages: sqlite3 (standard library); bugseeker (this repository) for the query and load commands
+"""
+
+from optparse import OptionParser
+import calendar
+import os
+import sqlite3
+import sys
+import time
+
+import diffstore
+
+WITHOUT_ROWID = diffstore.WITHOUT_ROWID
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS people (
+    person_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS bugs (
+    project TEXT NOT NULL,
+    bug_id INTEGER NOT NULL,
+    title TEXT,
+    status TEXT,
+    importance TEXT,
+    milestone TEXT,
+    owner_id INTEGER REFERENCES people,
+    assignee_id INTEGER REFERENCES people,
+    date_created INTEGER,
+    date_fix_committed INTEGER,
+    date_fix_released INTEGER,
+    date_merged INTEGER,
+    users_affected_count INTEGER,
+    users_affected TEXT,
+    merged_revno,
+    has_multiple_branches TEXT,
+    number_of_branches INTEGER,
+    num_files_modified,
+    preview_diff_link TEXT,
+    task_link TEXT,
+    run TEXT,
+    PRIMARY KEY (project, bug_id)
+);
+CREATE INDEX IF NOT EXISTS bugs_status_importance ON bugs (status, importance);
+CREATE INDEX IF NOT EXISTS bugs_importance ON bugs (importance);
+CREATE INDEX IF NOT EXISTS bugs_milestone ON bugs (milestone);
+CREATE INDEX IF NOT EXISTS bugs_owner ON bugs (owner_id);
+CREATE INDEX IF NOT EXISTS bugs_assignee ON bugs (assignee_id);
+CREATE INDEX IF NOT EXISTS bugs_date_created ON bugs (date_created);
+CREATE INDEX IF NOT EXISTS bugs_date_fix_committed ON bugs (date_fix_committed);
+CREATE INDEX IF NOT EXISTS bugs_date_fix_released ON bugs (date_fix_released);
+CREATE INDEX IF NOT EXISTS bugs_date_merged ON bugs (date_merged);
+CREATE TABLE IF NOT EXISTS affected (
+    project TEXT NOT NULL,
+    bug_id INTEGER NOT NULL,
+    person_id INTEGER NOT NULL REFERENCES people,
+    PRIMARY KEY (project, bug_id, person_id)
+)%(without_rowid)s;
+CREATE INDEX IF NOT EXISTS affected_person ON affected (person_id);
+CREATE TABLE IF NOT EXISTS files (
+    project TEXT NOT NULL,
+    bug_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    added INTEGER NOT NULL,
+    removed INTEGER NOT NULL,
+    PRIMARY KEY (project, bug_id, position)
+)%(without_rowid)s;
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+''' % {'without_rowid': WITHOUT_ROWID}
+
+# --date values: the bugs column each names
+DATES = {'created': 'date_created', 'committed': 'date_fix_committed', 'released': 'date_fix_released',
+         'merged': 'date_merged'}
+
+BUG_COLUMNS = ('project', 'bug_id', 'title', 'status', 'importance', 'milestone', 'date_created', 'date_fix_committed',
+               'date_fix_released', 'date_merged', 'users_affected_count', 'users_affected', 'merged_revno',
+               'has_multiple_branches', 'number_of_branches', 'num_files_modified', 'preview_diff_link', 'task_link')
+
+def day(value):
+    """'yyyy-mm-dd' to seconds since the epoch (UTC), as the bug records keep dates"""
+    return calendar.timegm(time.strptime(value, '%Y-%m-%d'))
+
+class BugDatabase(object):
+    """The bug database at path, created on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self._people = {}
+
+    def close(self):
+        self.db.close()
+
+    def _person(self, name):
+        """The person_id of name, added to people the first time"""
+        if name is None:
+            return None
+        person_id = self._people.get(name)
+        if person_id is None:
+            self.db.execute('INSERT OR IGNORE INTO people (name) VALUES (?)', (name,))
+            person_id = self.db.execute('SELECT person_id FROM people WHERE name = ?', (name,)).fetchone()[0]
+            self._people[name] = person_id
+        return person_id
+
+    def add_bugs(self, project, bugs, run=None):
+        """Add bugs (BugRecords) of project, replacing what an earlier run stored for them"""
+        db = self.db
+        with db:
+            for bug in bugs:
+                key = (project, bug.id)
+                db.execute('INSERT OR REPLACE INTO bugs VALUES (%s)' % ', '.join(['?'] * 21), (
+                    project, bug.id, bug.title, bug.status, bug.importance, bug.milestone,
+                    self._person(bug.owner), self._person(bug.fixed_by), bug.date_created, bug.date_fix_committed,
+                    bug.date_fix_released, bug.date_merged, bug.users_affected_count, bug.users_affected,
+                    bug.merged_revno, bug.has_multiple_branches, bug.number_of_branches, bug.num_files_modified,
+                    bug.preview_diff_link, bug.task_link, run))
+                db.execute('DELETE FROM affected WHERE project = ? AND bug_id = ?', key)
+                db.execute('DELETE FROM files WHERE project = ? AND bug_id = ?', key)
+                names = set(name for name in (bug.users_affected or '').split(',') if name)
+                db.executemany('INSERT INTO affected VALUES (?, ?, ?)', [key + (self._person(name),) for name in names])
+                db.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                               [key + (position, path, added, removed)
+                                for position, (path, added, removed) in enumerate(bug.modifications())])
+
+    def _where(self, statuses=(), importances=(), milestones=(), project=None, owner=None, assignee=None,
+               affecting=None, path_prefix=None, date='created', since=None, until=None):
+        """The WHERE clause over bugs b selecting the filters given, and its arguments"""
+        clauses, args = [], []
+        for column, values in (('b.status', statuses), ('b.importance', importances), ('b.milestone', milestones)):
+            if values:
+                clauses.append('%s IN (%s)' % (column, ', '.join(['?'] * len(values))))
+                args.extend(values)
+        if project is not None:
+            clauses.append('b.project = ?')
+            args.append(project)
+        # Each filter below is a lookup in its own index: the people by name, then the bugs by
+        # owner_id or assignee_id, or the affected and files rows first
+        if owner is not None:
+            clauses.append('b.owner_id = (SELECT person_id FROM people WHERE name = ?)')
+            args.append(owner)
+        if assignee is not None:
+            clauses.append('b.assignee_id = (SELECT person_id FROM people WHERE name = ?)')
+            args.append(assignee)
+        if affecting is not None:
+            clauses.append('b.rowid IN (SELECT y.rowid FROM affected x JOIN bugs y ON y.project = x.project AND y.bug_id = x.bug_id '
+                           'WHERE x.person_id = (SELECT person_id FROM people WHERE name = ?))')
+            args.append(affecting)
+        # An empty prefix matches every path: no filter, rather than only bugs with a diff
+        if path_prefix:
+            low, high = diffstore.prefix_range(path_prefix)
+            clauses.append('b.rowid IN (SELECT y.rowid FROM files f JOIN bugs y ON y.project = f.project AND y.bug_id = f.bug_id '
+                           'WHERE f.path >= ? AND f.path < ?)')
+            args.extend([low, high])
+        if since is not None:
+            clauses.append('b.%s >= ?' % DATES[date])
+            args.append(since)
+        if until is not None:
+            clauses.append('b.%s < ?' % DATES[date])
+            args.append(until)
+        return ' AND '.join(clauses) or '1', args
+
+    def query(self, **filters):
+        """The bugs matching every filter given (see _where), ordered by project and id, as dicts of
+        BugRecord.to_record() fields plus their 'project'"""
+        where, args = self._where(**filters)
+        select = ('FROM bugs b LEFT JOIN people o ON o.person_id = b.owner_id '
+                  'LEFT JOIN people a ON a.person_id = b.assignee_id WHERE ' + where)
+        records = []
+        by_key = {}
+        for row in self.db.execute('SELECT %s, o.name, a.name %s ORDER BY b.project, b.bug_id' % (
+                ', '.join('b.' + column for column in BUG_COLUMNS), select), args):
+            record = dict(zip(BUG_COLUMNS, row))
+            record['id'] = record.pop('bug_id')
+            record['owner'], record['fixed_by'] = row[-2:]
+            record['files_modified'], record['lines_added'], record['lines_removed'] = [], [], []
+            records.append(record)
+            by_key[(record['project'], record['id'])] = record
+        if records:
+            for project, bug_id, path, added, removed in self.db.execute(
+                    'SELECT f.project, f.bug_id, f.path, f.added, f.removed FROM bugs b JOIN files f '
+                    'ON f.project = b.project AND f.bug_id = b.bug_id WHERE %s ORDER BY f.project, f.bug_id, f.position' % where, args):
+                record = by_key[(project, bug_id)]
+                record['files_modified'].append(path)
+                record['lines_added'].append(added)
+                record['lines_removed'].append(removed)
+        return records
+
+    def count(self, **filters):
+        """The number of bugs matching every filter given (see _where)"""
+        where, args = self._where(**filters)
+        return self.db.execute('SELECT COUNT(*) FROM bugs b WHERE ' + where, args).fetchone()[0]
+
+def write(path, records, statuses=()):
+    """Write query results to path: a spreadsheet (one sheet per project) for .xls and .xlsx,
+    an lpexport export for .csv, .tsv and .jsonl (optionally .gz)"""
+    import bugseeker
+    import lpexport
+    projects = []
+    bugs = {}
+    for record in records:
+        record = dict(record)
+        project = record.pop('project')
+        if project not in bugs:
+            projects.append(project)
+            bugs[project] = []
+        bugs[project].append(bugseeker.BugRecord.from_record(record))
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1][1:]
+    if extension in ('xls', 'xlsx'):
+        report = (bugseeker.XlsxReport if extension == 'xlsx' else bugseeker.Report)([])
+        for project in projects:
+            report.create_spreadsheet(path, project, len(bugs[project]), list(statuses), bugs[project])
+        report.close()
+    elif extension in lpexport.FORMATS:
+        exporter = lpexport.Exporter(path, extension, path.endswith('.gz'))
+        for project in projects:
+            exporter.write_many(bugs[project])
+        exporter.close()
+    else:
+        raise ValueError("cannot write %s: not .xls, .xlsx, .csv, .tsv or .jsonl" % path)
+
+def main():
+    usage = "usage: %prog db query [options]\n       %prog db load project data.jsonl [data.jsonl ...]"
+    parser = OptionParser(usage=usage)
+    parser.add_option("-s", "--status", help="Bug status or list of comma separated values, as for bugseeker.py. Default: all", dest="status", default="all")
+    parser.add_option("-i", "--imp", help="Bug importance or list of comma separated values, as for bugseeker.py. Default: all", dest="imp", default="all")
+    parser.add_option("-m", "--milestone", help="Milestone title or comma separated list", dest="milestone", default=None)
+    parser.add_option("-p", "--project", help="Only bugs of this project", dest="project", default=None)
+    parser.add_option("--owner", help="Only bugs reported by this person (Launchpad name)", dest="owner", default=None)
+    parser.add_option("--assignee", help="Only bugs assigned to this person (Launchpad name, or Unassigned)", dest="assignee", default=None)
+    parser.add_option("--affecting", help="Only bugs affecting this person (Launchpad name)", dest="affecting", default=None)
+    parser.add_option("--file", help="Only bugs whose fix modified this file or a file under this directory/", dest="path", default=None)
+    parser.add_option("--date", help="Date --since and --until apply to: created, committed, released or merged. Default: created", dest="date", type="choice", choices=sorted(DATES), default='created')
+    parser.add_option("--since", help="Only bugs with that date on or after YYYY-MM-DD", dest="since", default=None)
+    parser.add_option("--until", help="Only bugs with that date before YYYY-MM-DD", dest="until", default=None)
+    parser.add_option("-o", "--output", help="Write the bugs to a .xls, .xlsx, .csv, .tsv or .jsonl file instead of listing them", dest="output", default=None)
+    (options, args) = parser.parse_args()
+    if len(args) < 2 or args[1] not in ('query', 'load') or (args[1] == 'query') != (len(args) == 2) or (args[1] == 'load' and len(args) < 4):
+        sys.exit(parser.print_usage())
+    import bugseeker
+    database = BugDatabase(args[0])
+    start = time.time()
+    if args[1] == 'load':
+        import timeseries
+        loaded = 0
+        for path in args[3:]:
+            records = [bugseeker.BugRecord.from_record(record) for record in timeseries.load_records([path])]
+            database.add_bugs(args[2], records, os.path.basename(path))
+            loaded += len(records)
+        print "Loaded %s bugs of %s in %.2f seconds; %s bugs in %s" % (loaded, args[2], time.time() - start, database.count(), args[0])
+        database.close()
+        return
+    try:
+        statuses = [] if options.status == 'all' else [bugseeker.STATUS_MAP[status] for status in options.status.split(',')]
+        importances = [] if options.imp == 'all' else [bugseeker.IMP_MAP[imp] for imp in options.imp.split(',')]
+    except KeyError, e:
+        sys.exit("Unknown status or importance code %s" % e)
+    dates = {}
+    for name in ('since', 'until'):
+        value = getattr(options, name)
+        try:
+            dates[name] = day(value) if value else None
+        except ValueError:
+            sys.exit("--%s takes a date as YYYY-MM-DD, not %s" % (name, value))
+    records = database.query(statuses=statuses, importances=importances,
+                             milestones=options.milestone.split(',') if options.milestone else (),
+                             project=options.project, owner=options.owner, assignee=options.assignee,
+                             affecting=options.affecting, path_prefix=options.path.decode('utf-8') if options.path else None,
+                             date=options.date, since=dates['since'], until=dates['until'])
+    elapsed = time.time() - start
+    if options.output:
+        try:
+            write(options.output, records, statuses)
+        except ValueError, e:
+            sys.exit(str(e))
+        print "Wrote %s bugs to %s" % (len(records), options.output)
+    else:
+        for record in records:
+            print "%s #%s  %-14s %-9s %-22s %-16s %s" % (record['project'], record['id'], record['status'], record['importance'],
+                                                       record['milestone'], record['fixed_by'], (record['title'] or u'').encode('utf-8'))
+    print "%s of %s bugs matched in %.1f ms" % (len(records), database.count(), elapsed * 1000)
+    database.close()
+
+if __name__ == '__main__':
+    main()
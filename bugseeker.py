@@ -27,109 +27,527 @@
 
 @Email: rohit.karajgi@gmail.com
 '''
-from launchpadlib.launchpad import Launchpad
+from launchpadlib.launchpad import Launchpad, LaunchpadOAuthAwareHttp
+from array import array
 from datetime import datetime as dt
+from multiprocessing.pool import ThreadPool
 from optparse import OptionParser
+import calendar
+import diffstore
+import json
+import lpasync
+import lpcheckpoint
+import lpexport
+import lpimmutable
+import lpmanifest
+import lphttp
+import lpscheduler
+import Queue
 import string
+import threading
 import time
 import os
 import sys
+import xlsxstream
 import xlwt
 
 # Pass this in, from out
 LP_LINK = 'https://bugs.launchpad.net/nova/+bug/'
 
-class Bug:
-    def __init__(self, bug, launchpad):
-	self.launchpad = launchpad
-	self.id = bug.bug.id
-	self.title = bug.bug.title
-	self.owner = bug.owner.name
-	self.status = bug.status
-	self.importance = bug.importance
-	self.date_created = bug.date_created.strftime("%d-%m-%Y")
- 	self.users_affected_count = bug.bug.users_affected_count
-     	self.users_affected = self._get_users_affected(bug)
-	self._set_variable_params(bug)
-
-	self.merged_revno = 'N/A'
-	self.num_lines_modified = ['N/A']
-	self.num_files_modified = 'N/A'
-	self.preview_diff_link = 'N/A'
-	self.files_modified = ['N/A']
-	self.lp_link = LP_LINK + str(self.id)
-	self._set_merge_items(bug)
-
-    def _get_branch_link(self,bug):
-	self.has_multiple_branches = 'N'
-	self.number_of_branches = len(bug.bug.linked_branches.entries)
-	if self.number_of_branches == 0:
-	    return None
-	if self.number_of_branches > 1:
-	    self.has_multiple_branches = 'Y'
-        return bug.bug.linked_branches.entries[self.number_of_branches - 1]['branch_link']
-
-    def _get_branch_m_p_link(self, branch):
-        num = len(branch.landing_targets.entries)
-	if num > 0:
-            return self.launchpad.load(str(branch.landing_targets.entries[num - 1]['self_link']))
-	return None
-
-    def _get_users_affected(self,bug):
-	users_collection = bug.bug.users_affected
- 	users = ''
-        for user in users_collection:
-    	    name = self.launchpad.load(str(user))
-    	    users = users + str(name.name) + ','
-	return users.strip(',')
-
-    def _set_variable_params(self,bug):
-	if bug.date_fix_committed:
-	    self.date_fix_committed = bug.date_fix_committed.strftime("%d-%m-%Y")
-	else:
-	    self.date_fix_committed = 'N/A'
-	if bug.date_fix_released:
-	    self.date_fix_released = bug.date_fix_released.strftime("%d-%m-%Y")
-	else:
-	    self.date_fix_released = 'N/A'
-	if bug.milestone:
-	    self.milestone = bug.milestone.title
-	else:
-	    self.milestone = 'none'
-	if bug.assignee:
-	    self.fixed_by = bug.assignee.name
-	else:
-	    self.fixed_by = 'Unassigned'
-
-    def _get_lines_modified_per_file(self, preview):
-	self.num_lines_modified = []
-	for value in preview.diffstat.values():
-	    self.num_lines_modified.append(value[0]+value[1])
-
-    def _set_merge_items(self,bug):
-        branch_link = self._get_branch_link(bug)
-	if branch_link is not None:
-            branch = self.launchpad.load(str(branch_link))
-            branch_merge_proposal = self._get_branch_m_p_link(branch)
-	    if branch_merge_proposal == None:
-	        return
-            preview = self.launchpad.load(str(branch_merge_proposal.preview_diff))
-            self.merged_revno = branch_merge_proposal.merged_revno
-            self.num_files_modified = len(preview.diffstat.keys())
-	    if self.num_files_modified == 0 or self.num_files_modified == None:
-		return
-            self.files_modified = []
-            for key in preview.diffstat.keys():
-                file_name = str(key)
-                self.files_modified.append(file_name)
-	    self.preview_diff_link = string.replace(preview.self_link,"api.launchpad.net/1.0","code.launchpad.net")
-            self.preview_diff_link +='/+files/preview.diff'
-            self._get_lines_modified_per_file(preview)
-	return
+# The -s and -i values, also taken by bugdb.py query
+STATUS_MAP = {'c':'Confirmed', 'fc':'Fix Committed', 'fr':'Fix Released', 'ip':'In Progress', 'ic':'Incomplete', 'i':'Invalid', 'n':'New', 'o':'Opinion', 't':'Triaged', 'w':'Won\'t Fix'}
+IMP_MAP = {'c':'Critical', 'h':'High', 'm':'Medium', 'l': 'Low', 'u':'Unknown', 'w':'Wishlist', 'ud':'Undecided'}
+
+# Links on a bug task that Bug dereferences; prefetch_links loads them once per page
+PREFETCH_LINKS = ('bug_link', 'owner_link', 'assignee_link', 'milestone_link')
+
+def parse_lp_date(value):
+    """Parse a date from a raw Launchpad JSON representation"""
+    if not value:
+        return None
+    return dt.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+
+def epoch(value):
+    """Seconds since 1970-01-01 UTC of a datetime (from launchpadlib or parse_lp_date); None for no date"""
+    if value is None:
+        return None
+    return calendar.timegm(value.utctimetuple())
+
+def format_date(value):
+    """The spreadsheet's 'dd-mm-yyyy' for seconds since the epoch; 'N/A' for no date"""
+    if value is None:
+        return 'N/A'
+    return time.strftime("%d-%m-%Y", time.gmtime(value))
+
+def _legacy_date(value):
+    """Seconds since the epoch of a date logged as 'dd-mm-yyyy' (or 'N/A') before dates were kept as numbers"""
+    if not isinstance(value, basestring):
+        return value
+    if not value or value == 'N/A':
+        return None
+    return calendar.timegm(time.strptime(value, "%d-%m-%Y"))
+
+# Fields that belong to the bug rather than to one of its tasks
+BUG_FIELDS = ('id', 'title', 'users_affected_count', 'users_affected', 'merged_revno', 'date_merged', 'num_lines_modified',
+              'lines_added', 'lines_removed', 'num_files_modified', 'preview_diff_link', 'files_modified', 'lp_link',
+              'has_multiple_branches', 'number_of_branches')
+
+class BugLoads(object):
+    """Requests sent to hydrate one bug: by the thread hydrating it, plus those its fanout
+    workers send for it. requests() returns how many requests the calling thread has sent."""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.before = requests()
+        self.fanned_out = 0
+        self._lock = threading.Lock()
+
+    def counted(self, func):
+        """func, adding the requests it sends on a fanout worker to this bug's"""
+        def run(item):
+            before = self.requests()
+            try:
+                return func(item)
+            finally:
+                sent = self.requests() - before
+                self._lock.acquire()
+                self.fanned_out += sent
+                self._lock.release()
+        return run
+
+    def total(self):
+        return self.requests() - self.before + self.fanned_out
+
+class SharedBugs(object):
+    """Bug-level fields hydrated once per bug and handed to every task of it, in any project.
+    Thread safe: a task whose bug is being hydrated by another thread waits for the result.
+
+    Once hydrated a bug is kept as compactly as a BugRecord: a tuple in BUG_FIELDS order,
+    shared strings for the paths, arrays for the lines. requests() returns how many requests
+    the calling thread has sent; with BugLoads it counts the loads a reused bug saved."""
+
+    def __init__(self, requests=None):
+        self.requests = requests
+        self.hydrated = 0
+        self.reused = 0
+        self.loads_saved = 0
+        self._lock = threading.Lock()
+        # bug link -> {'ready': Event} while the first task hydrates it, then (packed fields, loads)
+        self._bugs = {}
+
+    def __contains__(self, bug_link):
+        return str(bug_link) in self._bugs
+
+    def count(self, reused, loads):
+        self._lock.acquire()
+        if reused:
+            self.reused += 1
+            self.loads_saved += loads
+        else:
+            self.hydrated += 1
+        self._lock.release()
+
+    @staticmethod
+    def _pack(fields):
+        values = []
+        for name in BUG_FIELDS:
+            value = fields[name]
+            if name == 'files_modified':
+                value = tuple(_intern(path) for path in value)
+            elif name in ('lines_added', 'lines_removed'):
+                value = array('l', value)
+            elif name == 'num_lines_modified':
+                value = tuple(value)
+            values.append(value)
+        return tuple(values)
+
+    @staticmethod
+    def _unpack(values):
+        fields = dict(zip(BUG_FIELDS, values))
+        for name in ('files_modified', 'lines_added', 'lines_removed', 'num_lines_modified'):
+            fields[name] = list(fields[name])
+        return fields
+
+    def get(self, bug_link, hydrate):
+        """The fields hydrate(loads) returns for the bug at bug_link, calling it only for the bug's
+        first task; loads is the BugLoads counting its requests, or None"""
+        self._lock.acquire()
+        entry = self._bugs.get(bug_link)
+        first = entry is None
+        if first:
+            entry = self._bugs[bug_link] = {'ready': threading.Event()}
+        self._lock.release()
+        if not first:
+            if isinstance(entry, dict):
+                entry['ready'].wait()
+                if 'packed' not in entry:
+                    # The first task failed; this one tries for itself
+                    return hydrate(None)
+                entry = entry['packed'], entry['loads']
+            self.count(True, entry[1])
+            return self._unpack(entry[0])
+        loads = BugLoads(self.requests) if self.requests else None
+        try:
+            fields = hydrate(loads)
+            entry['loads'] = loads.total() if loads else 0
+            entry['packed'] = self._pack(fields)
+            self._lock.acquire()
+            self._bugs[bug_link] = entry['packed'], entry['loads']
+            self._lock.release()
+        finally:
+            entry['ready'].set()
+        self.count(False, entry['loads'])
+        return fields
+
+    def summary(self):
+        return "%s bugs hydrated, %s tasks reused an already hydrated bug, %s loads saved" % (
+            self.hydrated, self.reused, self.loads_saved)
+
+class Bug(object):
+    """Hydrates one bug task; record() gives the compact BugRecord kept once it is done"""
+    def __init__(self, bug, launchpad, resources=None, shared_bugs=None, immutable=None, fanout=None):
+        self.launchpad = launchpad
+        if resources is None:
+            resources = {}
+        self.task_link = str(bug.self_link)
+        self.owner = self._linked(bug, 'owner', resources).name
+        self.status = bug.status
+        self.importance = bug.importance
+        self.date_created = epoch(bug.date_created)
+        self._set_variable_params(bug, resources)
+        if shared_bugs is None:
+            self._hydrate_bug(bug, resources, immutable, fanout)
+        else:
+            self.__dict__.update(shared_bugs.get(str(bug.bug_link), lambda loads: self._hydrate_bug(bug, resources, immutable, fanout, loads)))
+
+    def _hydrate_bug(self, bug, resources, immutable=None, fanout=None, loads=None):
+        """Set the fields in BUG_FIELDS, which tasks of the same bug share; returns them"""
+        lp_bug = self._linked(bug, 'bug', resources)
+        self.id = lp_bug.id
+        self.title = lp_bug.title
+        self.users_affected_count = lp_bug.users_affected_count
+        self.users_affected = self._get_users_affected(lp_bug)
+
+        self.merged_revno = 'N/A'
+        self.date_merged = None
+        self.num_lines_modified = ['N/A']
+        self.lines_added = []
+        self.lines_removed = []
+        self.num_files_modified = 'N/A'
+        self.preview_diff_link = 'N/A'
+        self.files_modified = ['N/A']
+        self.lp_link = LP_LINK + str(self.id)
+        self._set_merge_items(lp_bug, immutable, fanout, loads)
+        return dict((name, getattr(self, name)) for name in BUG_FIELDS)
+
+    @classmethod
+    def from_json(cls, parts):
+        """Build a Bug from the raw JSON representations gathered by lpasync.hydrate_task"""
+        self = cls.__new__(cls)
+        self.launchpad = None
+        task, lp_bug = parts['task'], parts['bug']
+        self.task_link = task['self_link']
+        self.id = lp_bug['id']
+        self.title = lp_bug['title']
+        self.owner = parts['owner']['name']
+        self.status = task['status']
+        self.importance = task['importance']
+        self.date_created = epoch(parse_lp_date(task['date_created']))
+        self.users_affected_count = lp_bug['users_affected_count']
+        self.users_affected = ','.join(str(user['name']) for user in parts['users'])
+        self.date_fix_committed = epoch(parse_lp_date(task.get('date_fix_committed')))
+        self.date_fix_released = epoch(parse_lp_date(task.get('date_fix_released')))
+        self.milestone = parts['milestone']['title'] if parts['milestone'] else 'none'
+        self.fixed_by = parts['assignee']['name'] if parts['assignee'] else 'Unassigned'
+
+        self.merged_revno = 'N/A'
+        self.date_merged = None
+        self.num_lines_modified = ['N/A']
+        self.lines_added = []
+        self.lines_removed = []
+        self.num_files_modified = 'N/A'
+        self.preview_diff_link = 'N/A'
+        self.files_modified = ['N/A']
+        self.lp_link = LP_LINK + str(self.id)
+        self.number_of_branches = len(parts['branches'])
+        self.has_multiple_branches = 'Y' if self.number_of_branches > 1 else 'N'
+        proposal, preview, diffstat = merge_proposals(parts['proposals'])
+        if preview is None:
+            return self
+        self.merged_revno = proposal['merged_revno']
+        self.date_merged = proposal['date_merged']
+        self.num_files_modified = len(diffstat)
+        if self.num_files_modified == 0:
+            return self
+        self.files_modified = [str(key) for key in diffstat.keys()]
+        self.lines_added = [value[0] for value in diffstat.values()]
+        self.lines_removed = [value[1] for value in diffstat.values()]
+        self.num_lines_modified = [value[0] + value[1] for value in diffstat.values()]
+        self.preview_diff_link = string.replace(preview['self_link'], "api.launchpad.net/1.0", "code.launchpad.net") + '/+files/preview.diff'
+        return self
+
+    def record(self):
+        """The compact BugRecord kept for the report, detached from the launchpad client"""
+        fields = dict(self.__dict__)
+        del fields['launchpad'], fields['lp_link'], fields['num_lines_modified']
+        return BugRecord(**fields)
+
+    def _linked(self, bug, name, resources):
+        """Return the entry the task links to as name, from the prefetched resources when possible"""
+        link = getattr(bug, name + '_link', None)
+        if link is None:
+            return None
+        entry = resources.get(str(link))
+        if entry is None:
+            entry = getattr(bug, name)
+        return entry
+
+    def _get_branch_links(self, lp_bug):
+        entries = lp_bug.linked_branches.entries
+        self.number_of_branches = len(entries)
+        self.has_multiple_branches = 'Y' if self.number_of_branches > 1 else 'N'
+        return [str(entry['branch_link']) for entry in entries]
+
+    def _get_landing_targets(self, branch_link):
+        """Links of every merge proposal of the branch at branch_link"""
+        branch = self.launchpad.load(branch_link)
+        return [str(entry['self_link']) for entry in branch.landing_targets.entries]
+
+    def _get_merge_proposal(self, link, immutable=None):
+        """The merge proposal at link as an lpimmutable.proposal_record, from the immutable
+        store when it has merged before"""
+        record = immutable.get(link) if immutable is not None else None
+        if record is None:
+            proposal = self.launchpad.load(link)
+            preview_link = proposal.preview_diff_link and str(proposal.preview_diff_link)
+            record = lpimmutable.proposal_record(link, proposal.queue_status, proposal.merged_revno,
+                                                 epoch(proposal.date_merged), preview_link)
+            if immutable is not None:
+                immutable.put_proposal(record)
+        return record
+
+    def _get_preview(self, link, immutable=None):
+        """The preview diff at link as an lpimmutable.preview_record; preview diffs never change"""
+        record = immutable.get(link) if immutable is not None else None
+        if record is None:
+            preview = self.launchpad.load(link)
+            record = lpimmutable.preview_record(link, dict(preview.diffstat or {}))
+            if immutable is not None:
+                immutable.put_preview(record)
+        return record
+
+    def _get_proposal_and_preview(self, link, immutable=None):
+        proposal = self._get_merge_proposal(link, immutable)
+        if proposal['preview_diff_link'] is None:
+            return proposal, None
+        return proposal, self._get_preview(proposal['preview_diff_link'], immutable)
+
+    def _get_users_affected(self, lp_bug):
+        # The collection entries already carry each person's representation,
+        # so the names are read without loading every person again
+        users = [str(user.name) for user in lp_bug.users_affected]
+        return ','.join(users)
+
+    def _set_variable_params(self, bug, resources):
+        self.date_fix_committed = epoch(bug.date_fix_committed)
+        self.date_fix_released = epoch(bug.date_fix_released)
+        milestone = self._linked(bug, 'milestone', resources)
+        if milestone:
+            self.milestone = milestone.title
+        else:
+            self.milestone = 'none'
+        assignee = self._linked(bug, 'assignee', resources)
+        if assignee:
+            self.fixed_by = assignee.name
+        else:
+            self.fixed_by = 'Unassigned'
+
+    def _get_lines_modified_per_file(self, diffstat):
+        self.num_lines_modified = []
+        for value in diffstat.values():
+            self.lines_added.append(value[0])
+            self.lines_removed.append(value[1])
+            self.num_lines_modified.append(value[0]+value[1])
+
+    def _set_merge_items(self, lp_bug, immutable=None, fanout=None, loads=None):
+        # Every branch, then every proposal of every branch, is loaded at once on fanout,
+        # so a fix spread over several branches takes about as long as a single one
+        landing_targets = _fan_out(fanout, self._get_landing_targets, self._get_branch_links(lp_bug), loads)
+        links = [link for links in landing_targets for link in links]
+        pairs = _fan_out(fanout, lambda link: self._get_proposal_and_preview(link, immutable), links, loads)
+        proposal, preview, diffstat = merge_proposals(pairs)
+        if preview is None:
+            return
+        self.merged_revno = proposal['merged_revno']
+        self.date_merged = proposal['date_merged']
+        self.num_files_modified = len(diffstat)
+        if self.num_files_modified == 0:
+            return
+        self.files_modified = [str(key) for key in diffstat.keys()]
+        self.preview_diff_link = string.replace(preview['self_link'],"api.launchpad.net/1.0","code.launchpad.net")
+        self.preview_diff_link +='/+files/preview.diff'
+        self._get_lines_modified_per_file(diffstat)
+
+def _fan_out(fanout, func, items, loads=None):
+    """map func over items, concurrently on the fanout ThreadPool when there is more than one;
+    loads (a BugLoads) is given the requests sent on the workers"""
+    if fanout is None or len(items) < 2:
+        return map(func, items)
+    if loads is not None:
+        func = loads.counted(func)
+    return fanout.map(func, items)
+
+def merge_proposals(pairs):
+    """Combine the (proposal_record, preview_record or None) of every merge proposal of every
+    branch linked to a bug. Once one of them has merged, only the merged ones count.
+
+    Returns (proposal, preview, diffstat): the proposal merged last (or the last one) that has a
+    preview diff, that preview, and the lines added and removed per file across all the
+    proposals; a file changed by several of them is counted once, as the latest one changed it.
+    (None, None, {}) when no proposal has a preview diff."""
+    merged = [pair for pair in pairs if pair[0]['queue_status'] == lpimmutable.MERGED]
+    if merged:
+        pairs = sorted(merged, key=lambda pair: pair[0]['date_merged'] or 0)
+    pairs = [pair for pair in pairs if pair[1] is not None]
+    if not pairs:
+        return None, None, {}
+    diffstat = {}
+    for proposal, preview in pairs:
+        diffstat.update(preview['diffstat'])
+    proposal, preview = pairs[-1]
+    return proposal, preview, diffstat
+
+_strings = {}
+
+def _intern(value):
+    """Return the one shared copy of a string (str or unicode) that recurs between bugs"""
+    if isinstance(value, basestring):
+        return _strings.setdefault(value, value)
+    return value
+
+class BugRecord(object):
+    """The hydrated fields of one bug, as read by Report. Immutable.
+
+    Strings that recur between bugs (people, statuses, milestones, file paths)
+    are shared, the lines added and removed per file are kept in typed arrays
+    and there is no per-instance __dict__. Dates are seconds since the epoch
+    (None when unset); Report formats them. files_modified and
+    num_lines_modified read as ['N/A'] for a bug without a diff, as Bug's did."""
+    # users_affected, a comma separated list of names, is nearly unique per bug and is not shared
+    INTERNED = ('owner', 'status', 'importance', 'milestone', 'fixed_by', 'merged_revno', 'has_multiple_branches')
+    DATES = ('date_created', 'date_fix_committed', 'date_fix_released', 'date_merged')
+    FIELDS = INTERNED + DATES + ('id', 'title', 'users_affected_count', 'users_affected', 'num_files_modified',
+                                 'number_of_branches', 'preview_diff_link', 'task_link')
+    __slots__ = FIELDS + ('_files', '_added', '_removed')
+
+    def __init__(self, files_modified=(), lines_added=None, lines_removed=None, num_lines_modified=(), **fields):
+        fields.setdefault('date_merged', None)
+        for name in self.FIELDS:
+            value = fields[name]
+            if name in self.INTERNED:
+                value = _intern(value)
+            object.__setattr__(self, name, value)
+        if lines_added is None:
+            # Logged before added and removed lines were kept apart
+            lines_added = [n for n in num_lines_modified if n != 'N/A']
+            lines_removed = [0] * len(lines_added)
+        object.__setattr__(self, '_files', tuple(_intern(path) for path in files_modified if path != 'N/A'))
+        object.__setattr__(self, '_added', array('l', lines_added))
+        object.__setattr__(self, '_removed', array('l', lines_removed))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BugRecord is immutable")
+
+    @property
+    def files_modified(self):
+        return list(self._files) or ['N/A']
+
+    @property
+    def num_lines_modified(self):
+        return [added + removed for added, removed in zip(self._added, self._removed)] or ['N/A']
+
+    @property
+    def lines_added(self):
+        return self._added.tolist()
+
+    @property
+    def lines_removed(self):
+        return self._removed.tolist()
+
+    def modifications(self):
+        """[(path, lines added, lines removed)] for the files the bug's merge modified, in order"""
+        return zip(self._files, self._added, self._removed)
+
+    def diffstat(self):
+        """{path: (lines added, lines removed)} for the files the bug's merge modified"""
+        return dict(zip(self._files, zip(self._added, self._removed)))
+
+    @property
+    def lp_link(self):
+        return LP_LINK + str(self.id)
+
+    def to_record(self):
+        """The fields as a JSON-serializable dict, for the checkpoint log"""
+        record = dict((name, getattr(self, name)) for name in self.FIELDS)
+        record['files_modified'] = list(self._files)
+        record['lines_added'] = self._added.tolist()
+        record['lines_removed'] = self._removed.tolist()
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild a BugRecord logged with to_record"""
+        record = dict((str(name), value) for name, value in record.items())
+        record.pop('lp_link', None)
+        for name in cls.DATES:
+            if name in record:
+                record[name] = _legacy_date(record[name])
+        return cls(**record)
+
+HEADER_MAP = {0:'S.No', 1:'Bug ID', 2:'Title', 3:'Owner', 4:'Date Created', 5:'Status', 6:'Importance', 7:'Fixed By', 8:'Fix Committed Date', 9:'Fix Released Date', 10:'Fixed-in Milestone', 11:'# of users affected', 12:'Users Affected', 13:'Merged Rev. #', 14: 'Has Multiple Branches?', 15:'# of Branches', 16:'# of Files modified', 17:'List of Files Modified', 18:'# of Lines Modified per file', 19:'Link to Diff text'}
+# The bugs sheet of the normalized layout: the files and their lines move to a sheet of their own
+NORMALIZED_HEADER_MAP = dict((i, HEADER_MAP[i]) for i in range(17))
+NORMALIZED_HEADER_MAP[17] = HEADER_MAP[19]
+FILES_HEADER_MAP = {0:'Bug ID', 1:'File Modified', 2:'# of Lines Modified'}
+FILES_WIDTHS = {0: 12, 1: 70, 2: 22}
+FILES_SHEET = '%s files'
+
+# Spreadsheet layouts: a bug's files on blank-padded rows below it, or on a second sheet keyed by bug id
+PADDED = 'padded'
+NORMALIZED = 'normalized'
+
+def _column_widths(header_map):
+    """Widths in characters of the columns of a bugs sheet"""
+    widths = {2: len(header_map[2]) * 9, 3: len(header_map[3]) * 3}
+    for i in range(4, len(header_map)):
+        widths[i] = len(header_map[i]) + 4
+    return widths
+
+def _bug_values(bug_obj):
+    """Columns 2 (Title) to 16 (# of Files modified) of a bug's row"""
+    return [bug_obj.title, bug_obj.owner, format_date(bug_obj.date_created), bug_obj.status, bug_obj.importance,
+            bug_obj.fixed_by, format_date(bug_obj.date_fix_committed), format_date(bug_obj.date_fix_released),
+            bug_obj.milestone.replace('OpenStack ',''), bug_obj.users_affected_count, bug_obj.users_affected,
+            bug_obj.merged_revno, bug_obj.has_multiple_branches, bug_obj.number_of_branches, bug_obj.num_files_modified]
+
+def _files_headings(sheet_name, statuses, bug_list):
+    """The two heading lines of the files sheet of the normalized layout"""
+    files = sum(len(bug_obj.modifications()) for bug_obj in bug_list)
+    return ("Files modified for Project: '%s'" % sheet_name.upper(),
+            "Status: %s     Bugs: %s     Files modified: %s" % (statuses, len(bug_list), files))
+
+def _file_rows(bug_list):
+    """The rows of the files sheet: bug id, file, lines modified"""
+    for bug_obj in bug_list:
+        for path, added, removed in bug_obj.modifications():
+            yield (bug_obj.id, path, added + removed)
 
 class Report:
-    def __init__(self,bug_list):
+    extension = '.xls'
+
+    def __init__(self, bug_list, layout=PADDED):
 	self.bug_list = bug_list
+	self.layout = layout
         self.workbook = xlwt.Workbook(encoding = 'ascii')
 	self._set_styles()
 
@@ -143,77 +561,296 @@ class Report:
 	self.table_data_style = xlwt.easyxf(data_style)
 	self.bug_cell_style = xlwt.easyxf(bug_style)
 
-    def create_spreadsheet(self, file_name, sheet_name, bug_count, statuses):
-	if len(statuses) == 0:
-	    statuses = 'ALL'
-	heading = "Bug Report for Project: '%s'" % (sheet_name.upper())
-	heading_line2 = "Status: %s     Count: %s" % (statuses,bug_count)
-	as_of_date = 'Date: ' + dt.now().strftime("%d-%m-%Y")
-	worksheet = self.workbook.add_sheet(sheet_name, cell_overwrite_ok = True)
-	worksheet.write_merge(0,0,0,6,heading, self.heading_style)
-	worksheet.write_merge(0,0,7,9,as_of_date, self.heading_style)
-	worksheet.write_merge(1,1,0,7,heading_line2, self.heading_style)
+    def _add_sheet(self, sheet_name, heading, heading_line2, header_map, widths):
+        """A new sheet with its three heading rows written and frozen"""
+        as_of_date = 'Date: ' + dt.now().strftime("%d-%m-%Y")
+        worksheet = self.workbook.add_sheet(sheet_name, cell_overwrite_ok = True)
+        worksheet.write_merge(0,0,0,6,heading, self.heading_style)
+        worksheet.write_merge(0,0,7,9,as_of_date, self.heading_style)
+        worksheet.write_merge(1,1,0,7,heading_line2, self.heading_style)
         worksheet.set_panes_frozen(True) # frozen headings instead of split pane
         worksheet.set_horz_split_pos(3) # in general, freeze after last heading row
+        for col, width in widths.items():
+            worksheet.col(col).width = width*256
+        for key in header_map.keys():
+            worksheet.write(2,key,header_map[key], self.table_header_style)
+        return worksheet
+
+    def create_spreadsheet(self, file_name, sheet_name, bug_count, statuses, bug_list=None):
+        """Add a sheet listing bug_list (default: the report's bugs), in the normalized layout followed
+        by a sheet listing the files they modified, and save the workbook to file_name"""
+        if bug_list is None:
+            bug_list = self.bug_list
+        if len(statuses) == 0:
+            statuses = 'ALL'
+        heading = "Bug Report for Project: '%s'" % (sheet_name.upper())
+        heading_line2 = "Status: %s     Count: %s" % (statuses,bug_count)
+        header_map = HEADER_MAP if self.layout == PADDED else NORMALIZED_HEADER_MAP
+        worksheet = self._add_sheet(sheet_name, heading, heading_line2, header_map, _column_widths(header_map))
+        style = self.table_data_style
+        diff_col = len(header_map) - 1
+        row = 3
+        count = 0
+        for bug_obj in bug_list:
+            count = count + 1
+            worksheet.write(row,0, count, style)
+            worksheet.write(row,1, xlwt.Formula('HYPERLINK("%s";"%s")' % (bug_obj.lp_link,bug_obj.id)), self.bug_cell_style)
+            for col, value in enumerate(_bug_values(bug_obj)):
+                worksheet.write(row,col+2, value, style)
+            worksheet.write(row,diff_col, xlwt.Formula('HYPERLINK("%s";"Diff")' % (bug_obj.preview_diff_link)), self.bug_cell_style)
+            if self.layout == PADDED:
+                row = self._write_files(worksheet, row, bug_obj)
+            row = row + 1
+        if self.layout == NORMALIZED:
+            heading, heading_line2 = _files_headings(sheet_name, statuses, bug_list)
+            worksheet = self._add_sheet(FILES_SHEET % sheet_name, heading, heading_line2, FILES_HEADER_MAP, FILES_WIDTHS)
+            for row, values in enumerate(_file_rows(bug_list)):
+                for col, value in enumerate(values):
+                    worksheet.write(row+3,col, value, style)
+        self.workbook.save(file_name)
+
+    def _write_files(self, worksheet, row, bug_obj):
+        """Write the files bug_obj modified on its row, or on blank-padded rows below it when there
+        are several; returns the last row written"""
+        files_modified = bug_obj.files_modified
+        num_lines_modified = bug_obj.num_lines_modified
+        style = self.table_data_style
+        if len(files_modified) <= 1:
+            worksheet.write(row,17, files_modified[0], style)
+            worksheet.write(row,18, num_lines_modified[0], style)
+            return row
+        worksheet.write(row,17, '', style)
+        worksheet.write(row,18, '', style)
+        for i in range(0,len(files_modified)):
+            row = row + 1
+            for j in range(0,17):
+                worksheet.write(row,j, '', style)
+            worksheet.write(row,17, files_modified[i], style)
+            worksheet.write(row,18, num_lines_modified[i], style)
+            worksheet.write(row,19, '', style)
+        return row
+
+    def close(self):
+        """Nothing left to write: every create_spreadsheet call saved the workbook"""
+        pass
+
+class XlsxReport(Report):
+    """Report written as .xlsx by xlsxstream: rows stream to disk as they are written, so memory
+    does not grow with the report, sheets are not limited to 65,536 rows and links are native
+    hyperlinks. The workbook is only complete once close() is called."""
+    extension = '.xlsx'
 
-	header_map = {0:'S.No', 1:'Bug ID', 2:'Title', 3:'Owner', 4:'Date Created', 5:'Status', 6:'Importance', 7:'Fixed By', 8:'Fix Committed Date', 9:'Fix Released Date', 10:'Fixed-in Milestone', 11:'# of users affected', 12:'Users Affected', 13:'Merged Rev. #', 14: 'Has Multiple Branches?', 15:'# of Branches', 16:'# of Files modified', 17:'List of Files Modified', 18:'# of Lines Modified per file', 19:'Link to Diff text'}
-
-	worksheet.col(2).width = len(header_map[2])*9*256
-	worksheet.col(3).width = len(header_map[3])*3*256
-	for i in range(4,20):
-	    worksheet.col(i).width = (len(header_map[i])+4)*256
-
-	for key in header_map.keys():
-   	    worksheet.write(2,key,header_map[key], self.table_header_style)
-	row = 3
-	count = 0
-	for bug_obj in self.bug_list:
-	    count = count + 1
-	    files_list_length = len(bug_obj.files_modified)
-	    worksheet.write(row,0, count,self.table_data_style)
-	    worksheet.write(row,1, xlwt.Formula('HYPERLINK("%s";"%s")' % (bug_obj.lp_link,bug_obj.id)), self.bug_cell_style)
-	    worksheet.write(row,2, bug_obj.title, self.table_data_style)
-	    worksheet.write(row,3, bug_obj.owner, self.table_data_style)
-	    worksheet.write(row,4, bug_obj.date_created, self.table_data_style)
-	    worksheet.write(row,5, bug_obj.status, self.table_data_style)
-	    worksheet.write(row,6, bug_obj.importance, self.table_data_style)
-	    worksheet.write(row,7, bug_obj.fixed_by, self.table_data_style)
-	    worksheet.write(row,8, bug_obj.date_fix_committed, self.table_data_style)
-	    worksheet.write(row,9, bug_obj.date_fix_released, self.table_data_style)
-	    worksheet.write(row,10, bug_obj.milestone.replace('OpenStack ',''), self.table_data_style)
-	    worksheet.write(row,11, bug_obj.users_affected_count, self.table_data_style)
-	    worksheet.write(row,12, bug_obj.users_affected, self.table_data_style)
-	    worksheet.write(row,13, bug_obj.merged_revno, self.table_data_style)
-	    worksheet.write(row,14, bug_obj.has_multiple_branches, self.table_data_style)
-	    worksheet.write(row,15, bug_obj.number_of_branches, self.table_data_style)
-	    worksheet.write(row,16, bug_obj.num_files_modified, self.table_data_style)
-	    if files_list_length <= 1:
-	        worksheet.write(row,17, bug_obj.files_modified[0], self.table_data_style)
-	        worksheet.write(row,18, bug_obj.num_lines_modified[0], self.table_data_style)
-	    worksheet.write(row,19, xlwt.Formula('HYPERLINK("%s";"Diff")' % (bug_obj.preview_diff_link)), self.bug_cell_style)
-	    if files_list_length > 1:
-		worksheet.write(row,17, '', self.table_data_style)
-		worksheet.write(row,18, '', self.table_data_style)
-		for i in range(0,files_list_length):
-	            row = row + 1
-		    for j in range(0,17):
-                       worksheet.write(row,j, '', self.table_data_style)
-		    worksheet.write(row,17, bug_obj.files_modified[i], self.table_data_style)
-		    worksheet.write(row,18, bug_obj.num_lines_modified[i], self.table_data_style)
-		    worksheet.write(row,19, '', self.table_data_style)
-	    row = row + 1
-
-	self.workbook.save(file_name)
-
-def check_cachedir():
-    cachedir = os.path.join(os.getcwd(),'.launchpadlib/cache/')
+    def __init__(self, bug_list, layout=PADDED):
+        self.bug_list = bug_list
+        self.layout = layout
+        self.writer = None
+
+    def _add_sheet(self, sheet_name, heading, heading_line2, header_map, widths):
+        """A new sheet with its three heading rows written and frozen"""
+        sheet = self.writer.add_sheet(sheet_name, widths, freeze_rows=3)
+        sheet.write_row([(heading, xlsxstream.HEADING)] + [None] * 6 +
+                        [('Date: ' + dt.now().strftime("%d-%m-%Y"), xlsxstream.HEADING)])
+        sheet.merge_cells(0, 0, 6)
+        sheet.merge_cells(0, 7, 9)
+        sheet.write_row([(heading_line2, xlsxstream.HEADING)])
+        sheet.merge_cells(1, 0, 7)
+        sheet.write_row([(header_map[i], xlsxstream.HEADER) for i in range(len(header_map))])
+        return sheet
+
+    def create_spreadsheet(self, file_name, sheet_name, bug_count, statuses, bug_list=None):
+        """Add a sheet listing bug_list (default: the report's bugs), in the normalized layout followed
+        by a sheet listing the files they modified, to the workbook at file_name"""
+        if bug_list is None:
+            bug_list = self.bug_list
+        if len(statuses) == 0:
+            statuses = 'ALL'
+        if self.writer is None:
+            self.writer = xlsxstream.XlsxWriter(file_name)
+        padded = self.layout == PADDED
+        header_map = HEADER_MAP if padded else NORMALIZED_HEADER_MAP
+        sheet = self._add_sheet(sheet_name, "Bug Report for Project: '%s'" % sheet_name.upper(),
+                                "Status: %s     Count: %s" % (statuses, bug_count), header_map, _column_widths(header_map))
+        data, link = xlsxstream.DATA, xlsxstream.LINK
+        blank = [(None, data)] * 17
+        for count, bug_obj in enumerate(bug_list):
+            cells = [(count + 1, data), (xlsxstream.Hyperlink(bug_obj.lp_link, bug_obj.id), link)]
+            cells.extend((value, data) for value in _bug_values(bug_obj))
+            if padded:
+                files = bug_obj.files_modified
+                lines = bug_obj.num_lines_modified
+                single = len(files) <= 1
+                cells.append((files[0] if single else None, data))
+                cells.append((lines[0] if single else None, data))
+            cells.append((xlsxstream.Hyperlink(bug_obj.preview_diff_link, 'Diff'), link))
+            sheet.write_row(cells)
+            if padded and not single:
+                for i in range(len(files)):
+                    sheet.write_row(blank + [(files[i], data), (lines[i], data), (None, data)])
+        if not padded:
+            heading, heading_line2 = _files_headings(sheet_name, statuses, bug_list)
+            sheet = self._add_sheet(FILES_SHEET % sheet_name, heading, heading_line2, FILES_HEADER_MAP, FILES_WIDTHS)
+            for values in _file_rows(bug_list):
+                sheet.write_row([(value, data) for value in values])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class PooledLaunchpadHttp(lphttp.PooledHttpMixin, LaunchpadOAuthAwareHttp):
+    pass
+
+class PooledLaunchpad(Launchpad):
+    """Launchpad client whose HTTP transport draws keep-alive connections from connection_pool
+    and whose responses are kept in a size-bounded, revalidating on-disk cache. Requests go
+    through scheduler (an lpscheduler.RequestScheduler) when one is set."""
+    connection_pool = None
+    cache_max_bytes = lphttp.DEFAULT_CACHE_SIZE
+    scheduler = None
+
+    def __init__(self, *args, **kwargs):
+        cache = kwargs.get('cache')
+        if isinstance(cache, basestring):
+            kwargs['cache'] = lphttp.BoundedFileCache(cache, self.cache_max_bytes)
+        self.response_cache = kwargs.get('cache')
+        Launchpad.__init__(self, *args, **kwargs)
+
+    def httpFactory(self, credentials, cache, timeout, proxy_info):
+        return PooledLaunchpadHttp(self, self.authorization_engine, credentials, cache, timeout, proxy_info,
+                                   pool=self.connection_pool, scheduler=self.scheduler)
+
+def get_launchpad(cachedir, pool_size=lphttp.DEFAULT_POOL_SIZE, cache_size=lphttp.DEFAULT_CACHE_SIZE, service_root='production',
+                  scheduler=None):
+    """Log in anonymously with a pooled keep-alive transport shared by all hydration workers.
+    The pool (and its connection/request counters) is available as launchpad.connection_pool,
+    the response cache under cachedir as launchpad.response_cache"""
+    attrs = {'connection_pool': lphttp.ConnectionPool(pool_size), 'cache_max_bytes': cache_size, 'scheduler': scheduler}
+    launchpad_class = type('PooledLaunchpad', (PooledLaunchpad,), attrs)
+    launchpad = launchpad_class.login_anonymously('scour bugs', service_root, cachedir)
+    if scheduler is not None:
+        # The scheduler retries 5xx answers itself, with backoff; don't let the browser retry on top
+        launchpad._browser.max_retries = 0
+    return launchpad
+
+def iter_pages(launchpad, collection, start=None):
+    """Yield (entries, next page link) for a launchpadlib collection one server page at a time,
+    beginning at the page linked by start when given"""
+    if start is None:
+        collection._ensure_representation()
+        page = collection._wadl_resource.representation
+    else:
+        page = load_json(launchpad, start)
+    while True:
+        next_link = page.get('next_collection_link')
+        yield list(collection._convert_dicts_to_entries(page.get('entries', []))), next_link
+        if next_link is None:
+            break
+        page = load_json(launchpad, next_link)
+
+def pipelined(iterable, readahead=2):
+    """Iterate over iterable while a background thread stays up to readahead items ahead.
+    Exceptions raised by the producer are re-raised in the consumer."""
+    queue = Queue.Queue(readahead)
+    done = object()
+    def produce():
+        try:
+            for item in iterable:
+                queue.put((item, None))
+        except Exception:
+            queue.put((None, sys.exc_info()))
+            return
+        queue.put((done, None))
+    producer = threading.Thread(target=produce, name='page-prefetch')
+    producer.setDaemon(True)
+    producer.start()
+    while True:
+        item, error = queue.get()
+        if error is not None:
+            raise error[0], error[1], error[2]
+        if item is done:
+            break
+        yield item
+
+def load_json(launchpad, link):
+    """GET a raw JSON representation through the client's browser (and so its cache)"""
+    representation = launchpad._browser.get(str(link))
+    if isinstance(representation, str):
+        representation = representation.decode('utf-8')
+    return json.loads(representation)
+
+def prefetch_links(launchpad, page, shared, workers, shared_bugs=None):
+    """Load the bug, owner, assignee and milestone linked from a page of bug tasks in one go.
+
+    Links are collected from the whole page and de-duplicated before loading them
+    concurrently on the workers pool. People and milestones recur between pages, so they
+    are kept in shared and never loaded twice, and bugs already in shared_bugs are not
+    loaded at all. Returns a link -> entry map for Bug()."""
+    wanted = {}
+    for task in page:
+        for name in PREFETCH_LINKS:
+            link = getattr(task, name, None)
+            if name == 'bug_link' and shared_bugs is not None and link in shared_bugs:
+                continue
+            if link is not None and str(link) not in shared:
+                wanted[str(link)] = name
+    resources = dict(shared)
+    links = wanted.keys()
+    for link, entry in zip(links, workers.map(launchpad.load, links)):
+        resources[link] = entry
+        if wanted[link] != 'bug_link':
+            shared[link] = entry
+    return resources
+
+def hydrate_with_workers(launchpad, bugs, options, checkpoint, people_and_milestones=None, label='', shared_bugs=None,
+                         immutable=None, exporter=None):
+    """Hydrate the searchTasks collection on a pool of worker threads sharing the pooled client.
+    Bugs already in the checkpoint are skipped and every new one is logged to it. People and
+    milestones loaded go into people_and_milestones and bugs into shared_bugs (a SharedBugs),
+    both of which may be shared between projects. Merged proposals and preview diffs are read
+    from (and added to) immutable, an lpimmutable.ImmutableStore. The branches and merge
+    proposals of each bug are loaded concurrently on a second pool, as the workers wait on them.
+    Each hydrated bug is also written to exporter (an lpexport.Exporter) when given."""
+    bug_obj_list = []
+    bug_count = len(checkpoint.records)
+    workers = ThreadPool(options.workers)
+    fanout = ThreadPool(options.workers)
+    if people_and_milestones is None:
+        people_and_milestones = {}
+    def todo(page):
+        return [task for task in page if not checkpoint.is_done(task.self_link)]
+    # Fetch and prefetch upcoming pages in the background while this one is hydrated
+    pages = ((page, next_link, prefetch_links(launchpad, todo(page), people_and_milestones, workers, shared_bugs))
+             for page, next_link in iter_pages(launchpad, bugs, checkpoint.cursor))
+    for page, next_link, resources in pipelined(pages, options.readahead):
+        checkpoint.add_page([task.self_link for task in page], next_link)
+        for bug_obj in workers.imap(lambda bug: Bug(bug, launchpad, resources, shared_bugs, immutable, fanout).record(), todo(page)):
+            checkpoint.add(bug_obj.task_link, bug_obj.to_record())
+            if exporter is not None:
+                exporter.write(bug_obj)
+            bug_obj_list.append(bug_obj)
+            bug_count = bug_count + 1
+            print "%sBugs Processed: %s, Id: #%s" % (label, bug_count,str(bug_obj.id))
+    workers.close()
+    fanout.close()
+    return bug_obj_list, bug_count
+
+def write_data_file(path, bug_list):
+    """Write the bugs of one project as JSON lines, one BugRecord.to_record() per line"""
+    out = open(path, 'wb')
     try:
-        if not os.path.isdir(cachedir):
-	    print "Creating launchpadlib cache directory at %s" % cachedir
-            os.mkdir(cachedir)
-	    return cachedir
-    except:
-	raise
+        for bug_obj in bug_list:
+            out.write(json.dumps(bug_obj.to_record()) + '\n')
+    finally:
+        out.close()
+
+def check_cachedir(cachedir=None):
+    """Return the shared launchpadlib directory, creating it if needed. Unlike a directory
+    relative to the working directory it survives between Jenkins workspaces."""
+    if cachedir is None:
+        cachedir = os.environ.get('LP_CACHE_DIR', os.path.expanduser('~/.launchpadlib'))
+    if not os.path.isdir(cachedir):
+        print "Creating launchpadlib cache directory at %s" % cachedir
+        os.makedirs(cachedir)
+    return cachedir
 
 def get_kv(myhash):
     arr = ''
@@ -222,23 +859,41 @@ def get_kv(myhash):
     return arr.rstrip(', ')
 
 def main():
-    argv = sys.argv
-    arglen = len(argv)
 
-    usage = "usage: %prog project [options]\nproject should be either 'nova' or 'swift' or 'glance'\nSee -h or --help for detailed usage."
-    status_map = {'c':'Confirmed', 'fc':'Fix Committed', 'fr':'Fix Released', 'ip':'In Progress', 'ic':'Incomplete', 'i':'Invalid', 'n':'New', 'o':'Opinion', 't':'Triaged', 'w':'Won\'t Fix'}
-    imp_map = {'c':'Critical', 'h':'High', 'm':'Medium', 'l': 'Low', 'u':'Unknown', 'w':'Wishlist', 'ud':'Undecided'}
+    usage = "usage: %prog project [project ...] [options]\nproject should be either 'nova' or 'swift' or 'glance'; several projects (or a comma separated list) are hydrated together into one workbook\nSee -h or --help for detailed usage."
+    status_map = STATUS_MAP
+    imp_map = IMP_MAP
 
     parser = OptionParser(usage=usage, version="%prog 1.0")
     parser.add_option("-s", "--status", help="Bug status or list of comma separated values. Default: fc,fr \n[Values: %s]"%get_kv(status_map), dest="status", default="fc,fr")
     parser.add_option("-i", "--imp", help="Bug Importance or list of comma separated values. Default: all \n[Values: %s]"%get_kv(imp_map), dest="imp", default=[])
+    parser.add_option("-w", "--workers", help="Number of bugs hydrated concurrently. Default: 8", dest="workers", type="int", default=8)
+    parser.add_option("-p", "--pool-size", help="Keep-alive connections kept open to Launchpad, shared by all workers. Default: same as --workers", dest="pool_size", type="int", default=None)
+    parser.add_option("-a", "--async", help="Hydrate bugs with the single-threaded asynchronous fetcher (lpasync) instead of worker threads. It does not use the response cache (--cache-dir, --cache-size)", dest="use_async", action="store_true", default=False)
+    parser.add_option("--max-in-flight", help="Requests kept in flight by --async. Default: 200", dest="max_in_flight", type="int", default=200)
+    parser.add_option("--rate", help="Requests started per second against Launchpad, 0 for no limit. Default: 50", dest="rate", type="float", default=50)
+    parser.add_option("--max-retries", help="Times a request failing with a network error, 5xx or 429 is retried. Default: 6", dest="max_retries", type="int", default=6)
+    parser.add_option("-r", "--readahead", help="Number of searchTasks pages fetched ahead of hydration. Default: 2", dest="readahead", type="int", default=2)
+    parser.add_option("-c", "--cache-dir", help="Shared launchpadlib directory holding the response cache. Default: $LP_CACHE_DIR or ~/.launchpadlib", dest="cache_dir", default=None)
+    parser.add_option("--cache-size", help="Maximum size of the response cache in MB. Default: 512", dest="cache_size", type="int", default=512)
+    parser.add_option("--checkpoint", help="Log of hydrated bugs kept while the run is in progress, %(project)s is replaced by the project. Default: BugReport_%(project)s.checkpoint", dest="checkpoint", default=None)
+    parser.add_option("--immutable-db", help="SQLite store of merged proposals and preview diffs, which never change and are not fetched again, '' to skip it. Default: immutable.sqlite in the cache directory", dest="immutable_db", default=None)
+    parser.add_option("--diffstat-db", help="SQLite store the diffstat of every bug is added to (see diffstore.py), '' to skip it. Default: diffstats.sqlite", dest="diffstat_db", default='diffstats.sqlite')
+    parser.add_option("--reports-root", help="Write the spreadsheet and data files into a directory of their own under this one (e.g. /var/lib/jenkins/LPReports) and record the run in its manifest, see lpmanifest.py. Default: the current directory, no manifest", dest="reports_root", default=None)
+    parser.add_option("--column-store", help="Columnar store every run's bugs are appended to (see lpcolumns.py), '' to skip it. Default: .columns under --reports-root, none without it", dest="column_store", default=None)
+    parser.add_option("--bug-db", help="SQLite database the hydrated bugs, people and files are added to, for local queries with bugdb.py (best with -s all). Default: none", dest="bug_db", default=None)
+    parser.add_option("--spreadsheet", help="Spreadsheet format: xls (xlwt, at most 65,536 rows per project), xlsx (streamed to disk, see xlsxstream.py) or none. Default: xls", dest="spreadsheet", type="choice", choices=['xls', 'xlsx', 'none'], default='xls')
+    parser.add_option("--layout", help="padded: a bug's modified files on blank-padded rows below it; normalized: one row per bug, the files on a second sheet per project keyed by bug id. Default: padded", dest="layout", type="choice", choices=[PADDED, NORMALIZED], default=PADDED)
+    parser.add_option("-f", "--format", help="Also export each project's bugs as they are hydrated, as csv, tsv or jsonl (which then is the data file), see lpexport.py", dest="format", type="choice", choices=list(lpexport.FORMATS), default=None)
+    parser.add_option("-z", "--gzip", help="Gzip the --format export as it is written", dest="gzip", action="store_true", default=False)
+    parser.add_option("--resume", help="Continue an interrupted run from its checkpoint log, skipping bugs already hydrated", dest="resume", action="store_true", default=False)
     (options, args) = parser.parse_args(args=None, values=None)
 
-    if arglen == 1:
+    if not args:
         sys.exit(parser.print_usage())
 
     lb = 'Show only Bugs with linked Branches'
-    project = argv[1]
+    projects = [project for arg in args for project in arg.split(',') if project]
     statuses = options.status.split(',')
     if statuses[0] == 'all':
 	statuses = []
@@ -251,29 +906,154 @@ def main():
     else:
 	imps = []
 
-    cachedir = check_cachedir()
-    launchpad = Launchpad.login_anonymously('scour bugs','production', cachedir)
+    cachedir = check_cachedir(options.cache_dir)
+    scheduler = lpscheduler.RequestScheduler(options.rate, max_retries=options.max_retries)
+    launchpad = get_launchpad(cachedir, options.pool_size or options.workers, options.cache_size * 1024 * 1024, scheduler=scheduler)
+    if options.immutable_db is None:
+        options.immutable_db = os.path.join(cachedir, 'immutable.sqlite')
+    immutable = lpimmutable.ImmutableStore(options.immutable_db) if options.immutable_db else None
 
-    lp_project = launchpad.projects[project]
-    bugs = lp_project.searchTasks(status=statuses, importance=imps, linked_branches=lb)
-    bug_count = 0
+    searches = {}
+    checkpoints = {}
+    restored = {}
+    for project in projects:
+        searches[project] = launchpad.projects[project].searchTasks(status=statuses, importance=imps, linked_branches=lb)
+        checkpoint_path = (options.checkpoint or 'BugReport_%(project)s.checkpoint') % {'project': project}
+        query = {'project': project, 'status': statuses, 'importance': imps, 'linked_branches': lb}
+        try:
+            checkpoints[project] = lpcheckpoint.Checkpoint(checkpoint_path, query, options.resume)
+        except lpcheckpoint.CheckpointMismatch, e:
+            sys.exit("Cannot resume: %s" % e)
+        restored[project] = [BugRecord.from_record(record) for record in checkpoints[project].records]
+        if options.resume:
+            print "Resuming %s from %s: %s bugs already hydrated" % (project, checkpoint_path, len(restored[project]))
+    # Prefix progress lines with the project when several are hydrated at once
+    labels = dict((project, '[%s] ' % project if len(projects) > 1 else '') for project in projects)
     print "Querying Launchpad for bugs and tracking the time taken. This may take many minutes depending on the number of bugs"
-    bug_obj_list = []
     start = time.time()
-    for bug in bugs:
-        bug_obj = Bug(bug, launchpad)
-        bug_obj_list.append(bug_obj)
-        bug_count = bug_count + 1
-        print "Bugs Processed: %s, Id: #%s" % (bug_count,str(bug_obj.id))
     date_stamp = dt.now().strftime("%d%m%Y_%H%M%S")
-    filename = 'BugReport_'+project+'_'+date_stamp+'.xls'
-    report = Report(bug_obj_list)
-    report.create_spreadsheet(filename, project, bug_count, statuses)
-    print "Report generated.\nFilename: '%s' in current working directory." % filename
+    run_dir = ''
+    if options.reports_root:
+        run_dir = os.path.join(options.reports_root, date_stamp)
+        os.makedirs(run_dir)
+    exporters = {}
+    if options.format:
+        for project in projects:
+            name = lpexport.export_name('BugReport_'+project+'_'+date_stamp, options.format, options.gzip)
+            exporters[project] = lpexport.Exporter(os.path.join(run_dir, name), options.format, options.gzip)
+            exporters[project].write_many(restored[project])
+    results = {}
+    shared_bugs = SharedBugs(launchpad.connection_pool.thread_requests)
+    def build(parts):
+        shared_bugs.count(parts['reused'], parts['loads'])
+        return Bug.from_json(parts).record()
+    if options.use_async:
+        # One client and event loop for every project: people and milestones are
+        # fetched once between them and all projects share the in-flight limit
+        client = lpasync.AsyncClient(options.max_in_flight, scheduler=scheduler)
+        counts = {}
+        for project in projects:
+            checkpoint = checkpoints[project]
+            counts[project] = len(restored[project])
+            def progress(bug_obj, project=project, checkpoint=checkpoint):
+                checkpoint.add(bug_obj.task_link, bug_obj.to_record())
+                if project in exporters:
+                    exporters[project].write(bug_obj)
+                counts[project] += 1
+                print "%sBugs Processed: %s, Id: #%s" % (labels[project], counts[project], str(bug_obj.id))
+            if checkpoint.cursor is None:
+                searches[project]._ensure_representation()
+                first_page = searches[project]._wadl_resource.representation
+            else:
+                first_page = load_json(launchpad, checkpoint.cursor)
+            results[project] = lpasync.spawn_hydration(client, first_page, build, progress,
+                                                       on_page=lambda tasks, next_link, checkpoint=checkpoint: checkpoint.add_page([task['self_link'] for task in tasks], next_link),
+                                                       skip=lambda task, checkpoint=checkpoint: checkpoint.is_done(task['self_link']),
+                                                       immutable=immutable)
+        client.run()
+        client.close()
+        for project in projects:
+            results[project] = (results[project], counts[project])
+        print "Asynchronous fetcher: %(requests)s requests over %(connections)s connections" % client.counters
+    else:
+        people_and_milestones = {}
+        def hydrate_project(project):
+            return hydrate_with_workers(launchpad, searches[project], options, checkpoints[project], people_and_milestones, labels[project], shared_bugs,
+                                        immutable, exporters.get(project))
+        project_threads = ThreadPool(len(projects))
+        results = dict(zip(projects, project_threads.map(hydrate_project, projects)))
+        project_threads.close()
+
+    hydration_elapsed = time.time() - start
+    artifacts = []
+    for exporter in exporters.values():
+        exporter.close()
+        artifacts.append(os.path.basename(exporter.path))
+    report = filename = None
+    if options.spreadsheet != 'none':
+        report = (XlsxReport if options.spreadsheet == 'xlsx' else Report)([], options.layout)
+        filename = 'BugReport_'+'_'.join(projects)+'_'+date_stamp+report.extension
+        artifacts.insert(0, filename)
+    store = diffstore.DiffstatStore(options.diffstat_db) if options.diffstat_db else None
+    if options.column_store is None and options.reports_root:
+        options.column_store = os.path.join(options.reports_root, '.columns')
+    database = None
+    if options.bug_db:
+        import bugdb
+        database = bugdb.BugDatabase(options.bug_db)
+    columns = None
+    if options.column_store:
+        import lpcolumns
+        columns = lpcolumns.ColumnStore(options.column_store)
+    for project in projects:
+        bug_obj_list, bug_count = results[project]
+        bug_obj_list = restored[project] + bug_obj_list
+        if report is not None:
+            report.create_spreadsheet(os.path.join(run_dir, filename), project, bug_count, statuses, bug_obj_list)
+        if options.format == 'jsonl':
+            # The export, written as the bugs were hydrated, is the data file
+            data_file = os.path.basename(exporters[project].path)
+        else:
+            data_file = 'BugReport_'+project+'_'+date_stamp+'.jsonl'
+            write_data_file(os.path.join(run_dir, data_file), bug_obj_list)
+            artifacts.append(data_file)
+        if store is not None:
+            store.add_bugs(project, bug_obj_list)
+        if columns is not None:
+            columns.append(date_stamp, project, bug_obj_list)
+        if database is not None:
+            database.add_bugs(project, bug_obj_list, date_stamp)
+        print "%s: %s bugs, data file '%s'" % (project, bug_count, data_file)
+    if report is not None:
+        report.close()
+    if store is not None:
+        store.close()
+    if database is not None:
+        database.close()
+    for checkpoint in checkpoints.values():
+        checkpoint.close(remove=True)
     end = time.time()
     elapsed = end - start
+    if options.reports_root:
+        manifest = lpmanifest.Manifest(options.reports_root)
+        manifest.record(date_stamp, lpmanifest.BUGSEEKER, date_stamp, artifacts,
+                        {'hydration': round(hydration_elapsed, 2), 'total': round(elapsed, 2)})
+        manifest.close()
+        print "Report generated.\nFilename: '%s' in %s, recorded in %s." % (filename or "', '".join(artifacts), run_dir, manifest.path)
+    elif filename:
+        print "Report generated.\nFilename: '%s' in current working directory." % filename
+    for exporter in exporters.values():
+        print "Exported %s bugs to '%s'" % (exporter.count, exporter.path)
     min = elapsed/60
     print "Time taken = ", round(min,2), " minutes (or ", round(elapsed,2), " seconds)"
+    pool = launchpad.connection_pool
+    print "HTTP requests sent: %s over %s connections" % (pool.requests_sent, pool.connections_opened)
+    print "Response cache: %s" % launchpad.response_cache.summary()
+    print "Bugs shared between tasks: %s" % shared_bugs.summary()
+    if immutable is not None:
+        print "Merged proposals and preview diffs: %s" % immutable.summary()
+        immutable.close()
+    print "Requests per endpoint:\n%s" % scheduler.summary()
 
 if __name__ == '__main__':
     main()
@@ -1787,6 +1787,91 @@ class DonutPlot(PiePlot):
         self.context.arc_negative(self.center[0] + horizontal_shift, self.center[1] + vertical_shift, self.radius, 0, -2*math.pi)
         self.context.fill()
 
+class SunburstPlot(Plot):
+    def __init__ (self,
+            surface = None,
+            data = None,
+            width = 640,
+            height = 480,
+            background = "white light_gray",
+            colors = None,
+            depth = 3,
+            label_angle = 0.12):
+
+        # data is a (label, value, children) tree, children being a list of trees of the same form
+        self.depth = depth
+        Plot.__init__( self, surface, data, width, height, background, series_colors = colors )
+        self.center = ( self.dimensions[HORZ]/2, self.dimensions[VERT]/2 )
+        self.radius = min( self.dimensions[HORZ], self.dimensions[VERT] )/2 - 10
+        self.ring_width = float(self.radius)/(depth + 1)
+        self.label_angle = label_angle
+
+    def load_series(self, data, x_labels=None, y_labels=None, series_colors=None):
+        # The tree is drawn as is: a Series cannot hold the nesting
+        self.tree = data
+        self.series_labels = [child[0] for child in data[2]]
+        self.series_widths = [1.0 for child in data[2]]
+        self.process_colors( series_colors, max(len(data[2]), 1) )
+
+    def draw_piece(self, inner_radius, outer_radius, angle, next_angle):
+        x0, y0 = self.center
+        self.context.move_to(x0 + inner_radius*math.cos(angle), y0 + inner_radius*math.sin(angle))
+        self.context.line_to(x0 + outer_radius*math.cos(angle), y0 + outer_radius*math.sin(angle))
+        self.context.arc(x0, y0, outer_radius, angle, next_angle)
+        self.context.line_to(x0 + inner_radius*math.cos(next_angle), y0 + inner_radius*math.sin(next_angle))
+        self.context.arc_negative(x0, y0, inner_radius, next_angle, angle)
+        self.context.close_path()
+
+    def render(self):
+        self.render_background()
+        self.render_bounding_box()
+        self.render_plot()
+
+    def render_plot(self):
+        label, total, children = self.tree
+        cr = self.context
+        cr.set_font_size(self.font_size)
+        cr.set_source_rgba(*self.label_color)
+        w = cr.text_extents(label)[2]
+        cr.move_to(self.center[0] - w/2, self.center[1] + self.font_size/2)
+        cr.show_text(label)
+        if not total:
+            return
+        angle = -math.pi/2
+        for number, child in enumerate(children):
+            next_angle = angle + 2.0*math.pi*child[1]/total
+            self.render_node(child, 1, angle, next_angle, self.series_colors[number])
+            angle = next_angle
+
+    def render_node(self, node, level, angle, next_angle, color):
+        label, value, children = node
+        cr = self.context
+        inner_radius = level*self.ring_width
+        outer_radius = inner_radius + self.ring_width
+        # Deeper rings fade towards white
+        fade = 0.5*(level - 1)/self.depth
+        cr.set_source_rgba(color[0] + (1 - color[0])*fade, color[1] + (1 - color[1])*fade, color[2] + (1 - color[2])*fade, color[3])
+        self.draw_piece(inner_radius, outer_radius, angle, next_angle)
+        cr.fill()
+        cr.set_source_rgba(1.0, 1.0, 1.0)
+        self.draw_piece(inner_radius, outer_radius, angle, next_angle)
+        cr.stroke()
+
+        if next_angle - angle >= self.label_angle:
+            middle = (angle + next_angle)/2
+            radius = (inner_radius + outer_radius)/2
+            w = cr.text_extents(label)[2]
+            cr.set_source_rgba(*self.label_color)
+            cr.move_to(self.center[0] + radius*math.cos(middle) - w/2, self.center[1] + radius*math.sin(middle) + self.font_size/2)
+            cr.show_text(label)
+
+        if level >= self.depth or not value:
+            return
+        for child in children:
+            child_next_angle = angle + (next_angle - angle)*child[1]/value
+            self.render_node(child, level + 1, angle, child_next_angle, color)
+            angle = child_next_angle
+
 class GanttChart (Plot) :
     def __init__(self,
                  surface = None,
@@ -2186,6 +2271,33 @@ def donut_plot(name, data, width, height, background = "white light_gray", gradi
     plot.render()
     plot.commit()
 
+def sunburst_plot(name, data, width, height, background = "white light_gray", colors = None, depth = 3):
+
+    '''
+        - Function to plot sunburst graphics: a hierarchy drawn as rings, each entry taking the share of its parent's arc given by its value.
+
+        sunburst_plot(name, data, width, height, background = "white light_gray", colors = None, depth = 3)
+
+        - Parameters
+
+        name - Name of the desired output file, no need to input the .svg as it will be added at runtim;
+        data - A (label, value, children) tuple, children being a list of tuples of the same form. The root is written in the middle;
+        width, height - Dimensions of the output image;
+        background - A 3 element tuple representing the rgb color expected for the background or a new cairo linear gradient. 
+                     If left None, a gray to white gradient will be generated;
+        colors - List of colors (or a theme) for the entries of the first ring; deeper rings use a lighter shade of their ancestor's color;
+        depth - Number of rings drawn.
+
+        - Example of use
+
+        teste_data = ("/", 10, [("nova", 7, [("compute", 5, []), ("api", 2, [])]), ("bin", 3, [])])
+        CairoPlot.sunburst_plot("sunburst_teste", teste_data, 500, 500)
+    '''
+
+    plot = SunburstPlot(name, data, width, height, background, colors, depth)
+    plot.render()
+    plot.commit()
+
 def gantt_chart(name, pieces, width, height, x_labels, y_labels, colors):
 
     '''
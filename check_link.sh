@@ -1,12 +1,11 @@
-#!/bin/bash
-
-FILE="/var/lib/jenkins/LPReports/latest"
-
-if [[ ! -a $FILE ]]; then
-    rm -rf $FILE
-fi
-
-if [[ -L $FILE ]]; then
-   rm -rf $FILE
-fi
-
+#!/bin/bash
+# make_report.py swaps /var/lib/jenkins/LPReports/latest to each finished report itself.
+# This only repairs the link when it dangles (e.g. its run directory was removed), pointing
+# it back at the last published run recorded in the manifest. See lpmanifest.py.
+
+ROOT="/var/lib/jenkins/LPReports"
+FILE="$ROOT/latest"
+
+if [[ -L $FILE && ! -e $FILE ]]; then
+    python "$(dirname "$0")/lpmanifest.py" $ROOT relink
+fi
@@ -0,0 +1,131 @@
+"""Persistent store of the files each bug fix touched
+
+bugseeker.py adds the diffstat of every merged bug fix to an SQLite database
+that is kept between runs:
+
+    files  (path, bug_id, added, removed, milestone, date_merged)
+    bugs   (project, bug_id)
+
+files is clustered on path and carries the bug's milestone and merge date, so
+both the history of one file and the churn of everything under a directory
+prefix ('nova/compute/') are a single index range scan, with no join and no
+re-reading of spreadsheets.
+
+Usage: python diffstore.py <db> history <path>
+       python diffstore.py <db> churn <directory/> [--project nova] [--by milestone|month]
+
+Dependent Packages: sqlite3 (standard library)
+"""
+
+from optparse import OptionParser
+import sqlite3
+import sys
+import time
+
+# Rows stored in primary key order make the path range scans read consecutive pages
+WITHOUT_ROWID = ' WITHOUT ROWID' if sqlite3.sqlite_version_info >= (3, 8, 2) else ''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL,
+    bug_id INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    removed INTEGER NOT NULL,
+    milestone TEXT,
+    date_merged TEXT,
+    PRIMARY KEY (path, bug_id)
+)%(without_rowid)s;
+CREATE INDEX IF NOT EXISTS files_bug ON files (bug_id);
+CREATE TABLE IF NOT EXISTS bugs (
+    project TEXT NOT NULL,
+    bug_id INTEGER NOT NULL,
+    PRIMARY KEY (project, bug_id)
+)%(without_rowid)s;
+''' % {'without_rowid': WITHOUT_ROWID}
+
+def _iso_date(value):
+    """Seconds since the epoch (as in the bug records) to a sortable 'yyyy-mm-dd'; None for no date"""
+    if value is None:
+        return None
+    return time.strftime('%Y-%m-%d', time.gmtime(value))
+
+def prefix_range(prefix):
+    """The [low, high) range of paths starting with prefix, for an index range scan.
+    high is None for the empty prefix, which every path starts with."""
+    if not prefix:
+        return u'', None
+    return prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+
+class DiffstatStore(object):
+    """The diffstat database at path, created on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add_bugs(self, project, bugs):
+        """Record the diffstats of bugs (BugRecords) for project, replacing what an earlier run stored"""
+        db = self.db
+        with db:
+            for bug in bugs:
+                db.execute('INSERT OR REPLACE INTO bugs VALUES (?, ?)', (project, bug.id))
+                db.execute('DELETE FROM files WHERE bug_id = ?', (bug.id,))
+                merged = _iso_date(bug.date_merged)
+                db.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                               [(path, bug.id, added, removed, bug.milestone, merged)
+                                for path, (added, removed) in bug.diffstat().items()])
+
+    def history(self, path):
+        """[(bug id, date merged, lines added, lines removed)] for one file, oldest merge first"""
+        return self.db.execute('''
+            SELECT bug_id, date_merged, added, removed FROM files
+            WHERE path = ? ORDER BY date_merged, bug_id''', (path,)).fetchall()
+
+    def churn(self, prefix, by='milestone', project=None):
+        """[(milestone or month, bugs, files, lines added, lines removed)] for files under prefix"""
+        if by == 'month':
+            group = 'substr(date_merged, 1, 7)'
+        elif by == 'milestone':
+            group = 'milestone'
+        else:
+            raise ValueError("cannot group churn by %r" % by)
+        low, high = prefix_range(prefix)
+        where, args = 'path >= ?', [low]
+        if high is not None:
+            where += ' AND path < ?'
+            args.append(high)
+        if project is not None:
+            where += ' AND bug_id IN (SELECT bug_id FROM bugs WHERE project = ?)'
+            args.append(project)
+        return self.db.execute('''
+            SELECT %s AS bucket, COUNT(DISTINCT bug_id), COUNT(DISTINCT path), SUM(added), SUM(removed)
+            FROM files WHERE %s GROUP BY bucket ORDER BY bucket''' % (group, where), args).fetchall()
+
+def main():
+    usage = "usage: %prog db history <path>\n       %prog db churn <directory/> [options]"
+    parser = OptionParser(usage=usage)
+    parser.add_option("-p", "--project", help="Only count bugs of this project", dest="project", default=None)
+    parser.add_option("--by", help="Group churn by 'milestone' or 'month'. Default: milestone", dest="by", type="choice", choices=['milestone', 'month'], default='milestone')
+    (options, args) = parser.parse_args()
+    if len(args) != 3 or args[1] not in ('history', 'churn'):
+        sys.exit(parser.print_usage())
+    store = DiffstatStore(args[0])
+    start = time.time()
+    if args[1] == 'history':
+        rows = store.history(args[2].decode('utf-8'))
+        for bug_id, merged, added, removed in rows:
+            print "#%s  %s  +%s -%s" % (bug_id, merged or 'unmerged', added, removed)
+    else:
+        rows = store.churn(args[2].decode('utf-8'), options.by, options.project)
+        print "%-30s %8s %8s %10s %10s" % (options.by, 'bugs', 'files', 'added', 'removed')
+        for bucket, bugs, files, added, removed in rows:
+            print "%-30s %8s %8s %10s %10s" % (bucket, bugs, files, added, removed)
+    print "%s rows in %.1f ms" % (len(rows), (time.time() - start) * 1000)
+    store.close()
+
+if __name__ == '__main__':
+    main()
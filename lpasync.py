@@ -0,0 +1,755 @@
+"""Single-threaded asynchronous fetcher for bugseeker
+
+bugseeker.Bug hydrates a bug through launchpadlib, which blocks on every load,
+so concurrency can only come from threads. This module walks the same graph
+(task -> bug, owner, assignee, milestone -> users affected and every linked
+branch -> its landing targets -> their preview diffs) as generator coroutines driven by an event
+loop over non-blocking keep-alive HTTP connections. One thread keeps hundreds
+of requests in flight, bounded by a global limit and a per-host request rate,
+or by an lpscheduler.RequestScheduler that also retries failed requests.
+
+Every document is fetched afresh: unlike launchpadlib's client, this one does
+not read or fill the response cache (lphttp.BoundedFileCache) and sends no
+conditional requests. Only merged proposals and preview diffs are kept between
+runs, in the lpimmutable store.
+
+Python 2 has no asyncio, so coroutines are plain generators that yield what
+they are waiting for and are resumed with the result:
+
+    yield 'https://...'             the decoded JSON document at that URL
+    yield Shared('https://...')     the same, fetched at most once per client
+    yield Once(key, factory)        what coroutine factory() returns, run at most once per key
+    yield some_coroutine()          the value the coroutine returns
+    yield [item, item, ...]         a list of results; the items run concurrently
+
+A coroutine returns a value with `raise Return(value)`. Errors (network
+failures, non-2xx responses) are raised inside the coroutine at the yield.
+"""
+
+from urlparse import urlsplit
+import collections
+import errno
+import heapq
+import json
+import select
+import socket
+import ssl
+import sys
+import time
+import types
+import zlib
+
+import lpimmutable
+import lpscheduler
+
+USER_AGENT = 'bugseeker (lpasync)'
+MAX_REDIRECTS = 5
+
+class Return(Exception):
+    """Raised by a coroutine to finish with a value"""
+    def __init__(self, value=None):
+        Exception.__init__(self, value)
+        self.value = value
+
+class HTTPError(Exception):
+    def __init__(self, url, status, body=''):
+        Exception.__init__(self, "HTTP Error %s: %s" % (status, url))
+        self.url = url
+        self.status = status
+        self.body = body
+
+class Shared(str):
+    """A URL whose document is fetched once per client and handed to every coroutine asking for it"""
+
+class Once(object):
+    """Runs the coroutine returned by factory() once per client and key; every coroutine
+    yielding a Once with the same key gets that run's result"""
+    def __init__(self, key, factory):
+        self.key = key
+        self.factory = factory
+
+class _Request(object):
+    def __init__(self, url, callback):
+        self.url = url
+        self.callback = callback
+        self.redirects = 0
+        self.attempts = 0
+        self.retries = 0
+        self.started = None
+        self.endpoint = lpscheduler.endpoint_for(url)
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+
+class _Host(object):
+    """Idle connections, queued requests and the request-rate token bucket of one host"""
+    def __init__(self, key, rate):
+        self.key = key
+        self.pending = collections.deque()
+        self.idle = []
+        self.connections = 0
+        self.address = None
+        self.rate = rate
+        self.tokens = rate and float(rate)
+        self.stamp = time.time()
+
+    def resolve(self):
+        """Look the host up, IPv4 or IPv6, keeping the first address to connect to"""
+        scheme, hostname, port = self.key
+        self.address = socket.getaddrinfo(hostname, port, 0, socket.SOCK_STREAM)[0]
+
+    def take_token(self, now):
+        """Return 0 if a request may start now, otherwise the seconds until it may"""
+        if not self.rate:
+            return 0
+        self.tokens = min(float(self.rate), self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class _Connection(object):
+    """A non-blocking HTTP/1.1 keep-alive connection"""
+
+    def __init__(self, client, host):
+        self.client = client
+        self.host = host
+        scheme, hostname, port = host.key
+        self.hostname = hostname
+        if host.address is None:
+            # Only when the lookup failed as the host's first request was queued
+            host.resolve()
+        family, socktype, proto, _, address = host.address
+        self.sock = socket.socket(family, socktype, proto)
+        self.sock.setblocking(0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.tls = scheme == 'https'
+        self.request = None
+        self.deadline = None
+        self.state = 'connecting'
+        err = self.sock.connect_ex(address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise socket.error(err, errno.errorcode.get(err, str(err)))
+        client.counters['connections'] += 1
+
+    def _host_header(self):
+        # An IPv6 literal goes in brackets, as in the URL
+        if ':' in self.hostname:
+            return '[%s]' % self.hostname
+        return self.hostname
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def wants_write(self):
+        return self.state in ('connecting', 'handshake_write', 'sending')
+
+    def wants_read(self):
+        return self.state in ('handshake_read', 'receiving', 'idle')
+
+    def start(self, request):
+        self.request = request
+        request.attempts += 1
+        self.outbuf = ('GET %s HTTP/1.1\r\nHost: %s\r\nAccept: application/json\r\n'
+                       'Accept-Encoding: gzip\r\nUser-Agent: %s\r\n\r\n') % (request.path, self._host_header(), USER_AGENT)
+        self.inbuf = ''
+        self.status = None
+        self.headers = None
+        self.parts = []
+        self.deadline = time.time() + self.client.timeout
+        if self.state == 'idle':
+            self.state = 'sending'
+
+    def on_writable(self):
+        if self.state == 'connecting':
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise socket.error(err, errno.errorcode.get(err, str(err)))
+            if self.tls:
+                self.sock = self.client.ssl_context.wrap_socket(self.sock, server_hostname=self.hostname,
+                                                                do_handshake_on_connect=False)
+                self.state = 'handshake_write'
+            else:
+                self.state = 'sending'
+        if self.state in ('handshake_read', 'handshake_write'):
+            return self._handshake()
+        if self.state == 'sending':
+            try:
+                sent = self.sock.send(self.outbuf)
+            except ssl.SSLWantWriteError:
+                return
+            self.outbuf = self.outbuf[sent:]
+            if not self.outbuf:
+                self.state = 'receiving'
+
+    def _handshake(self):
+        try:
+            self.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            self.state = 'handshake_read'
+            return
+        except ssl.SSLWantWriteError:
+            self.state = 'handshake_write'
+            return
+        self.state = 'sending'
+
+    def on_readable(self):
+        if self.state in ('handshake_read', 'handshake_write'):
+            return self._handshake()
+        data = []
+        while True:
+            try:
+                chunk = self.sock.recv(65536)
+            except ssl.SSLWantReadError:
+                break
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not chunk:
+                return self._on_eof(''.join(data))
+            data.append(chunk)
+            if not (self.tls and self.sock.pending()):
+                if len(chunk) < 65536:
+                    break
+        if self.state == 'idle':
+            # The server closed an idle keep-alive connection or sent garbage
+            return self.client._drop(self)
+        self.inbuf += ''.join(data)
+        self.deadline = time.time() + self.client.timeout
+        if self._parse():
+            self._finish()
+
+    def _on_eof(self, data):
+        if self.state == 'idle':
+            return self.client._drop(self)
+        self.inbuf += data
+        if self.headers is not None and self.mode == 'close':
+            self.parts.append(self.inbuf)
+            self.inbuf = ''
+            return self._finish(keep_alive=False)
+        if self._parse():
+            return self._finish(keep_alive=False)
+        if self.status is None and not self.inbuf and self.request.attempts < 2:
+            # A stale keep-alive connection: resend on a fresh one
+            request, self.request = self.request, None
+            self.client.in_flight -= 1
+            self.client._settle(request, None)
+            self.client._drop(self)
+            return self.client._requeue(request)
+        raise socket.error(errno.ECONNRESET, 'connection closed mid-response')
+
+    def _parse(self):
+        """Consume self.inbuf; returns True once the whole response has arrived"""
+        if self.headers is None:
+            end = self.inbuf.find('\r\n\r\n')
+            if end < 0:
+                return False
+            lines = self.inbuf[:end].split('\r\n')
+            self.inbuf = self.inbuf[end + 4:]
+            self.status = int(lines[0].split(' ', 2)[1])
+            self.headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                self.headers[name.strip().lower()] = value.strip()
+            if 'chunked' in self.headers.get('transfer-encoding', ''):
+                self.mode = 'chunked'
+            elif 'content-length' in self.headers:
+                self.mode = 'length'
+                self.length = int(self.headers['content-length'])
+            elif self.status in (204, 304) or 100 <= self.status < 200:
+                self.mode = 'length'
+                self.length = 0
+            else:
+                self.mode = 'close'
+        if self.mode == 'length':
+            if len(self.inbuf) < self.length:
+                return False
+            self.parts.append(self.inbuf[:self.length])
+            self.inbuf = self.inbuf[self.length:]
+            return True
+        if self.mode == 'chunked':
+            while True:
+                nl = self.inbuf.find('\r\n')
+                if nl < 0:
+                    return False
+                size = int(self.inbuf[:nl].split(';')[0], 16)
+                if size == 0:
+                    end = self.inbuf.find('\r\n\r\n', nl)
+                    if end < 0:
+                        return False
+                    self.inbuf = self.inbuf[end + 4:]
+                    return True
+                if len(self.inbuf) < nl + 2 + size + 2:
+                    return False
+                self.parts.append(self.inbuf[nl + 2:nl + 2 + size])
+                self.inbuf = self.inbuf[nl + 2 + size + 2:]
+        return False
+
+    def _finish(self, keep_alive=True):
+        request, self.request = self.request, None
+        status, headers, body = self.status, self.headers, ''.join(self.parts)
+        self.deadline = None
+        self.client.in_flight -= 1
+        if headers.get('connection', '').lower() == 'close' or self.mode == 'close':
+            keep_alive = False
+        if keep_alive:
+            self.state = 'idle'
+            self.client._release(self)
+        else:
+            self.client._drop(self)
+        if headers.get('content-encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        self.client._complete(request, status, headers, body)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+class AsyncClient(object):
+    """Runs coroutines over a shared event loop and set of keep-alive connections
+
+    max_in_flight bounds the requests outstanding across all hosts (the global
+    semaphore), connections_per_host the sockets opened to one host and rate
+    the requests started per second on one host (0 for no limit). An optional
+    lpscheduler.RequestScheduler further limits each endpoint and retries
+    network errors, 5xx and 429 responses after a backoff.
+    """
+
+    def __init__(self, max_in_flight=200, rate=0, connections_per_host=None, timeout=60, scheduler=None):
+        self.max_in_flight = max_in_flight
+        self.connections_per_host = connections_per_host or max_in_flight
+        self.rate = rate
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.ssl_context = ssl.create_default_context()
+        self.counters = {'requests': 0, 'connections': 0, 'redirects': 0, 'shared_hits': 0}
+        self.in_flight = 0
+        self._hosts = {}
+        self._connections = set()
+        self._timers = []
+        self._delayed = []
+        self._shared = {}
+        self._outstanding = 0
+        self._errors = []
+
+    def close(self):
+        """Close every connection"""
+        for conn in list(self._connections):
+            self._drop(conn)
+
+    # Coroutine plumbing
+
+    def spawn(self, item, callback=None):
+        """Start a coroutine (or fetch) in the background. callback(value, exc_info) is
+        called when it finishes; without one a failure aborts run()."""
+        self._outstanding += 1
+        def done(value, error):
+            self._outstanding -= 1
+            if callback is not None:
+                callback(value, error)
+            elif error is not None:
+                self._errors.append(error)
+        self._start(item, done)
+
+    def run(self, item=None):
+        """Run the event loop until every spawned coroutine has finished; returns item's result"""
+        result = []
+        if item is not None:
+            self.spawn(item, lambda value, error: result.append((value, error)))
+        while self._outstanding and not self._errors:
+            self._dispatch()
+            self._poll()
+        if self._errors:
+            error = self._errors[0]
+            self._errors = []
+            raise error[0], error[1], error[2]
+        if result:
+            value, error = result[0]
+            if error is not None:
+                raise error[0], error[1], error[2]
+            return value
+
+    def _start(self, item, callback):
+        if item is None:
+            callback(None, None)
+        elif isinstance(item, types.GeneratorType):
+            _Task(self, item, callback).step()
+        elif isinstance(item, list):
+            self._gather(item, callback)
+        elif isinstance(item, Once):
+            self._start_once(item.key, lambda done: self._start(item.factory(), done), callback)
+        elif isinstance(item, Shared):
+            url = str(item)
+            self._start_once(url, lambda done: self._fetch(url, done), callback)
+        elif isinstance(item, basestring):
+            self._fetch(str(item), callback)
+        else:
+            callback(None, (TypeError, TypeError("cannot wait for %r" % (item,)), None))
+
+    def _gather(self, items, callback):
+        if not items:
+            return callback([], None)
+        results = [None] * len(items)
+        state = {'remaining': len(items), 'error': None}
+        def collect(index):
+            def done(value, error):
+                results[index] = value
+                if error is not None and state['error'] is None:
+                    state['error'] = error
+                state['remaining'] -= 1
+                if state['remaining'] == 0:
+                    callback(results if state['error'] is None else None, state['error'])
+            return done
+        for index, item in enumerate(items):
+            self._start(item, collect(index))
+
+    def _start_once(self, key, start, callback):
+        entry = self._shared.get(key)
+        if entry is None:
+            entry = self._shared[key] = {'done': False, 'waiting': [callback]}
+            def done(value, error):
+                entry['done'] = True
+                entry['result'] = (value, error)
+                waiting, entry['waiting'] = entry['waiting'], []
+                for waiter in waiting:
+                    waiter(value, error)
+            start(done)
+        elif entry['done']:
+            self.counters['shared_hits'] += 1
+            callback(*entry['result'])
+        else:
+            self.counters['shared_hits'] += 1
+            entry['waiting'].append(callback)
+
+    # HTTP engine
+
+    def _fetch(self, url, callback):
+        self._requeue(_Request(url, callback))
+
+    def _requeue(self, request):
+        key = (request.scheme, request.host, request.port)
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _Host(key, self.rate)
+            # The lookup blocks, so it is made once per host, as its first request is queued:
+            # for the hosts of the spawned requests that is before run() starts the loop
+            try:
+                host.resolve()
+            except socket.error:
+                # Tried again, and reported to the request, when a connection is opened
+                pass
+        host.pending.append(request)
+
+    def _dispatch(self):
+        now = time.time()
+        for host in self._hosts.values():
+            # Requests for endpoints the scheduler holds back keep their place
+            # in the queue while requests for other endpoints go ahead
+            deferred = []
+            blocked = set()
+            while host.pending and self.in_flight < self.max_in_flight:
+                if not host.idle and host.connections >= self.connections_per_host:
+                    break
+                wait = host.take_token(now)
+                if wait:
+                    heapq.heappush(self._timers, now + wait)
+                    break
+                request = host.pending.popleft()
+                if self.scheduler is not None:
+                    if request.endpoint in blocked:
+                        deferred.append(request)
+                        continue
+                    wait = self.scheduler.try_acquire(request.endpoint, now)
+                    if wait:
+                        heapq.heappush(self._timers, now + wait)
+                        blocked.add(request.endpoint)
+                        deferred.append(request)
+                        continue
+                request.started = now
+                try:
+                    if host.idle:
+                        conn = host.idle.pop()
+                    else:
+                        conn = _Connection(self, host)
+                        host.connections += 1
+                        self._connections.add(conn)
+                except socket.error:
+                    error = sys.exc_info()
+                    self._settle(request, False)
+                    if not self._retry(request):
+                        self._callback(request.callback, None, error)
+                    continue
+                self.in_flight += 1
+                self.counters['requests'] += 1
+                conn.start(request)
+            host.pending.extendleft(reversed(deferred))
+
+    def _poll(self):
+        now = time.time()
+        while self._timers and self._timers[0] <= now:
+            heapq.heappop(self._timers)
+        while self._delayed and self._delayed[0][0] <= now:
+            self._requeue(heapq.heappop(self._delayed)[1])
+        timeout = 1.0
+        if self._timers:
+            timeout = max(0, min(timeout, self._timers[0] - now))
+        readers = [conn for conn in self._connections if conn.wants_read()]
+        writers = [conn for conn in self._connections if conn.wants_write()]
+        if not readers and not writers:
+            if self._timers:
+                time.sleep(timeout)
+            return
+        try:
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for conn in writable:
+            self._handle(conn, conn.on_writable)
+        for conn in readable:
+            if conn in self._connections:
+                self._handle(conn, conn.on_readable)
+        now = time.time()
+        for conn in list(self._connections):
+            if conn.deadline is not None and conn.deadline < now:
+                request = conn.request
+                self._drop(conn)
+                self.in_flight -= 1
+                self._settle(request, False)
+                if not self._retry(request):
+                    self._callback(request.callback, None, (socket.timeout, socket.timeout('timed out: %s' % request.url), None))
+
+    def _handle(self, conn, handler):
+        try:
+            handler()
+        except (socket.error, ssl.SSLError, ValueError):
+            error = sys.exc_info()
+            request = conn.request
+            self._drop(conn)
+            if request is not None:
+                self.in_flight -= 1
+                self._settle(request, False)
+                # Malformed responses (ValueError) are not worth another try
+                if not (isinstance(error[1], socket.error) and self._retry(request)):
+                    self._callback(request.callback, None, error)
+
+    def _release(self, conn):
+        conn.host.idle.append(conn)
+
+    def _drop(self, conn):
+        if conn in self._connections:
+            self._connections.discard(conn)
+            conn.host.connections -= 1
+            if conn in conn.host.idle:
+                conn.host.idle.remove(conn)
+        conn.close()
+
+    def _settle(self, request, ok):
+        """Tell the scheduler how a request went; ok None means it was abandoned unanswered"""
+        if self.scheduler is not None:
+            latency = None if ok is None else time.time() - request.started
+            self.scheduler.release(request.endpoint, latency, ok)
+
+    def _retry(self, request):
+        """Queue a failed request again after the scheduler's backoff; False when out of retries"""
+        if self.scheduler is None or request.retries >= self.scheduler.max_retries:
+            return False
+        request.retries += 1
+        request.attempts = 0
+        self.scheduler.count_retry(request.endpoint)
+        when = time.time() + self.scheduler.backoff(request.retries)
+        heapq.heappush(self._delayed, (when, request))
+        heapq.heappush(self._timers, when)
+        return True
+
+    def _complete(self, request, status, headers, body):
+        overloaded = status >= 500 or status == 429
+        self._settle(request, not overloaded)
+        if overloaded and self._retry(request):
+            return
+        if status in (301, 302, 303, 307, 308) and 'location' in headers and request.redirects < MAX_REDIRECTS:
+            self.counters['redirects'] += 1
+            redirect = _Request(headers['location'], request.callback)
+            redirect.redirects = request.redirects + 1
+            return self._requeue(redirect)
+        if status < 200 or status >= 300:
+            return self._callback(request.callback, None, (HTTPError, HTTPError(request.url, status, body), None))
+        try:
+            value = json.loads(body) if body else None
+        except ValueError:
+            return self._callback(request.callback, None, sys.exc_info())
+        self._callback(request.callback, value, None)
+
+    def _callback(self, callback, value, error):
+        callback(value, error)
+
+class _Task(object):
+    """Drives one generator coroutine"""
+
+    def __init__(self, client, gen, callback):
+        self.client = client
+        self.gen = gen
+        self.callback = callback
+
+    def step(self, value=None, error=None):
+        # Results that are already available (shared documents, None links) come
+        # back while _start is still running; loop on them instead of recursing
+        while True:
+            try:
+                if error is not None:
+                    waiting_for = self.gen.throw(error[0], error[1], error[2])
+                else:
+                    waiting_for = self.gen.send(value)
+            except Return as r:
+                return self.callback(r.value, None)
+            except StopIteration:
+                return self.callback(None, None)
+            except Exception:
+                return self.callback(None, sys.exc_info())
+            self._ready = None
+            self._starting = True
+            self.client._start(waiting_for, self._resume)
+            self._starting = False
+            if self._ready is None:
+                return
+            value, error = self._ready
+
+    def _resume(self, value, error):
+        if self._starting:
+            self._ready = (value, error)
+        else:
+            self.step(value, error)
+
+# The bug hydration graph
+
+def get_collection(link, loads=None):
+    """Return every entry of a collection, following next_collection_link.
+    loads, a one-item list, is incremented for every page fetched."""
+    entries = []
+    while link:
+        page = yield link
+        if loads is not None:
+            loads[0] += 1
+        entries.extend(page.get('entries', []))
+        link = page.get('next_collection_link')
+    raise Return(entries)
+
+def preview_diff(link, immutable=None, loads=None):
+    """Fetch the preview diff at link (None for no link) as an lpimmutable.preview_record.
+    Preview diffs never change: with immutable (an lpimmutable.ImmutableStore) each is
+    fetched only once."""
+    if not link:
+        raise Return(None)
+    record = immutable.get(link) if immutable is not None else None
+    if record is None:
+        preview = yield link
+        loads[0] += 1
+        if not preview:
+            raise Return(None)
+        record = lpimmutable.preview_record(link, preview.get('diffstat') or {})
+        if immutable is not None:
+            immutable.put_preview(record)
+    raise Return(record)
+
+def branch_proposals(branch_link, immutable=None, loads=None):
+    """Fetch a branch, its landing targets and all their preview diffs at once; returns
+    [(lpimmutable.proposal_record, preview_record or None)]"""
+    branch = yield branch_link
+    loads[0] += 1
+    # The collection entries already are the merge proposals' representations. A merged
+    # one is kept in immutable and read back from there, as the threaded path does
+    targets = yield get_collection(branch.get('landing_targets_collection_link'), loads)
+    proposals = []
+    for target in targets:
+        record = immutable.get(target['self_link']) if immutable is not None else None
+        if record is None:
+            record = lpimmutable.proposal_from_json(target)
+            if immutable is not None:
+                immutable.put_proposal(record)
+        proposals.append(record)
+    previews = yield [preview_diff(proposal['preview_diff_link'], immutable, loads) for proposal in proposals]
+    raise Return(zip(proposals, previews))
+
+def hydrate_bug(task, immutable=None):
+    """Fetch the part of a task that belongs to its bug: the bug, its users affected and
+    linked branches, and the merge proposals and preview diffs of every branch. The branches
+    are followed concurrently, so a fix spread over several takes as many round trips as one.
+
+    Also returns the number of loads it took and the task it was fetched for."""
+    loads = [1]
+    bug = yield task['bug_link']
+    users, branches = yield [get_collection(bug.get('users_affected_collection_link'), loads),
+                             get_collection(bug.get('linked_branches_collection_link'), loads)]
+    per_branch = yield [branch_proposals(branch['branch_link'], immutable, loads) for branch in branches]
+    raise Return({'bug': bug, 'users': users, 'branches': branches,
+                  'proposals': [pair for pairs in per_branch for pair in pairs],
+                  'loads': loads[0], 'first_task': task['self_link']})
+
+def hydrate_task(task, immutable=None):
+    """Fetch everything bugseeker.Bug needs for one bug task.
+
+    People and milestones are Shared: the first task to need one fetches it
+    and every other task waits for (or reuses) that result. So is the bug-level
+    part, keyed by bug: a bug with tasks in several projects is hydrated once.
+    parts['reused'] tells whether this task got a bug hydrated for another one."""
+    bug_parts, owner, assignee, milestone = yield [
+        Once(('bug', task['bug_link']), lambda: hydrate_bug(task, immutable)),
+        task.get('owner_link') and Shared(task['owner_link']),
+        task.get('assignee_link') and Shared(task['assignee_link']),
+        task.get('milestone_link') and Shared(task['milestone_link'])]
+    parts = dict(bug_parts, task=task, owner=owner, assignee=assignee, milestone=milestone)
+    parts['reused'] = bug_parts['first_task'] != task['self_link']
+    raise Return(parts)
+
+def hydrate(client, first_page, build=None, on_result=None, on_page=None, skip=None, immutable=None):
+    """Hydrate every task of a searchTasks collection, starting from its first page.
+
+    Pages are followed in the background while the tasks already seen are being
+    hydrated. build(parts) turns the dict returned by hydrate_task into a record
+    (default: the dict itself) and on_result(record) is called as each one
+    completes. on_page(tasks, next_link) is called as each page arrives, and
+    tasks for which skip(task) is true are not hydrated. Preview diffs already in
+    immutable (an lpimmutable.ImmutableStore) are not fetched. Returns the records
+    in collection order."""
+    records = spawn_hydration(client, first_page, build, on_result, on_page, skip, immutable)
+    client.run()
+    return records
+
+def spawn_hydration(client, first_page, build=None, on_result=None, on_page=None, skip=None, immutable=None):
+    """Like hydrate, but only starts the work: the returned list fills in during the next
+    client.run(). Several collections (e.g. one per project) can be hydrated in one run."""
+    records = []
+    def store(index):
+        def done(parts, error):
+            if error is not None:
+                client._errors.append(error)
+                return
+            records[index] = build(parts) if build is not None else parts
+            if on_result is not None:
+                on_result(records[index])
+        return done
+    def walk_pages():
+        page = first_page
+        while True:
+            if on_page is not None:
+                on_page(page.get('entries', []), page.get('next_collection_link'))
+            for task in page.get('entries', []):
+                if skip is not None and skip(task):
+                    continue
+                records.append(None)
+                client.spawn(hydrate_task(task, immutable), store(len(records) - 1))
+            link = page.get('next_collection_link')
+            if not link:
+                break
+            page = yield link
+    client.spawn(walk_pages())
+    return records
@@ -0,0 +1,114 @@
+"""Checkpoint log that lets an interrupted bugseeker run resume where it stopped
+
+The log is an append-only file of JSON lines:
+
+    {"query": {...}}                    first line: the search the run answers
+    {"task": "<task link>", "bug": {}}  one per hydrated bug
+    {"cursor": "<page link>"}           every page before this link is complete
+
+Bugs are written as they are hydrated and flushed line by line; the file is
+fsynced whenever the cursor moves. A cursor line is only written once every
+bug of every earlier page is in the log, so resuming from the last cursor and
+skipping the bugs already logged loses and repeats nothing, whether pages are
+finished in order (worker threads) or out of order (lpasync).
+"""
+
+import json
+import os
+
+class CheckpointMismatch(Exception):
+    """The log on disk was written for a different search"""
+
+class Checkpoint(object):
+    """Records a run's progress in path and reads back what a previous run logged.
+
+    records holds the bug records restored from the log, in the order they were
+    logged, cursor the link of the first page that still needs work (None to
+    start at the beginning)."""
+
+    def __init__(self, path, query, resume=False):
+        self.path = path
+        self.query = query
+        self.records = []
+        self.cursor = None
+        self._done = set()
+        self._pages = []
+        offset = 0
+        if resume and os.path.exists(path):
+            offset = self._load()
+        if offset:
+            self._log = open(path, 'r+b')
+            # Drop a line cut short by the crash before appending after it
+            self._log.truncate(offset)
+            self._log.seek(offset)
+        else:
+            self._log = open(path, 'wb')
+            self._write({'query': query}, sync=True)
+
+    def _load(self):
+        """Read the log; returns the offset just past the last complete line (0 for an unusable log)"""
+        f = open(self.path, 'rb')
+        offset = 0
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if offset == 0:
+                    if entry.get('query') != self.query:
+                        raise CheckpointMismatch("%s was written for %s, not %s" % (self.path, entry.get('query'), self.query))
+                elif 'cursor' in entry:
+                    self.cursor = entry['cursor']
+                elif entry['task'] not in self._done:
+                    self._done.add(entry['task'])
+                    self.records.append(entry['bug'])
+                offset += len(line)
+        finally:
+            f.close()
+        return offset
+
+    def _write(self, entry, sync=False):
+        self._log.write(json.dumps(entry) + '\n')
+        self._log.flush()
+        if sync:
+            os.fsync(self._log.fileno())
+
+    def is_done(self, task_link):
+        """True when the bug of this task was hydrated by an earlier run"""
+        return str(task_link) in self._done
+
+    def add_page(self, task_links, next_link):
+        """Register a page about to be hydrated: the tasks on it and the link of the page after it"""
+        pending = set(str(link) for link in task_links) - self._done
+        self._pages.append([next_link, pending])
+        self._advance()
+
+    def add(self, task_link, record):
+        """Log one hydrated bug record (a JSON-serializable dict)"""
+        task_link = str(task_link)
+        self._done.add(task_link)
+        self._write({'task': task_link, 'bug': record})
+        for page in self._pages:
+            page[1].discard(task_link)
+        self._advance()
+
+    def _advance(self):
+        moved = False
+        while self._pages and not self._pages[0][1]:
+            next_link = self._pages.pop(0)[0]
+            if next_link is None:
+                # The last page: nothing left to resume from
+                break
+            self.cursor = next_link
+            moved = True
+        if moved:
+            self._write({'cursor': self.cursor}, sync=True)
+
+    def close(self, remove=False):
+        """Close the log, deleting it when the run it records has finished"""
+        self._log.close()
+        if remove:
+            os.remove(self.path)
@@ -0,0 +1,267 @@
+"""Append-only columnar store of every bug of every run
+
+Analyses across projects and years otherwise load each run's spreadsheet (or
+data files) into Python lists. ColumnStore keeps the bugs of all runs in one
+directory of column files instead, one file per column, read back as NumPy
+arrays mapped straight from disk: opening the store reads nothing but its
+small meta.json, and an analysis only pages in the columns it touches.
+
+Two tables: 'bugs', one row per bug of each run and project, and 'files', one
+row per file a bug's merge modified (the row of its bug, the path and its
+lines added and removed). Numbers and dates (seconds since the epoch) are
+fixed-width little-endian integers, MISSING where the bug has none. Strings
+(run, project, status, people, milestone, path) are dictionary encoded: the
+column holds int32 codes into a list of the distinct values, kept in a
+<column>.dict file of JSON strings, one per line.
+
+bugseeker.py appends each run's bugs once the run is complete. Appending
+writes at the end of every file and only then records the new row counts in
+meta.json (renamed over the old one); readers never see more rows than
+meta.json lists, and the next append truncates whatever an interrupted one
+left behind. Nothing already written is ever rewritten.
+
+    store = ColumnStore('/var/lib/jenkins/LPReports/.columns')
+    status = store.column('bugs', 'status')        # numpy.memmap of int32 codes
+    counts = numpy.bincount(status)                 # bugs per status, all runs
+    names = store.dictionary('bugs', 'status')      # code -> status
+
+Usage: python lpcolumns.py <store> [runs|stats]
+
+Dependent Packages: numpy
+"""
+
+from optparse import OptionParser
+import fcntl
+import json
+import os
+import sys
+import time
+
+import numpy
+
+VERSION = 1
+META = 'meta.json'
+LOCK = '.lock'
+# Code of a dictionary-encoded column, as opposed to a numpy dtype
+DICT = 'dict'
+CODE = numpy.dtype('<i4')
+MISSING = -1
+
+TABLES = {
+    'bugs': (('run', DICT), ('project', DICT), ('id', '<i8'), ('status', DICT), ('importance', DICT),
+             ('owner', DICT), ('fixed_by', DICT), ('milestone', DICT), ('date_created', '<i8'),
+             ('date_fix_committed', '<i8'), ('date_fix_released', '<i8'), ('date_merged', '<i8'),
+             ('merged_revno', '<i8'), ('users_affected_count', '<i4'), ('number_of_branches', '<i4'),
+             ('num_files_modified', '<i4'), ('lines_added', '<i4'), ('lines_removed', '<i4')),
+    'files': (('bug', '<i8'), ('path', DICT), ('lines_added', '<i4'), ('lines_removed', '<i4')),
+}
+
+def _number(value):
+    """value as an integer, MISSING for None and 'N/A'"""
+    if value is None or value == 'N/A':
+        return MISSING
+    return int(value)
+
+def bug_row(bug_obj):
+    """{column: value} of the bugs table for a BugRecord, but for run and project"""
+    added, removed = bug_obj.lines_added, bug_obj.lines_removed
+    return {'id': bug_obj.id, 'status': bug_obj.status, 'importance': bug_obj.importance, 'owner': bug_obj.owner,
+            'fixed_by': bug_obj.fixed_by, 'milestone': bug_obj.milestone,
+            'date_created': _number(bug_obj.date_created), 'date_fix_committed': _number(bug_obj.date_fix_committed),
+            'date_fix_released': _number(bug_obj.date_fix_released), 'date_merged': _number(bug_obj.date_merged),
+            'merged_revno': _number(bug_obj.merged_revno), 'users_affected_count': _number(bug_obj.users_affected_count),
+            'number_of_branches': _number(bug_obj.number_of_branches),
+            'num_files_modified': _number(bug_obj.num_files_modified), 'lines_added': sum(added),
+            'lines_removed': sum(removed)}
+
+class ColumnStore(object):
+    """The column files under root, created on first append"""
+
+    def __init__(self, root):
+        self.root = root
+        self.meta = self._read_meta()
+        self._dictionaries = {}
+
+    def _read_meta(self):
+        try:
+            f = open(os.path.join(self.root, META), 'rb')
+        except IOError:
+            return {'version': VERSION, 'rows': dict((table, 0) for table in TABLES), 'dictionaries': {}, 'runs': []}
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+
+    def _path(self, table, name, suffix=''):
+        return os.path.join(self.root, table, name + suffix)
+
+    def rows(self, table='bugs'):
+        return self.meta['rows'][table]
+
+    def runs(self):
+        """[{'run', 'project', 'bugs': [start, stop], 'files': [start, stop], 'time'}] in the order appended"""
+        return self.meta['runs']
+
+    def column(self, table, name):
+        """The committed values of a column as a read-only array mapped from its file: codes for a
+        dictionary-encoded column. Nothing is read until the array is used."""
+        dtype = dict(TABLES[table])[name]
+        dtype = CODE if dtype == DICT else numpy.dtype(dtype)
+        rows = self.rows(table)
+        if rows == 0:
+            return numpy.zeros(0, dtype)
+        return numpy.memmap(self._path(table, name), dtype=dtype, mode='r', shape=(rows,))
+
+    def dictionary(self, table, name):
+        """The values of a dictionary-encoded column, by code"""
+        key = '%s/%s' % (table, name)
+        entries = self.meta['dictionaries'].get(key, {'entries': 0})['entries']
+        cached = self._dictionaries.get(key)
+        if cached is None or len(cached) < entries:
+            cached = []
+            if entries:
+                f = open(self._path(table, name, '.dict'), 'rb')
+                try:
+                    for line in f:
+                        cached.append(json.loads(line))
+                        if len(cached) == entries:
+                            break
+                finally:
+                    f.close()
+            self._dictionaries[key] = cached
+        return cached[:entries]
+
+    def code(self, table, name, value):
+        """The code of value in a dictionary-encoded column, or None when no row holds it"""
+        try:
+            return self.dictionary(table, name).index(value)
+        except ValueError:
+            return None
+
+    def decode(self, table, name, start=0, stop=None):
+        """The values of rows start to stop of a dictionary-encoded column, as an object array"""
+        return numpy.array(self.dictionary(table, name), dtype=object)[self.column(table, name)[start:stop]]
+
+    def run_rows(self, run, table='bugs'):
+        """(start, stop) rows of table holding the bugs of run, over all its projects; runs are
+        appended whole, so they are contiguous. None if the run is not in the store."""
+        spans = [entry[table] for entry in self.meta['runs'] if entry['run'] == run]
+        if not spans:
+            return None
+        return min(start for start, stop in spans), max(stop for start, stop in spans)
+
+    def append(self, run, project, bug_list):
+        """Add the bugs of one project of a run at the end of both tables"""
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        lock = open(os.path.join(self.root, LOCK), 'ab')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have appended since this store was opened
+            self.meta = self._read_meta()
+            bugs_start, files_start = self.rows('bugs'), self.rows('files')
+            bugs = dict((name, []) for name, dtype in TABLES['bugs'])
+            files = dict((name, []) for name, dtype in TABLES['files'])
+            for i, bug_obj in enumerate(bug_list):
+                row = bug_row(bug_obj)
+                row['run'], row['project'] = run, project
+                for name, values in bugs.items():
+                    values.append(row[name])
+                for path, added, removed in bug_obj.modifications():
+                    files['bug'].append(bugs_start + i)
+                    files['path'].append(path)
+                    files['lines_added'].append(added)
+                    files['lines_removed'].append(removed)
+            self._write_table('bugs', bugs)
+            self._write_table('files', files)
+            meta = dict(self.meta)
+            meta['rows'] = {'bugs': bugs_start + len(bug_list), 'files': files_start + len(files['bug'])}
+            meta['runs'] = self.meta['runs'] + [{'run': run, 'project': project, 'time': int(time.time()),
+                                                  'bugs': [bugs_start, meta['rows']['bugs']],
+                                                  'files': [files_start, meta['rows']['files']]}]
+            self._write_meta(meta)
+            self.meta = meta
+        finally:
+            lock.close()
+
+    def _write_table(self, table, columns):
+        directory = os.path.join(self.root, table)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        rows = self.rows(table)
+        for name, dtype in TABLES[table]:
+            values = columns[name]
+            if dtype == DICT:
+                values = self._encode(table, name, values)
+                dtype = CODE
+            self._append_file(self._path(table, name), rows * numpy.dtype(dtype).itemsize,
+                              numpy.asarray(values, dtype=dtype).tostring())
+
+    def _encode(self, table, name, values):
+        """Codes of values, adding the values not seen before to the column's dictionary"""
+        key = '%s/%s' % (table, name)
+        known = self.meta['dictionaries'].get(key, {'entries': 0, 'bytes': 0})
+        dictionary = self.dictionary(table, name)
+        codes = dict((value, code) for code, value in enumerate(dictionary))
+        new = []
+        result = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+                new.append(value)
+            result.append(code)
+        if new:
+            data = ''.join(json.dumps(value) + '\n' for value in new)
+            self._append_file(self._path(table, name, '.dict'), known['bytes'], data)
+            dictionary.extend(new)
+            self._dictionaries[key] = dictionary
+            self.meta['dictionaries'][key] = {'entries': len(codes), 'bytes': known['bytes'] + len(data)}
+        return result
+
+    def _append_file(self, path, committed, data):
+        """Write data after the first committed bytes of the file at path, dropping anything an
+        interrupted append left after them"""
+        f = open(path, 'ab')
+        try:
+            if os.fstat(f.fileno()).st_size != committed:
+                f.truncate(committed)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+    def _write_meta(self, meta):
+        path = os.path.join(self.root, META)
+        temp = '%s.%s.tmp' % (path, os.getpid())
+        out = open(temp, 'wb')
+        try:
+            json.dump(meta, out)
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            out.close()
+        os.rename(temp, path)
+
+def main():
+    parser = OptionParser(usage="usage: %prog store [runs|stats]")
+    (options, args) = parser.parse_args()
+    if len(args) not in (1, 2) or args[1:] not in ([], ['runs'], ['stats']):
+        sys.exit(parser.print_usage())
+    store = ColumnStore(args[0])
+    if args[1:] == ['runs']:
+        for entry in store.runs():
+            print "%(run)s %(project)s: bugs %(bugs)s, files %(files)s" % entry
+        return
+    start = time.time()
+    status = store.column('bugs', 'status')
+    counts = numpy.bincount(status, minlength=len(store.dictionary('bugs', 'status')))
+    print "%s bugs and %s file modifications over %s runs" % (store.rows('bugs'), store.rows('files'),
+                                                              len(set(entry['run'] for entry in store.runs())))
+    for name, n in sorted(zip(store.dictionary('bugs', 'status'), counts), key=lambda item: -item[1]):
+        print "  %-15s %s" % (name, n)
+    print "(%.3f seconds)" % (time.time() - start)
+
+if __name__ == '__main__':
+    main()
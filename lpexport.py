@@ -0,0 +1,118 @@
+"""Streaming CSV, TSV and JSON Lines export of hydrated bugs
+
+bugseeker.py --format csv|tsv|jsonl hands every bug to an Exporter as soon as
+it is hydrated, so the export grows while the run is in progress instead of
+appearing, like the spreadsheet, once every bug has been loaded. Other tools
+can read it without xlrd.
+
+csv and tsv have one row per bug under a header row. Fields holding a
+separator, a quote or a line break are quoted (the csv module's 'excel' and
+'excel-tab' dialects); the files modified and their lines added and removed
+are JSON arrays in parallel columns, so a path may hold any character. Dates
+are ISO 8601 in UTC. jsonl has one BugRecord.to_record() per line, the format
+of bugseeker's data files.
+
+Output is flushed at least every FLUSH_INTERVAL seconds, so a reader sees
+the bugs hydrated up to a second ago. With compress the export is gzipped as
+it is written.
+
+Dependent Packages: none (csv, gzip and json from the standard library)
+"""
+
+import csv
+import gzip
+import json
+import re
+import time
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+FLUSH_INTERVAL = 1.0
+
+COLUMNS = ('id', 'title', 'owner', 'status', 'importance', 'date_created', 'date_fix_committed', 'date_fix_released',
+           'milestone', 'fixed_by', 'users_affected_count', 'users_affected', 'merged_revno', 'date_merged',
+           'has_multiple_branches', 'number_of_branches', 'num_files_modified', 'files_modified', 'lines_added',
+           'lines_removed', 'preview_diff_link', 'lp_link')
+DATES = ('date_created', 'date_fix_committed', 'date_fix_released', 'date_merged')
+
+def export_name(base, fmt, compress=False):
+    """The file name of an export of fmt: base plus its extensions"""
+    return '%s.%s%s' % (base, fmt, '.gz' if compress else '')
+
+def _iso_date(value):
+    if value is None:
+        return ''
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(value))
+
+def _field(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+# Characters a JSON string has to escape
+_JSON_ESCAPED = re.compile(u'["\\\\\x00-\x1f]')
+
+def _strings(values):
+    """A JSON array of strings; paths rarely need escaping, so most are joined as they are"""
+    if any(_JSON_ESCAPED.search(value) for value in values):
+        return json.dumps(values, ensure_ascii=False)
+    return u'[%s]' % u', '.join(u'"%s"' % value for value in values)
+
+def _numbers(values):
+    """A JSON array of integers"""
+    return '[%s]' % ', '.join(map(str, values))
+
+def row(bug_obj):
+    """The csv/tsv fields of a BugRecord, as UTF-8 strings in COLUMNS order"""
+    modifications = bug_obj.modifications()
+    files, added, removed = zip(*modifications) if modifications else ((), (), ())
+    lists = {'files_modified': _field(_strings(files)), 'lines_added': _numbers(added),
+             'lines_removed': _numbers(removed)}
+    fields = []
+    for name in COLUMNS:
+        if name in lists:
+            fields.append(lists[name])
+        elif name in DATES:
+            fields.append(_iso_date(getattr(bug_obj, name)))
+        else:
+            fields.append(_field(getattr(bug_obj, name)))
+    return fields
+
+class Exporter(object):
+    """Writes BugRecords to path in fmt (one of FORMATS) as they are given. Not thread safe:
+    each export is written from one thread."""
+
+    def __init__(self, path, fmt, compress=False):
+        if fmt not in FORMATS:
+            raise ValueError("unknown export format %r" % fmt)
+        self.path = path
+        self.format = fmt
+        self.count = 0
+        if compress:
+            self.out = gzip.GzipFile(path, 'wb', compresslevel=6)
+        else:
+            self.out = open(path, 'wb')
+        self._last_flush = 0
+        self.writer = None
+        if fmt != 'jsonl':
+            self.writer = csv.writer(self.out, dialect='excel-tab' if fmt == 'tsv' else 'excel', lineterminator='\n')
+            self.writer.writerow(COLUMNS)
+
+    def write(self, bug_obj):
+        if self.writer is not None:
+            self.writer.writerow(row(bug_obj))
+        else:
+            self.out.write(json.dumps(bug_obj.to_record()) + '\n')
+        self.count += 1
+        now = time.time()
+        if now - self._last_flush >= FLUSH_INTERVAL:
+            self.out.flush()
+            self._last_flush = now
+
+    def write_many(self, bug_list):
+        for bug_obj in bug_list:
+            self.write(bug_obj)
+
+    def close(self):
+        self.out.close()
@@ -0,0 +1,362 @@
+"""HTTP transport used by bugseeker to talk to the Launchpad API
+
+launchpadlib builds its httplib2.Http object through Launchpad.httpFactory.
+PooledHttpMixin can be mixed into that class (or into plain httplib2.Http) so
+that all threads share one bounded pool of keep-alive connections per host
+instead of each Http object holding a single connection that is torn down and
+set up again whenever it is used from another thread.
+
+BoundedFileCache is the on-disk response cache handed to launchpadlib. httplib2
+revalidates its entries with If-None-Match/If-Modified-Since, so a warm cache
+turns most loads into 304s or local hits; the cache keeps itself under a size
+limit by evicting the least recently used entries, and counts what happened.
+
+Dependent Packages: httplib2, lazr.restfulclient (installed with launchpadlib)
+"""
+
+import httplib
+import os
+import socket
+import threading
+import time
+
+from lazr.restfulclient._browser import MultipleRepresentationCache
+import httplib2
+import lpscheduler
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+class ConnectionPool(object):
+    """A bounded set of keep-alive connections per host, shared between threads
+
+    At most maxsize connections are open per host; a thread asking for a
+    connection while all of them are busy waits for one to be released.
+    Counts the connections opened and the requests sent over them.
+    """
+
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE):
+        self.maxsize = maxsize
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._allocated = {}
+        self._local = threading.local()
+
+    def acquire(self, key):
+        """Return an idle connection for key, or None when the caller should open one"""
+        self._cond.acquire()
+        try:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop()
+                if self._allocated.get(key, 0) < self.maxsize:
+                    self._allocated[key] = self._allocated.get(key, 0) + 1
+                    return None
+                self._cond.wait()
+        finally:
+            self._cond.release()
+
+    def release(self, key, conn):
+        """Give a connection back so another request can reuse it"""
+        self._cond.acquire()
+        try:
+            self._idle.setdefault(key, []).append(conn)
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def discard(self, key, conn=None):
+        """Forget a connection (or an unused slot handed out by acquire)"""
+        if conn is not None:
+            conn.close()
+        self._cond.acquire()
+        try:
+            self._allocated[key] = self._allocated.get(key, 1) - 1
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def count_connection(self):
+        self._cond.acquire()
+        try:
+            self.connections_opened += 1
+        finally:
+            self._cond.release()
+
+    def count_request(self):
+        self._local.requests = getattr(self._local, 'requests', 0) + 1
+        self._cond.acquire()
+        try:
+            self.requests_sent += 1
+        finally:
+            self._cond.release()
+
+    def thread_requests(self):
+        """Requests sent so far by the calling thread"""
+        return getattr(self._local, 'requests', 0)
+
+    def idle_connections(self):
+        self._cond.acquire()
+        try:
+            return [conn for conns in self._idle.values() for conn in conns]
+        finally:
+            self._cond.release()
+
+    def close(self):
+        """Close every idle connection"""
+        self._cond.acquire()
+        try:
+            for key, conns in self._idle.items():
+                for conn in conns:
+                    conn.close()
+                self._allocated[key] = self._allocated.get(key, 0) - len(conns)
+            self._idle.clear()
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        return {'connections_opened': self.connections_opened, 'requests_sent': self.requests_sent}
+
+class BoundedFileCache(MultipleRepresentationCache):
+    """A launchpadlib response cache keyed by resource URL, bounded to max_bytes on disk
+
+    Entries are evicted least recently used first once the cache grows past
+    max_bytes. Safe to share between threads: the media type launchpadlib sets
+    before each request is kept per thread.
+    """
+
+    def __init__(self, cache, max_bytes=DEFAULT_CACHE_SIZE):
+        super(BoundedFileCache, self).__init__(cache)
+        self.max_bytes = max_bytes
+        self.stats = {'lookups': 0, 'hits': 0, 'conditional_requests': 0, 'not_modified': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._size = 0
+        for name in os.listdir(self._cache_dir):
+            if name.startswith(self.TEMPFILE_PREFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self._cache_dir, name))
+            except OSError:
+                continue
+            self._entries[name] = [st.st_size, st.st_atime]
+            self._size += st.st_size
+
+    def _get_request_media_type(self):
+        return getattr(self._local, 'media_type', None)
+
+    def _set_request_media_type(self, value):
+        if not hasattr(self, '_local'):
+            self._local = threading.local()
+        self._local.media_type = value
+
+    request_media_type = property(_get_request_media_type, _set_request_media_type)
+
+    def count(self, name):
+        self._lock.acquire()
+        self.stats[name] += 1
+        self._lock.release()
+
+    def get(self, key):
+        value = super(BoundedFileCache, self).get(key)
+        name = os.path.basename(self._get_key_path(key))
+        self._lock.acquire()
+        try:
+            self.stats['lookups'] += 1
+            if value is not None:
+                self.stats['hits'] += 1
+                if name in self._entries:
+                    self._entries[name][1] = time.time()
+        finally:
+            self._lock.release()
+        return value
+
+    def set(self, key, value):
+        super(BoundedFileCache, self).set(key, value)
+        name = os.path.basename(self._get_key_path(key))
+        self._lock.acquire()
+        try:
+            self.stats['stores'] += 1
+            old = self._entries.get(name)
+            if old is not None:
+                self._size -= old[0]
+            self._entries[name] = [len(value), time.time()]
+            self._size += len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        super(BoundedFileCache, self).delete(key)
+        name = os.path.basename(self._get_key_path(key))
+        self._lock.acquire()
+        try:
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self._size -= old[0]
+        finally:
+            self._lock.release()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes"""
+        target = self.max_bytes * 0.9
+        for name, entry in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._size <= target:
+                break
+            try:
+                os.remove(os.path.join(self._cache_dir, name))
+            except OSError:
+                pass
+            del self._entries[name]
+            self._size -= entry[0]
+            self.stats['evictions'] += 1
+
+    def size(self):
+        return self._size
+
+    def summary(self):
+        """One line description of the cache statistics for the end of run report"""
+        stats = self.stats
+        local_hits = stats['hits'] - stats['conditional_requests']
+        return "%s lookups, %s served locally, %s revalidated (%s not modified), %s stored, %s evicted, %.1f MB on disk" % (
+            stats['lookups'], max(local_hits, 0), stats['conditional_requests'], stats['not_modified'],
+            stats['stores'], stats['evictions'], self._size / (1024.0 * 1024.0))
+
+class PooledConnections(object):
+    """Stand-in for the httplib2.Http.connections dict backed by a ConnectionPool
+
+    httplib2 looks a connection up by 'scheme:authority', creates one when the
+    lookup fails and stores it back. Here the lookup checks a connection out of
+    the pool for the calling thread; it is returned when the outermost request
+    made by that thread finishes (see enter/leave).
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._local = threading.local()
+
+    def _held(self):
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = {}
+            self._local.depth = 0
+        return held
+
+    def enter(self):
+        self._held()
+        self._local.depth += 1
+
+    def busy(self):
+        """True while the calling thread is inside a request, e.g. when httplib2 follows a redirect"""
+        self._held()
+        return self._local.depth > 0
+
+    def leave(self):
+        held = self._held()
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        for key, conn in held.items():
+            if conn is None:
+                self.pool.discard(key)
+            else:
+                self.pool.release(key, conn)
+        held.clear()
+
+    def get(self, key, default=None):
+        held = self._held()
+        if key not in held:
+            held[key] = self.pool.acquire(key)
+        conn = held[key]
+        if conn is None:
+            return default
+        return conn
+
+    def __getitem__(self, key):
+        conn = self.get(key)
+        if conn is None:
+            raise KeyError(key)
+        return conn
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, conn):
+        # Count every (re)connect, including the ones httplib2 makes by itself
+        # after the server dropped an idle keep-alive connection
+        connect = conn.connect
+        pool = self.pool
+        def counted_connect():
+            pool.count_connection()
+            return connect()
+        conn.connect = counted_connect
+        self._held()[key] = conn
+
+    def __delitem__(self, key):
+        conn = self._held().pop(key)
+        self.pool.discard(key, conn)
+
+    def values(self):
+        return [conn for conn in self._held().values() if conn is not None] + self.pool.idle_connections()
+
+    def clear(self):
+        self.pool.close()
+
+# Transient failures worth retrying; anything else is a real answer from the server
+RETRY_ON = (socket.error, httplib.HTTPException, httplib2.ServerNotFoundError)
+
+def _server_failed(result):
+    response, content = result
+    return response.status >= 500 or response.status == 429
+
+class PooledHttpMixin(object):
+    """Mix into an httplib2.Http subclass to share a ConnectionPool between threads
+
+    Takes an optional 'pool' keyword argument; a private pool is created when
+    it is not given. With a 'scheduler' (lpscheduler.RequestScheduler) every
+    request is rate limited and 5xx/429 answers and network errors are retried.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pool = kwargs.pop('pool', None)
+        scheduler = kwargs.pop('scheduler', None)
+        super(PooledHttpMixin, self).__init__(*args, **kwargs)
+        if pool is None:
+            pool = ConnectionPool()
+        self.connection_pool = pool
+        self.connections = PooledConnections(pool)
+        self.scheduler = scheduler
+
+    def request(self, uri, *args, **kwargs):
+        # httplib2 follows redirects by calling request() again; that inner call runs
+        # under the slot the outer one holds rather than waiting for a second one
+        if self.scheduler is None or self.connections.busy():
+            return self._pooled_request(uri, *args, **kwargs)
+        # Each attempt checks a connection out and returns it, so one waiting for a slot
+        # or backing off before a retry does not keep it from the other threads
+        send = lambda: self._pooled_request(uri, *args, **kwargs)
+        return self.scheduler.call(lpscheduler.endpoint_for(uri), send, _server_failed, RETRY_ON)
+
+    def _pooled_request(self, uri, *args, **kwargs):
+        self.connections.enter()
+        try:
+            return super(PooledHttpMixin, self).request(uri, *args, **kwargs)
+        finally:
+            self.connections.leave()
+
+    def _conn_request(self, conn, request_uri, method, body, headers):
+        self.connection_pool.count_request()
+        response, content = super(PooledHttpMixin, self)._conn_request(conn, request_uri, method, body, headers)
+        if isinstance(self.cache, BoundedFileCache) and ('if-none-match' in headers or 'if-modified-since' in headers):
+            self.cache.count('conditional_requests')
+            if response.status == 304:
+                self.cache.count('not_modified')
+        return response, content
+
+class PooledHttp(PooledHttpMixin, httplib2.Http):
+    """A plain httplib2.Http using a shared ConnectionPool"""
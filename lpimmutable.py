@@ -0,0 +1,127 @@
+"""Permanent cache of Launchpad resources that can no longer change
+
+A merge proposal stops changing once it is merged: its merged revision, merge
+date and preview diff are final. A preview diff never changes at all; a newer
+diff gets a link of its own. Yet every run loads them again for every fixed
+bug, and the revalidating response cache (lphttp.BoundedFileCache) still sends
+a conditional request for each.
+
+ImmutableStore keeps such records, keyed by their link, in an SQLite database
+that lives next to the response cache and is never evicted or revalidated:
+callers look a link up before making any request for it and only store what
+can no longer change.
+
+Dependent Packages: sqlite3 (standard library)
+"""
+
+import calendar
+import json
+import sqlite3
+import threading
+import time
+
+# queue_status of a merge proposal that has landed
+MERGED = 'Merged'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS immutable (
+    link TEXT PRIMARY KEY,
+    record TEXT NOT NULL
+);
+'''
+
+def proposal_record(link, queue_status, merged_revno, date_merged, preview_diff_link):
+    """The fields bugseeker reads from a merge proposal"""
+    return {'self_link': link, 'queue_status': queue_status, 'merged_revno': merged_revno,
+            'date_merged': date_merged, 'preview_diff_link': preview_diff_link}
+
+def proposal_from_json(entry):
+    """The proposal_record of a merge proposal's raw JSON representation, e.g. a landing_targets entry"""
+    date_merged = entry.get('date_merged')
+    if date_merged:
+        date_merged = calendar.timegm(time.strptime(date_merged[:19], "%Y-%m-%dT%H:%M:%S"))
+    return proposal_record(entry['self_link'], entry.get('queue_status'), entry.get('merged_revno'),
+                           date_merged or None, entry.get('preview_diff_link'))
+
+def preview_record(link, diffstat):
+    """The fields bugseeker reads from a preview diff"""
+    return {'self_link': link, 'diffstat': diffstat}
+
+class ImmutableStore(object):
+    """Records of immutable resources by link, in the SQLite database at path. Thread safe.
+
+    New records are written in batches of batch_size and on close()."""
+
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self.stats = {'lookups': 0, 'hits': 0, 'stores': 0}
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def get(self, link):
+        """The record stored for link, or None"""
+        link = unicode(link)
+        self._lock.acquire()
+        try:
+            self.stats['lookups'] += 1
+            record = self._pending.get(link)
+            if record is None:
+                row = self.db.execute('SELECT record FROM immutable WHERE link = ?', (link,)).fetchone()
+                record = row and json.loads(row[0])
+            if record is not None:
+                self.stats['hits'] += 1
+            return record
+        finally:
+            self._lock.release()
+
+    def put(self, link, record):
+        """Keep record (a JSON-serializable dict) for link from now on"""
+        self._lock.acquire()
+        try:
+            self.stats['stores'] += 1
+            self._pending[unicode(link)] = record
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+        finally:
+            self._lock.release()
+
+    def _flush(self):
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO immutable VALUES (?, ?)',
+                                [(link, json.dumps(record)) for link, record in self._pending.items()])
+        self._pending.clear()
+
+    def put_proposal(self, record):
+        """Keep a proposal_record, if the proposal has merged"""
+        if record['queue_status'] == MERGED:
+            self.put(record['self_link'], record)
+
+    def put_preview(self, record):
+        """Keep a preview_record"""
+        self.put(record['self_link'], record)
+
+    def size(self):
+        """Records kept"""
+        self._lock.acquire()
+        try:
+            stored = self.db.execute('SELECT COUNT(*) FROM immutable').fetchone()[0]
+            return stored + len(self._pending)
+        finally:
+            self._lock.release()
+
+    def summary(self):
+        """One line description of the store statistics for the end of run report"""
+        return "%s lookups, %s served without a request, %s new records, %s records kept" % (
+            self.stats['lookups'], self.stats['hits'], self.stats['stores'], self.size())
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._pending:
+                self._flush()
+            self.db.close()
+        finally:
+            self._lock.release()
@@ -0,0 +1,229 @@
+"""Manifest of the report runs kept under LPReports
+
+Each bugseeker run writes its spreadsheet and data files into a directory of
+its own under the reports root and appends an entry to manifest.jsonl there:
+the run id, its directory, every artifact with its size and SHA-1, and how
+long each step took. make_report.py appends a second entry for the charts and
+pages it adds to the run. The manifest is only ever appended to.
+
+manifest.sqlite indexes it: the byte offset of each run's entries and the last
+run of each stage. Finding the latest report is then one lookup however many
+dated directories accumulate, where listing and sorting them with ls -t grew
+with every run and could pick up a directory still being written. The index is
+brought up to date from the manifest when it falls behind, and can be rebuilt
+from it at any time.
+
+publish() points the 'latest' symlink at a finished report by renaming a new
+symlink over the old one, so Apache serves either the previous report or the
+new one, never a missing or half-written one.
+
+Usage: python lpmanifest.py <reports root> latest|relink|rebuild
+       python lpmanifest.py <reports root> show <run id>
+
+Dependent Packages: sqlite3 (standard library)
+"""
+
+from optparse import OptionParser
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+MANIFEST = 'manifest.jsonl'
+INDEX = 'manifest.sqlite'
+LATEST = 'latest'
+
+# Stages a run goes through, in order
+BUGSEEKER = 'bugseeker'
+REPORT = 'make_report'
+PUBLISHED = 'published'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    run TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (run, stage)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    stage TEXT PRIMARY KEY,
+    run TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS indexed (
+    bytes INTEGER NOT NULL
+);
+'''
+
+def checksum(path):
+    """SHA-1 hex digest of the file at path"""
+    digest = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+class Manifest(object):
+    """The manifest of the reports root and its index, created on first use"""
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST)
+        self.db = sqlite3.connect(os.path.join(root, INDEX))
+        self.db.executescript(SCHEMA)
+        if self.db.execute('SELECT COUNT(*) FROM indexed').fetchone()[0] == 0:
+            with self.db:
+                self.db.execute('INSERT INTO indexed VALUES (0)')
+        self._catch_up()
+
+    def close(self):
+        self.db.close()
+
+    def _indexed(self):
+        return self.db.execute('SELECT bytes FROM indexed').fetchone()[0]
+
+    def _catch_up(self):
+        """Index the entries appended since the index was last brought up to date"""
+        if not os.path.exists(self.path):
+            return
+        start = self._indexed()
+        if os.path.getsize(self.path) == start:
+            return
+        f = open(self.path, 'rb')
+        try:
+            f.seek(start)
+            offset = start
+            with self.db:
+                for line in iter(f.readline, ''):
+                    if not line.endswith('\n'):
+                        # An append cut short; it is not part of the manifest
+                        break
+                    self._index(json.loads(line), offset)
+                    offset += len(line)
+                self.db.execute('UPDATE indexed SET bytes = ?', (offset,))
+        finally:
+            f.close()
+
+    def _index(self, entry, offset):
+        self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)', (entry['run'], entry['stage'], offset))
+        self.db.execute('INSERT OR REPLACE INTO latest VALUES (?, ?)', (entry['stage'], entry['run']))
+
+    def rebuild(self):
+        """Index the whole manifest again"""
+        with self.db:
+            self.db.execute('DELETE FROM entries')
+            self.db.execute('DELETE FROM latest')
+            self.db.execute('UPDATE indexed SET bytes = 0')
+        self._catch_up()
+
+    def append(self, entry):
+        """Add entry (a dict with at least 'run' and 'stage') at the end of the manifest"""
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        f = open(self.path, 'ab')
+        try:
+            # One writer at a time; anything appended by another process is indexed first
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._catch_up()
+            offset = self._indexed()
+            if os.path.getsize(self.path) != offset:
+                # Drop what is left of an append cut short, so this entry starts on a line of its own
+                f.truncate(offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            with self.db:
+                self._index(entry, offset)
+                self.db.execute('UPDATE indexed SET bytes = ?', (offset + len(line),))
+        finally:
+            f.close()
+        return entry
+
+    def record(self, run, stage, directory, artifacts=(), timings=None, checksums=None):
+        """Append the entry of one stage of run: the artifacts it wrote (paths relative to
+        directory, itself relative to the root) with their size and SHA-1, and its timings
+        ({step: seconds}). checksums maps artifacts to SHA-1s already computed."""
+        files = {}
+        checksums = checksums or {}
+        for name in artifacts:
+            path = os.path.join(self.root, directory, name)
+            files[name] = {'bytes': os.path.getsize(path), 'sha1': checksums.get(name) or checksum(path)}
+        return self.append({'run': run, 'stage': stage, 'dir': directory, 'time': int(time.time()),
+                            'artifacts': files, 'timings': timings or {}})
+
+    def get(self, run, stage=BUGSEEKER):
+        """The entry of one stage of run, or None"""
+        row = self.db.execute('SELECT offset FROM entries WHERE run = ? AND stage = ?', (run, stage)).fetchone()
+        if row is None:
+            return None
+        f = open(self.path, 'rb')
+        try:
+            f.seek(row[0])
+            return json.loads(f.readline())
+        finally:
+            f.close()
+
+    def latest(self, stage=BUGSEEKER):
+        """The entry of the last run to finish stage, or None"""
+        row = self.db.execute('SELECT run FROM latest WHERE stage = ?', (stage,)).fetchone()
+        return row and self.get(row[0], stage)
+
+    def publish(self, run):
+        """Point the 'latest' symlink at the directory of run, atomically, and record it"""
+        entry = self.get(run)
+        link = os.path.join(self.root, LATEST)
+        temp = '%s.%s.tmp' % (link, os.getpid())
+        if os.path.lexists(temp):
+            os.remove(temp)
+        os.symlink(entry['dir'], temp)
+        os.rename(temp, link)
+        return self.append({'run': run, 'stage': PUBLISHED, 'dir': entry['dir'], 'time': int(time.time())})
+
+    def relink(self):
+        """Point 'latest' back at the last published run whose directory still exists; returns its entry"""
+        entry = self.latest(PUBLISHED)
+        if entry is None or not os.path.isdir(os.path.join(self.root, entry['dir'])):
+            # Fall back on the index of every published run, newest first
+            rows = self.db.execute('SELECT run FROM entries WHERE stage = ? ORDER BY offset DESC', (PUBLISHED,)).fetchall()
+            entry = None
+            for (run,) in rows:
+                candidate = self.get(run, PUBLISHED)
+                if os.path.isdir(os.path.join(self.root, candidate['dir'])):
+                    entry = candidate
+                    break
+        if entry is not None:
+            self.publish(entry['run'])
+        return entry
+
+def main():
+    usage = "usage: %prog root latest|relink|rebuild\n       %prog root show <run id>"
+    parser = OptionParser(usage=usage)
+    (options, args) = parser.parse_args()
+    if len(args) < 2 or args[1] not in ('latest', 'relink', 'rebuild', 'show') or (args[1] == 'show') != (len(args) == 3):
+        sys.exit(parser.print_usage())
+    manifest = Manifest(args[0])
+    command = args[1]
+    if command == 'rebuild':
+        manifest.rebuild()
+        print "Indexed %s bytes of %s" % (manifest._indexed(), manifest.path)
+    elif command == 'relink':
+        entry = manifest.relink()
+        if entry is None:
+            sys.exit("No published run left in %s" % manifest.path)
+        print "latest -> %s" % entry['dir']
+    else:
+        if command == 'latest':
+            entries = [manifest.latest(stage) for stage in (BUGSEEKER, REPORT, PUBLISHED)]
+        else:
+            entries = [manifest.get(args[2], stage) for stage in (BUGSEEKER, REPORT, PUBLISHED)]
+        for entry in entries:
+            if entry is not None:
+                print json.dumps(entry, sort_keys=True, indent=1)
+    manifest.close()
+
+if __name__ == '__main__':
+    main()
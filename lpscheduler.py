@@ -0,0 +1,243 @@
+"""Rate limiting, retries and back-pressure for requests to the Launchpad API
+
+A RequestScheduler sits in front of every request made by bugseeker, whether
+through launchpadlib (lphttp.PooledHttpMixin) or the asynchronous fetcher
+(lpasync.AsyncClient):
+
+  * a token bucket caps the overall request rate;
+  * each endpoint (bugs, people, branches, merge proposals, ...) has its own
+    concurrency limit that grows by one per round of fast successes and is
+    halved on errors or slow responses (AIMD), so it settles just under what
+    the server sustains;
+  * 5xx responses, 429s and network errors are retried with exponential
+    backoff and full jitter;
+  * an endpoint failing repeatedly trips a circuit breaker: requests to it
+    wait out a cool-down instead of hammering the server, then a single
+    probe decides whether traffic resumes.
+"""
+
+from urlparse import urlsplit
+import random
+import re
+import socket
+import threading
+import time
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint's circuit stays open longer than the caller is willing to wait"""
+
+class TokenBucket(object):
+    """rate tokens per second, holding at most burst. rate 0 means unlimited."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.stamp = time.time()
+
+    def take(self, now):
+        """Take a token; returns 0 on success, otherwise the seconds until one is available"""
+        if not self.rate:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class _Endpoint(object):
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.failures = 0
+        self.state = 'closed'
+        self.opened_at = 0
+        self.last_decrease = 0
+        self.latency = None
+        self.counters = {'requests': 0, 'failures': 0, 'retries': 0, 'trips': 0}
+
+_ID = re.compile(r'^(\d+|~.*)$')
+
+def endpoint_for(url):
+    """Group a Launchpad API URL into an endpoint name, e.g. 'bugs', 'people', '+merge', '+preview-diff'"""
+    path = urlsplit(url).path.strip('/').split('/')
+    if path and re.match(r'^(\d+\.\d+|beta|devel)$', path[0]):
+        path = path[1:]
+    for segment in reversed(path):
+        if segment.startswith('+'):
+            return segment
+    if not path:
+        return 'root'
+    if path[0].startswith('~'):
+        return 'people' if len(path) == 1 else 'branches'
+    if len(path) > 1 and _ID.match(path[-1]):
+        return path[0]
+    return path[-1] if len(path) > 1 else path[0]
+
+class RequestScheduler(object):
+    """Decides when a request may start and whether a failed one is retried. Thread safe."""
+
+    def __init__(self, rate=50, burst=None, max_retries=6, initial_limit=4, min_limit=1, max_limit=64,
+                 target_latency=2.0, failure_threshold=5, cooldown=30.0, backoff_base=0.5, backoff_cap=60.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._cond = threading.Condition()
+        self._endpoints = {}
+
+    def _endpoint(self, name):
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            endpoint = self._endpoints[name] = _Endpoint(name, self.initial_limit)
+        return endpoint
+
+    def try_acquire(self, name, now=None):
+        """Claim a slot for a request to endpoint name.
+        Returns 0 when the request may start, otherwise how long to wait before asking again."""
+        if now is None:
+            now = time.time()
+        self._cond.acquire()
+        try:
+            endpoint = self._endpoint(name)
+            if endpoint.state == 'open':
+                remaining = endpoint.opened_at + self.cooldown - now
+                if remaining > 0:
+                    return remaining
+                endpoint.state = 'half-open'
+            if endpoint.state == 'half-open' and endpoint.in_flight > 0:
+                # Only the probe request goes through until it has succeeded
+                return 0.1
+            if endpoint.in_flight >= int(endpoint.limit):
+                return 0.05
+            wait = self.bucket.take(now)
+            if wait:
+                return wait
+            endpoint.in_flight += 1
+            endpoint.counters['requests'] += 1
+            return 0
+        finally:
+            self._cond.release()
+
+    def release(self, name, latency, ok, now=None):
+        """Report how a request claimed with try_acquire went. latency None means it was
+        abandoned without an answer (e.g. resent on another connection) and is not judged."""
+        if now is None:
+            now = time.time()
+        self._cond.acquire()
+        try:
+            endpoint = self._endpoint(name)
+            endpoint.in_flight -= 1
+            self._cond.notify_all()
+            if latency is None:
+                return
+            if ok:
+                endpoint.failures = 0
+                if endpoint.state == 'half-open':
+                    endpoint.state = 'closed'
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency = 0.8 * endpoint.latency + 0.2 * latency
+                if endpoint.latency <= self.target_latency:
+                    endpoint.limit = min(self.max_limit, endpoint.limit + 1.0 / endpoint.limit)
+                else:
+                    self._decrease(endpoint, now)
+            else:
+                endpoint.failures += 1
+                endpoint.counters['failures'] += 1
+                self._decrease(endpoint, now)
+                if endpoint.state == 'half-open' or endpoint.failures >= self.failure_threshold:
+                    if endpoint.state != 'open':
+                        endpoint.counters['trips'] += 1
+                    endpoint.state = 'open'
+                    endpoint.opened_at = now
+        finally:
+            self._cond.release()
+
+    def _decrease(self, endpoint, now):
+        # Halve at most once per target latency so one burst of errors from
+        # requests already in flight does not collapse the limit to the floor
+        if now - endpoint.last_decrease >= self.target_latency:
+            endpoint.limit = max(self.min_limit, endpoint.limit / 2)
+            endpoint.last_decrease = now
+
+    def backoff(self, attempt):
+        """Seconds to wait before retry number attempt (1-based): exponential with full jitter"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def count_retry(self, name):
+        self._cond.acquire()
+        self._endpoint(name).counters['retries'] += 1
+        self._cond.release()
+
+    def call(self, name, func, is_failure=None, retry_on=(socket.error,), max_wait=None):
+        """Run func() under the scheduler, retrying failures. is_failure(result) tells
+        whether a returned result (e.g. a 503 response) should be retried; exceptions in
+        retry_on are retried too. The last result is returned, or the last exception raised,
+        once retries are exhausted; any other exception is raised at once. CircuitOpenError
+        is raised after max_wait seconds of waiting for a slot."""
+        attempt = 0
+        while True:
+            self._wait_for_slot(name, max_wait)
+            start = time.time()
+            try:
+                result = func()
+            except retry_on:
+                self.release(name, time.time() - start, False)
+                if attempt >= self.max_retries:
+                    raise
+            except:
+                # Not the endpoint's doing (a parse or auth error, say): give the slot back
+                # without judging the endpoint, and let the error through
+                self.release(name, None, False)
+                raise
+            else:
+                failed = is_failure is not None and is_failure(result)
+                self.release(name, time.time() - start, not failed)
+                if not failed or attempt >= self.max_retries:
+                    return result
+            attempt += 1
+            self.count_retry(name)
+            time.sleep(self.backoff(attempt))
+
+    def _wait_for_slot(self, name, max_wait=None):
+        deadline = max_wait is not None and time.time() + max_wait
+        self._cond.acquire()
+        try:
+            while True:
+                wait = self.try_acquire(name)
+                if not wait:
+                    return
+                if deadline and time.time() + wait > deadline:
+                    raise CircuitOpenError("endpoint %s unavailable for %s seconds" % (name, max_wait))
+                # Woken early by release() when a slot frees up
+                self._cond.wait(wait)
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """Per-endpoint counters plus the current concurrency limit and circuit state"""
+        self._cond.acquire()
+        try:
+            result = {}
+            for name, endpoint in self._endpoints.items():
+                result[name] = dict(endpoint.counters, limit=int(endpoint.limit), state=endpoint.state)
+            return result
+        finally:
+            self._cond.release()
+
+    def summary(self):
+        lines = []
+        for name, stat in sorted(self.stats().items()):
+            lines.append("%s: %s requests, %s failed, %s retried, limit %s, circuit %s (tripped %s times)" % (
+                name, stat['requests'], stat['failures'], stat['retries'], stat['limit'], stat['state'], stat['trips']))
+        return '\n'.join(lines)
@@ -8,9 +8,21 @@ Following charts are generated:
     5. Distribution by Fixed-by
     6. # of times a file was modified
     7. # of lines modified per file
+    8. Modifications and lines modified per directory
+    9. Open bugs, bugs reported/fixed and time to fix per week
 
-Pre-requisites: bugseeker.py has been run and Bug Report(.xls) spreadsheet is generated
-Dependent Packages: xlrd (pip install), cairoplot (bzr branch lp:cairoplot)
+Every HTML artifact written is also given precompressed .gz (and optionally .br)
+siblings so Apache can serve them through content negotiation. See precompress.py.
+
+The report is made for the latest bugseeker run in the manifest of REPORTS_ROOT;
+once it is complete its artifacts are recorded there too and the 'latest' symlink
+is swapped to it. See lpmanifest.py.
+
+Files identical to an earlier run's are hard links into the artifact store of
+REPORTS_ROOT rather than copies. See artifactstore.py.
+
+Pre-requisites: bugseeker.py has been run with --reports-root REPORTS_ROOT and Bug Report(.xls or .xlsx) spreadsheet is generated
+Dependent Packages: xlrd (pip install), numpy, cairoplot (bzr branch lp:cairoplot), brotli (optional)
 """
 
 __author__ = "Rohit Karajgi"
@@ -22,27 +34,52 @@ __date__ = "June 6, 2011"
 
 from collections import defaultdict
 from datetime import datetime as dt
-import subprocess
-import shutil
+from optparse import OptionParser
 import os
 import re
+import sys
+import time
 import xlrd
 import cairoplot
+import artifactstore
+import lpmanifest
 import markup
+import pathtrie
+import precompress
+import timeseries
 
 REPORTS_ROOT='/var/lib/jenkins/LPReports/'
+IMAGES_DIR='/var/lib/jenkins/images/'
+
+parser = OptionParser(usage="usage: %prog [options]")
+parser.add_option("-z", "--gzip-level", help="Compression level (1-9) of the precompressed .gz artifacts, 0 disables precompression, .br artifacts included. Default: 9", dest="gzip_level", type="int", default=9)
+parser.add_option("-b", "--brotli", help="Also write precompressed .br artifacts, at the quality matching --gzip-level (needs the brotli package)", dest="brotli", action="store_true", default=False)
+parser.add_option("-j", "--compress-jobs", help="Number of processes used to compress artifacts. Default: one per CPU", dest="compress_jobs", type="int", default=None)
+parser.add_option("-r", "--reports-root", help="Reports root holding the manifest and run directories. Default: %s" % REPORTS_ROOT, dest="reports_root", default=REPORTS_ROOT)
+parser.add_option("--images-dir", help="Directory holding the page logo, vertex_ntt.png. Default: %s" % IMAGES_DIR, dest="images_dir", default=IMAGES_DIR)
+(options, args) = parser.parse_args()
+REPORTS_ROOT = options.reports_root
+if not 0 <= options.gzip_level <= 9:
+    parser.error("--gzip-level takes 0 to 9, not %s" % options.gzip_level)
+if options.brotli and precompress.brotli is None:
+    sys.exit(precompress.BROTLI_MISSING)
+
+report_start = time.time()
+manifest = lpmanifest.Manifest(REPORTS_ROOT)
+# Pages and the logo are written through the store: content identical to an earlier run's is linked, not written again
+store = artifactstore.ArtifactStore(REPORTS_ROOT)
 
 def get_latest_reports_dir():
-    """Search the Reports folder for the latest .xls report and return the latest folder and filepath"""
-    pipe = subprocess.Popen(["/bin/ls", "-t", REPORTS_ROOT], stdout=subprocess.PIPE)
-    output,err = pipe.communicate()
-    folder = output.split()[0]
-    latest_dir = os.path.join(REPORTS_ROOT,folder)
-    pipe2 = subprocess.Popen(["/bin/ls", "-t", latest_dir], stdout=subprocess.PIPE)
-    filepath,err = pipe2.communicate()
-    return folder, filepath.split()[0].strip()
-
-folder, filename = get_latest_reports_dir()
+    """Look the latest bugseeker run up in the manifest and return its folder, .xls or .xlsx report and id"""
+    run = manifest.latest(lpmanifest.BUGSEEKER)
+    if run is None:
+        sys.exit("No bugseeker run recorded in %s; run bugseeker.py with --reports-root %s" % (manifest.path, REPORTS_ROOT))
+    spreadsheets = [name for name in run['artifacts'] if name.endswith(('.xls', '.xlsx'))]
+    if not spreadsheets:
+        sys.exit("bugseeker run %s wrote no spreadsheet (--spreadsheet none)" % run['run'])
+    return run['dir'], spreadsheets[0], run['run']
+
+folder, filename, run_id = get_latest_reports_dir()
 absolute_file_path = os.path.join(REPORTS_ROOT,folder,filename)
 
 """Create charts directory and declare chart file paths"""
@@ -50,25 +87,37 @@ reports_dir = os.path.join(REPORTS_ROOT,folder)
 charts_dir = os.path.join(reports_dir,"charts")
 os.mkdir(charts_dir)
 os.mkdir(reports_dir+"/images")
-shutil.copy2('/var/lib/jenkins/images/vertex_ntt.png',reports_dir+'/images/')
+store.copy(os.path.join(options.images_dir,'vertex_ntt.png'),reports_dir+'/images/vertex_ntt.png')
 owners_chart = os.path.join(charts_dir,'owners.png')
 status_chart = os.path.join(charts_dir,'status.png')
 imps_chart = os.path.join(charts_dir,'imps.png')
 fixers_chart = os.path.join(charts_dir,'fixers.png')
 miles_chart = os.path.join(charts_dir,'miles.png')
+dirs_chart = os.path.join(charts_dir,'dirs.png')
 
 wb = xlrd.open_workbook(absolute_file_path)
 sh = wb.sheet_by_index(0)
+# bugseeker.py --layout normalized lists the files of the bugs on a sheet of their own: bug id, file, lines
+files_sh = None
+if wb.nsheets > 1 and wb.sheet_by_index(1).name == sh.name + ' files':
+    files_sh = wb.sheet_by_index(1)
 
 """Get required columns from .xls as lists"""
 total_bugs = sh.col_values(0)
 owners = sh.col_values(3)
+created_dates = sh.col_values(4)
 statuses = sh.col_values(5)
 imps = sh.col_values(6)
 fixers = sh.col_values(7)
+committed_dates = sh.col_values(8)
+released_dates = sh.col_values(9)
 miles = sh.col_values(10)
-files_mod = sh.col_values(17)
-lines_list = sh.col_values(18)
+if files_sh is not None:
+    files_mod = files_sh.col_values(1)
+    lines_list = files_sh.col_values(2)
+else:
+    files_mod = sh.col_values(17)
+    lines_list = sh.col_values(18)
 miles = [val.replace('Compute ','') for val in miles]
 
 def pop3(column):
@@ -76,7 +125,7 @@ def pop3(column):
     for i in range(3):
 	column.pop(0)
 
-for each_column in (owners, statuses, imps, fixers, miles, files_mod, lines_list):
+for each_column in (owners, created_dates, statuses, imps, fixers, committed_dates, released_dates, miles, files_mod, lines_list):
     pop3(each_column)
 
 # Create a copy of files_mod to be used later
@@ -138,6 +187,10 @@ for file_item in only_py_files_map:
 
 sorted_files_to_lines = sorted(files_to_lines, key=lambda x: x[1], reverse=True)
 
+"""Roll the modifications and lines of every file (not only .py) up to each directory level (Graph 8)"""
+dirs_trie = pathtrie.PathTrie()
+dirs_trie.add_many((file_item, 1, int(lines_list[row_num] or 0)) for row_num, file_item in enumerate(files_list) if file_item and file_item != 'N/A')
+
 def plot_chart(param, img_file, width=1040, height=480):
     """Get the parameter list and plot Vertical bar chart"""
     data = [[val[1]] for val in param]
@@ -150,6 +203,14 @@ plot_chart(statuses_count, status_chart)
 plot_chart(sorted_imps_count, imps_chart, width=750)
 plot_chart(sorted_fixers_count[:15], fixers_chart, width=1280)
 plot_chart(sorted_miles_count, miles_chart, width=1200)
+cairoplot.sunburst_plot(dirs_chart, dirs_trie.to_tree(depth=3, k=8), 800, 800, background=None, colors="rainbow")
+
+"""Bin the bugs by week for the backlog, reported/fixed and time to fix charts (Graph 9)"""
+bug_rows = [row_num for row_num, value in enumerate(created_dates) if value]
+trends = timeseries.from_columns([created_dates[i] for i in bug_rows], [committed_dates[i] for i in bug_rows],
+                                 [released_dates[i] for i in bug_rows], step=7)
+if trends.bins:
+    timeseries.render_charts(trends, charts_dir)
 
 def make_files_mod_table(reports_dir, sorted_files_mod_count):
     """Using the sorted list of files modified, create the HTML table"""
@@ -168,9 +229,7 @@ def make_files_mod_table(reports_dir, sorted_files_mod_count):
 	page.tr.close()
         count = count + 1
     page.table.close()
-    html = open(reports_dir+'/files_count.html', 'w')
-    html.write(str(page))
-    html.close()
+    store.put(reports_dir+'/files_count.html', str(page))
 
 def make_lines_mod_table(reports_dir, sorted_files_to_lines):
     """Using the sorted list of lines modified per file, create the HTML table"""
@@ -189,9 +248,33 @@ def make_lines_mod_table(reports_dir, sorted_files_to_lines):
 	page.tr.close()
         count = count + 1
     page.table.close()
-    html = open(reports_dir+'/lines_count.html', 'w')
-    html.write(str(page))
-    html.close()
+    store.put(reports_dir+'/lines_count.html', str(page))
+
+def make_dirs_table(reports_dir, dirs_trie, top=15):
+    """Using the directory rollup, create the HTML table of the busiest directories at each level"""
+    page = markup.page()
+    page.init(title="Launchpad Bug report")
+    page.img(src="charts/dirs.png", alt="Directories Chart")
+    for depth, directories in dirs_trie.top_by_level(top):
+        page.h1("Level %s (Top %s)" % (depth, top), style="font-family:Verdana,sans-serif; font-size:14pt; color:rgb(136,0,0)")
+        page.table(border="2", cellspacing="0", cellpadding="4", width="50%", style="font-family:Verdana, sans-serif; text-align:left")
+        page.th("S/N")
+        page.th("Directory")
+        page.th("# of times a file was modified")
+        page.th("# of lines modified till date")
+        page.th("# of files modified")
+        count = 1
+        for path, node in directories:
+            page.tr()
+            page.td(count)
+            page.td(str(path))
+            page.td(str(node.modifications))
+            page.td(str(node.lines))
+            page.td(str(node.files))
+            page.tr.close()
+            count = count + 1
+        page.table.close()
+    store.put(reports_dir+'/dirs_count.html', str(page))
 
 def make_owners_count_table(reports_dir, sorted_owners_count):
     """Using the sorted list of owners, create the HTML table"""
@@ -210,9 +293,7 @@ def make_owners_count_table(reports_dir, sorted_owners_count):
 	page.tr.close()
         count = count + 1
     page.table.close()
-    html = open(reports_dir+'/owners.html', 'w')
-    html.write(str(page))
-    html.close()
+    store.put(reports_dir+'/owners.html', str(page))
 
 def make_fixers_count_table(reports_dir, sorted_fixers_count):
     """Using the sorted list of Fixed-by names, create the HTML table"""
@@ -231,9 +312,7 @@ def make_fixers_count_table(reports_dir, sorted_fixers_count):
 	page.tr.close()
         count = count + 1
     page.table.close()
-    html = open(reports_dir+'/fixers.html', 'w')
-    html.write(str(page))
-    html.close()
+    store.put(reports_dir+'/fixers.html', str(page))
 
 def make_html(reports_dir, filename, total_bugs):
     """Function to create the HTML chart from Launchpad Bug report xls"""
@@ -244,7 +323,7 @@ def make_html(reports_dir, filename, total_bugs):
     page.h1("LAUNCHPAD BUG REPORT - OpenStack NOVA     (%s)"%dt.now().strftime("%d-%m-%Y"), style="font-family:Verdana,sans-serif; font-size:18pt; color:rgb(96,0,0)")
     page.hr()
     page.h1("Total Bug Count: %s"%total_bugs, style="font-family:Verdana,sans-serif; font-size:16pt; color:006699")
-    page.a("Download .xls Report", href="./"+filename)
+    page.a("Download %s Report" % os.path.splitext(filename)[1], href="./"+filename)
     page.br()
     page.br()
     page.a("1. Bug Distribution - By Status", href="#c1", style="text-decoration:none; font-family:Verdana,sans-serif; font-size:12")
@@ -260,6 +339,10 @@ def make_html(reports_dir, filename, total_bugs):
     page.a("6. # of times a file was modified", href="files_count.html", style="text-decoration:none; font-family:Verdana,sans-serif; font-size:12")
     page.br()
     page.a("7. # of lines modified per file", href="lines_count.html", style="text-decoration:none; font-family:Verdana,sans-serif; font-size:12")
+    page.br()
+    page.a("8. Modifications and lines modified per directory", href="dirs_count.html", style="text-decoration:none; font-family:Verdana,sans-serif; font-size:12")
+    page.br()
+    page.a("9. Open bugs, reported/fixed and time to fix - By week", href="#c6", style="text-decoration:none; font-family:Verdana,sans-serif; font-size:12")
 
     for i in range(2):
         page.br()
@@ -289,14 +372,38 @@ def make_html(reports_dir, filename, total_bugs):
     page.a("Click here for complete table", href="fixers.html")
     page.img(src="charts/fixers.png", alt="Fixers Chart")
     page.a("Top", href="#top", style="align:right")
-    html = open(reports_dir+'/index.html', 'w')
-    html.write(str(page))
-    html.close()
+    page.br()
+    page.a(name="c6")
+    page.h1("9. Open bugs, reported/fixed and time to fix - By week", style="font-family:Verdana,sans-serif; font-size:14pt; color:rgb(136,0,0)")
+    page.img(src="charts/backlog.png", alt="Open Bugs Chart")
+    page.img(src="charts/flow.png", alt="Reported/Fixed Chart")
+    page.img(src="charts/time_to_fix.png", alt="Time to Fix Chart (rolling 4 weeks)")
+    page.a("Top", href="#top", style="align:right")
+    store.put(reports_dir+'/index.html', str(page))
 
 """Make all the HTML files"""
 make_files_mod_table(reports_dir, sorted_files_mod_count)
 make_lines_mod_table(reports_dir, sorted_files_to_lines)
+make_dirs_table(reports_dir, dirs_trie)
 make_owners_count_table(reports_dir, sorted_owners_count)
 make_fixers_count_table(reports_dir, sorted_fixers_count)
 print "Creating HTML reports..."
 make_html(reports_dir, filename, total_bugs)
+
+compress_start = time.time()
+if options.gzip_level > 0:
+    print "Precompressing HTML artifacts..."
+    precompress.precompress(reports_dir, options.gzip_level, options.brotli, options.compress_jobs)
+
+"""Link the charts, compressed siblings and spreadsheet to the artifact store, record the report's
+artifacts in the manifest and only then make it the latest one"""
+link_start = time.time()
+bugseeker_artifacts = manifest.get(run_id)['artifacts']
+digests = store.add_tree(reports_dir, dict((name, info['sha1']) for name, info in bugseeker_artifacts.items()))
+manifest.record(run_id, lpmanifest.REPORT, folder, sorted(name for name in digests if name not in bugseeker_artifacts),
+                {'report': round(compress_start - report_start, 2), 'precompress': round(link_start - compress_start, 2),
+                 'link': round(time.time() - link_start, 2)}, digests)
+print "Artifact store: %s" % store.summary()
+manifest.publish(run_id)
+manifest.close()
+print "Published %s as %s" % (reports_dir, os.path.join(REPORTS_ROOT, lpmanifest.LATEST))
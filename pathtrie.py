@@ -0,0 +1,155 @@
+"""Roll file modification and line counts up to every directory level
+
+A PathTrie is built in one pass over (path, modifications, lines) items: each
+file is counted under its directory, found with a single dictionary lookup,
+and a bottom-up pass over the directories (far fewer than the files) then
+sums them, so every subsystem ('nova/', 'nova/compute/', ...) gets its totals
+without sorting or re-scanning the flat list of files. top_by_level() then gives the k busiest directories at
+each depth, and to_tree() a pruned hierarchy for cairoplot's sunburst_plot.
+
+A path can be a file in one bug and a directory in another (a module replaced by
+a package). Its node is then a directory that keeps its counts as a file apart
+and adds them to those of its entries.
+"""
+
+import heapq
+
+class Node(object):
+    """A file (children None) or a directory. A directory's counts are the sums of its entries,
+    plus own, [modifications, lines], when the same path was also modified as a file."""
+    __slots__ = ('name', 'children', 'modifications', 'lines', 'files', 'own')
+
+    def __init__(self, name):
+        self.name = name
+        self.children = None
+        self.modifications = 0
+        self.lines = 0
+        self.files = 0
+        self.own = None
+
+class PathTrie(object):
+    """Modification and line counts of files, rolled up to every directory above them"""
+
+    def __init__(self):
+        self.root = Node('')
+        self.root.children = {}
+        # Directory path -> node, so adding a file costs one lookup instead of a walk from the root
+        self._dirs = {'': self.root}
+        self._dirty = False
+
+    def _directory(self, path):
+        node = self._dirs.get(path)
+        if node is None:
+            parent, _, name = path.rpartition('/')
+            siblings = self._directory(parent).children
+            node = siblings.get(name)
+            if node is None:
+                node = siblings[name] = Node(name)
+            else:
+                # Counted as a file so far: keep those counts as the directory's own
+                node.own = [node.modifications, node.lines]
+            node.children = {}
+            self._dirs[path] = node
+        return node
+
+    def add(self, path, modifications=1, lines=0):
+        """Count modifications and lines for the file at path"""
+        self.add_many([(path, modifications, lines)])
+
+    def add_many(self, items):
+        """Count an iterable of (path, modifications, lines)"""
+        dirs = self._dirs
+        for path, modifications, lines in items:
+            directory, _, name = path.rpartition('/')
+            children = (dirs.get(directory) or self._directory(directory)).children
+            leaf = children.get(name)
+            if leaf is None:
+                leaf = children[name] = Node(name)
+                leaf.files = 1
+            elif leaf.children is not None:
+                # A directory modified as a file too
+                if leaf.own is None:
+                    leaf.own = [0, 0]
+                leaf.own[0] += modifications
+                leaf.own[1] += lines
+                continue
+            leaf.modifications += modifications
+            leaf.lines += lines
+        self._dirty = True
+
+    def _rollup(self):
+        """Sum every directory from its entries, deepest directories first"""
+        if not self._dirty:
+            return
+        order = [self.root]
+        for node in order:
+            order.extend(child for child in node.children.itervalues() if child.children is not None)
+        for node in reversed(order):
+            modifications = lines = files = 0
+            if node.own is not None:
+                modifications, lines, files = node.own[0], node.own[1], 1
+            for child in node.children.itervalues():
+                modifications += child.modifications
+                lines += child.lines
+                files += child.files
+            node.modifications, node.lines, node.files = modifications, lines, files
+        self._dirty = False
+
+    def add_bugs(self, bugs):
+        """Count the files each bug (a BugRecord) modified, with the lines added and removed"""
+        self.add_many((path, 1, added + removed) for bug in bugs for path, (added, removed) in bug.diffstat().iteritems())
+
+    def node(self, path):
+        """The node for a file or directory ('nova/compute'), or None"""
+        self._rollup()
+        node = self.root
+        for name in path.strip('/').split('/'):
+            if not name:
+                continue
+            if node.children is None or name not in node.children:
+                return None
+            node = node.children[name]
+        return node
+
+    def top(self, path='', k=10, key='modifications'):
+        """The k entries directly under the directory at path with the most modifications (or lines)"""
+        node = self.node(path)
+        if node is None or node.children is None:
+            return []
+        return heapq.nlargest(k, node.children.values(), key=lambda child: getattr(child, key))
+
+    def top_by_level(self, k=10, key='modifications', max_depth=None):
+        """[(depth, [(directory path, node), ...])]: the k busiest directories at each depth"""
+        self._rollup()
+        levels = []
+        frontier = [('', self.root)]
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            directories = []
+            for prefix, node in frontier:
+                for name, child in node.children.iteritems():
+                    if child.children is not None:
+                        directories.append((prefix + name + '/', child))
+            if not directories:
+                break
+            levels.append((depth, heapq.nlargest(k, directories, key=lambda item: getattr(item[1], key))))
+            frontier = directories
+        return levels
+
+    def to_tree(self, depth=3, k=8, key='modifications', path=''):
+        """(label, value, children) for the directory at path, keeping the k largest entries
+        per directory down to depth levels and lumping the rest into 'other'"""
+        node = self.node(path)
+        return self._subtree(node, node.name or path or '/', depth, k, key)
+
+    def _subtree(self, node, label, depth, k, key):
+        value = getattr(node, key)
+        if depth == 0 or node.children is None:
+            return (label, value, [])
+        largest = heapq.nlargest(k, node.children.values(), key=lambda child: getattr(child, key))
+        children = [self._subtree(child, child.name, depth - 1, k, key) for child in largest]
+        rest = value - sum(child[1] for child in children)
+        if rest > 0 and (len(node.children) > k or node.own is not None):
+            children.append(('other', rest, []))
+        return (label, value, children)
@@ -0,0 +1,134 @@
+"""Write precompressed siblings of the static report artifacts
+
+For every HTML/SVG/JSON (and other text) file under a report directory a
+'<name>.gz' sibling is written, plus a '<name>.br' sibling when brotli is
+requested; that needs the brotli package. Apache can then hand out the
+precompressed file through content negotiation (see README) instead of
+compressing, or not compressing, on every download.
+
+Files are compressed in parallel with a process pool. Siblings that are
+already newer than their source are left alone, so re-running is cheap.
+
+Dependent Packages: brotli (optional, pip install brotli)
+"""
+
+from cStringIO import StringIO
+from multiprocessing import Pool
+import gzip
+import os
+import sys
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.html', '.htm', '.svg', '.json', '.css', '.js', '.csv', '.txt')
+MIN_SIZE = 256
+BROTLI_MISSING = "brotli output was requested but the brotli package is not installed (pip install brotli)"
+
+def find_artifacts(root):
+    """Return the sorted list of compressible files under root"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                found.append(os.path.join(dirpath, name))
+    return sorted(found)
+
+def _is_fresh(path, sibling):
+    try:
+        return os.path.getmtime(sibling) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+def _write_sibling(path, sibling, data):
+    """Write data next to path atomically and give it the source file's mtime"""
+    tmp = sibling + '.tmp'
+    out = open(tmp, 'wb')
+    out.write(data)
+    out.close()
+    os.rename(tmp, sibling)
+    st = os.stat(path)
+    os.utime(sibling, (st.st_atime, st.st_mtime))
+
+def _gzip_bytes(name, data, level):
+    buf = StringIO()
+    # mtime=0 keeps the output byte-identical between runs
+    out = gzip.GzipFile(name, 'wb', level, buf, 0)
+    out.write(data)
+    out.close()
+    return buf.getvalue()
+
+def compress_file(args):
+    """Compress one file; returns (path, size, gz_size, br_size). Runs in a pool worker."""
+    path, level, use_brotli, force = args
+    size = os.path.getsize(path)
+    gz_size = br_size = None
+    if size < MIN_SIZE:
+        return path, size, gz_size, br_size
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+
+    gz_path = path + '.gz'
+    if force or not _is_fresh(path, gz_path):
+        _write_sibling(path, gz_path, _gzip_bytes(os.path.basename(path), data, level))
+    gz_size = os.path.getsize(gz_path)
+
+    if use_brotli and brotli is not None:
+        br_path = path + '.br'
+        if force or not _is_fresh(path, br_path):
+            # brotli quality runs 0-11, map the gzip 1-9 scale onto it
+            quality = min(11, int(round(level * 11 / 9.0)))
+            _write_sibling(path, br_path, brotli.compress(data, quality=quality))
+        br_size = os.path.getsize(br_path)
+    return path, size, gz_size, br_size
+
+def precompress(root, level=9, use_brotli=False, processes=None, force=False):
+    """Write .gz (and .br) siblings for every artifact under root.
+
+    Returns a list of (path, size, gz_size, br_size) tuples, one per artifact. Raises
+    ImportError when use_brotli is set and brotli is not installed.
+    """
+    if use_brotli and brotli is None:
+        raise ImportError(BROTLI_MISSING)
+    paths = find_artifacts(root)
+    if not paths:
+        return []
+    jobs = [(path, level, use_brotli, force) for path in paths]
+    if processes == 1 or len(jobs) == 1:
+        return map(compress_file, jobs)
+    pool = Pool(processes)
+    try:
+        return pool.map(compress_file, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def summarize(results):
+    """Return (total_size, total_gz_size, total_br_size) for a precompress() result"""
+    size = sum(r[1] for r in results)
+    gz_size = sum(r[2] if r[2] is not None else r[1] for r in results)
+    br_size = sum(r[3] if r[3] is not None else r[1] for r in results)
+    return size, gz_size, br_size
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(usage="usage: %prog report_dir [options]")
+    parser.add_option("-l", "--level", help="gzip compression level 1-9. Default: 9", dest="level", type="int", default=9)
+    parser.add_option("-b", "--brotli", help="Also write .br siblings", dest="brotli", action="store_true", default=False)
+    parser.add_option("-j", "--jobs", help="Number of worker processes. Default: one per CPU", dest="jobs", type="int", default=None)
+    parser.add_option("-f", "--force", help="Rewrite siblings even if they are up to date", dest="force", action="store_true", default=False)
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("report_dir is required")
+    if not 1 <= options.level <= 9:
+        parser.error("--level takes 1 to 9, not %s" % options.level)
+    if options.brotli and brotli is None:
+        sys.exit(BROTLI_MISSING)
+    start = time.time()
+    results = precompress(args[0], options.level, options.brotli, options.jobs, options.force)
+    size, gz_size, br_size = summarize(results)
+    print "Compressed %s artifacts: %s bytes -> %s bytes gzip, %s bytes brotli in %.2f seconds" % (len(results), size, gz_size, br_size, time.time() - start)
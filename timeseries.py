@@ -0,0 +1,196 @@
+"""Bug metrics over time: backlog, inflow/outflow and time to fix
+
+Bugs are binned by day or by week with numpy: one bincount for the bugs
+reported and one for the bugs fixed per bin, a cumulative sum of the
+difference for the open backlog, and percentiles of the days from report to
+fix over a rolling window of bins. A decade of bugs across every project is
+binned in well under a second.
+
+A bug counts as fixed on its Fix Committed date, or its Fix Released date when
+it has none.
+
+Usage: python timeseries.py [options] BugReport_nova_<date>.jsonl [more .jsonl data files]
+
+Dependent Packages: numpy, cairoplot (bzr branch lp:cairoplot) for the charts
+"""
+
+from datetime import date, timedelta
+from optparse import OptionParser
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy
+
+# Day number of a missing date ('N/A', '' or None)
+MISSING = -1
+EPOCH = date(1970, 1, 1)
+STEPS = {'day': 1, 'week': 7}
+
+def day_numbers(values):
+    """Days since 1970-01-01 of dates given as seconds since the epoch (bugseeker's records)
+    or 'dd-mm-yyyy' strings (its spreadsheets); MISSING for no date (None, 'N/A' or '')"""
+    # A decade holds a few thousand distinct dates: convert each once
+    days = {}
+    for value in set(values):
+        if isinstance(value, (int, long, float)):
+            days[value] = int(value) // 86400
+        elif value and value != 'N/A':
+            d, m, y = value.split('-')
+            days[value] = (date(int(y), int(m), int(d)) - EPOCH).days
+        else:
+            days[value] = MISSING
+    return numpy.fromiter(map(days.__getitem__, values), dtype=numpy.int32, count=len(values))
+
+def fix_days(committed, released):
+    """Day each bug was fixed: Fix Committed, or Fix Released when it was never marked committed"""
+    return numpy.where(committed != MISSING, committed, released)
+
+class BugTimeSeries(object):
+    """Bugs binned into consecutive periods of step days starting at start (a day number).
+
+    inflow[i] and outflow[i] are the bugs reported and fixed in bin i, backlog[i]
+    the bugs reported but not yet fixed at the end of it."""
+
+    def __init__(self, created, fixed, step=1):
+        created = numpy.asarray(created)
+        fixed = numpy.asarray(fixed)
+        known = created != MISSING
+        created, fixed = created[known], fixed[known]
+        self.step = step
+        if not len(created):
+            self.start, self.bins = 0, 0
+        else:
+            start = int(created.min())
+            if step == 7:
+                # Weeks start on Monday; day 0 was a Thursday
+                start -= (start - 4) % 7
+            end = max(int(created.max()), int(fixed.max()))
+            self.start = start
+            self.bins = (end - start) // step + 1
+        done = fixed != MISSING
+        # A fix recorded before the report (bad data) counts on the day of the report
+        self.fixed = numpy.maximum(fixed[done], created[done])
+        self.days_to_fix = self.fixed - created[done]
+        self.inflow = numpy.bincount((created - self.start) // step, minlength=self.bins)
+        self.outflow = numpy.bincount((self.fixed - self.start) // step, minlength=self.bins)
+        self.backlog = numpy.cumsum(self.inflow - self.outflow)
+
+    def dates(self):
+        """First day of every bin, as datetime.date"""
+        return [EPOCH + timedelta(days=self.start + i * self.step) for i in range(self.bins)]
+
+    def time_to_fix(self, window=4, percentiles=(50, 90)):
+        """{percentile: array} of the days from report to fix of the bugs fixed in the window
+        bins ending with each bin. Bins with no fix in their window are nan."""
+        fixed_bin = (self.fixed - self.start) // self.step
+        order = numpy.argsort(fixed_bin, kind='mergesort')
+        days = self.days_to_fix[order].astype(numpy.float64)
+        # bounds[i] is the first fix (in bin order) of bin i
+        bounds = numpy.searchsorted(fixed_bin[order], numpy.arange(self.bins + 1))
+        result = numpy.empty((self.bins, len(percentiles)))
+        ranks = numpy.asarray(percentiles, dtype=numpy.float64) / 100
+        for i in range(self.bins):
+            window_days = days[bounds[max(i - window + 1, 0)]:bounds[i + 1]]
+            if not len(window_days):
+                result[i] = numpy.nan
+                continue
+            # Linear interpolation between the closest ranks, as numpy.percentile, without its per-call overhead
+            window_days = numpy.sort(window_days)
+            position = ranks * (len(window_days) - 1)
+            low = position.astype(numpy.intp)
+            high = numpy.minimum(low + 1, len(window_days) - 1)
+            result[i] = window_days[low] + (window_days[high] - window_days[low]) * (position - low)
+        return dict((p, result[:, n]) for n, p in enumerate(percentiles))
+
+def from_columns(created, committed, released, step=1):
+    """BugTimeSeries of parallel lists of Date Created, Fix Committed and Fix Released dates"""
+    return BugTimeSeries(day_numbers(created), fix_days(day_numbers(committed), day_numbers(released)), step)
+
+def from_records(records, step=1):
+    """BugTimeSeries of bug records (the dicts of bugseeker's .jsonl data files)"""
+    return from_columns([record['date_created'] for record in records],
+                        [record['date_fix_committed'] for record in records],
+                        [record['date_fix_released'] for record in records], step)
+
+def load_records(paths):
+    """Bug records of every .jsonl data file in paths (gzipped when named .jsonl.gz)"""
+    records = []
+    for path in paths:
+        f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        try:
+            records.extend(json.loads(line) for line in f if line.strip())
+        finally:
+            f.close()
+    return records
+
+def _fill_forward(values):
+    """Replace nan by the last value before it (0 at the start), so the lines have no gaps"""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    valid = ~numpy.isnan(values)
+    last = numpy.maximum.accumulate(numpy.where(valid, numpy.arange(len(values)), -1))
+    return numpy.where(last >= 0, values[numpy.maximum(last, 0)], 0.0)
+
+def _labels(series, count=12):
+    """x labels for the charts: about count evenly spread dates, blank in between"""
+    every = max(series.bins // count, 1)
+    return [day.strftime("%d-%m-%Y") if i % every == 0 else '' for i, day in enumerate(series.dates())]
+
+def render_charts(series, charts_dir, prefix='', width=1200, height=480, window=4):
+    """Draw backlog.png, flow.png and time_to_fix.png (prefixed by prefix) in charts_dir;
+    returns their paths"""
+    import cairoplot
+    labels = _labels(series)
+    backlog_chart = os.path.join(charts_dir, prefix + 'backlog.png')
+    flow_chart = os.path.join(charts_dir, prefix + 'flow.png')
+    ttf_chart = os.path.join(charts_dir, prefix + 'time_to_fix.png')
+
+    chart = cairoplot.DotLinePlot(backlog_chart, {'Open bugs': series.backlog.tolist()}, width, height, background=None,
+                                  border=20, axis=True, grid=True, series_legend=True, x_labels=labels, series_colors="custom")
+    chart.render()
+    chart.commit()
+
+    flow = [[int(reported), int(fixed)] for reported, fixed in zip(series.inflow, series.outflow)]
+    chart = cairoplot.StreamChart(flow_chart, flow, width, height, background=None, border=20, grid=True,
+                                  series_legend=['Reported', 'Fixed'], x_labels=labels, series_colors="red_green_blue")
+    chart.render()
+    chart.commit()
+
+    ttf = series.time_to_fix(window)
+    chart = cairoplot.DotLinePlot(ttf_chart, {'Median days to fix': _fill_forward(ttf[50]).tolist(),
+                                              '90th percentile': _fill_forward(ttf[90]).tolist()},
+                                  width, height, background=None, border=20, axis=True, grid=True, series_legend=True,
+                                  x_labels=labels, series_colors="red_orange_yellow")
+    chart.render()
+    chart.commit()
+    return backlog_chart, flow_chart, ttf_chart
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] data.jsonl [data.jsonl ...]")
+    parser.add_option("--step", help="Bin by 'day' or 'week'. Default: week", dest="step", default='week')
+    parser.add_option("-w", "--window", help="Bins in the rolling time to fix window. Default: 4", dest="window", type="int", default=4)
+    parser.add_option("-o", "--output", help="Directory the charts are written to. Default: no charts", dest="output", default=None)
+    (options, args) = parser.parse_args()
+    if not args or options.step not in STEPS:
+        sys.exit(parser.print_usage())
+    records = load_records(args)
+    start = time.time()
+    series = from_records(records, STEPS[options.step])
+    ttf = series.time_to_fix(options.window)
+    elapsed = time.time() - start
+    if not series.bins:
+        sys.exit("No dated bugs in %s" % ', '.join(args))
+    print "%s bugs, %s %ss from %s, binned in %.2f seconds" % (len(records), series.bins, options.step, series.dates()[0], elapsed)
+    print "%-12s %8s %8s %8s %10s %10s" % (options.step, 'reported', 'fixed', 'open', 'median ttf', '90% ttf')
+    dates = series.dates()
+    for i in range(max(series.bins - 12, 0), series.bins):
+        print "%-12s %8s %8s %8s %10.1f %10.1f" % (dates[i].strftime("%d-%m-%Y"), series.inflow[i], series.outflow[i],
+                                                   series.backlog[i], ttf[50][i], ttf[90][i])
+    if options.output:
+        for path in render_charts(series, options.output, window=options.window):
+            print "Wrote %s" % path
+
+if __name__ == '__main__':
+    main()
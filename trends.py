@@ -0,0 +1,251 @@
+"""Trends across every archived report run
+
+make_report.py only reads the newest spreadsheet. This scans all the run
+directories under the reports root (those in the manifest and older ones
+alike), boils each run's spreadsheet down to a small summary (bugs by status,
+importance and milestone, the most modified files) and draws how those moved
+from run to run with cairoplot.DotLinePlot.
+
+Summaries are computed in a process pool, since parsing a spreadsheet with
+xlrd takes most of the time, and cached as trend_summary.json in the run's
+directory. A run is only ever summarized once: after a new night only the new
+run is read. Runs bugseeker appended to the column store (.columns under the
+reports root, see lpcolumns.py) are summarized from its columns instead, which
+takes milliseconds, and are not cached.
+
+Usage: python trends.py [options] [reports root]
+
+Dependent Packages: xlrd (pip install), cairoplot (bzr branch lp:cairoplot) for the charts
+"""
+
+from multiprocessing import Pool
+from optparse import OptionParser
+import json
+import os
+import sys
+import time
+
+import artifactstore
+import lpmanifest
+
+REPORTS_ROOT = '/var/lib/jenkins/LPReports/'
+SUMMARY = 'trend_summary.json'
+# Bump when the summary format changes, so cached summaries are computed again
+VERSION = 1
+TOP_FILES = 100
+
+STATUS, IMPORTANCE, MILESTONE, FILES = 5, 6, 10, 17
+HEADER_ROWS = 3
+SPREADSHEETS = ('.xls', '.xlsx')
+# The column store bugseeker.py --reports-root appends every run to
+COLUMN_STORE = '.columns'
+# Suffix of the sheet listing a project's modified files in bugseeker.py --layout normalized
+FILES_SHEET = ' files'
+
+def count(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+def summarize_spreadsheet(path):
+    """Bugs by status, importance and milestone, and the TOP_FILES most modified files, over every
+    sheet (project) of a bugseeker spreadsheet"""
+    import xlrd
+    workbook = xlrd.open_workbook(path)
+    statuses, importances, milestones, files = {}, {}, {}, {}
+    bugs = 0
+    names = set(workbook.sheet_names())
+    for sheet in workbook.sheets():
+        if sheet.name.endswith(FILES_SHEET) and sheet.name[:-len(FILES_SHEET)] in names:
+            # The files sheet of the normalized layout: bug id, file, lines
+            for name in sheet.col_values(1, HEADER_ROWS):
+                count(files, name)
+            continue
+        if sheet.ncols <= FILES:
+            continue
+        status_col = sheet.col_values(STATUS, HEADER_ROWS)
+        importance_col = sheet.col_values(IMPORTANCE, HEADER_ROWS)
+        milestone_col = sheet.col_values(MILESTONE, HEADER_ROWS)
+        for row, status in enumerate(status_col):
+            # The rows listing a bug's other modified files leave the bug's columns blank
+            if not status:
+                continue
+            bugs += 1
+            count(statuses, status)
+            count(importances, importance_col[row])
+            count(milestones, milestone_col[row].replace('Compute ', ''))
+        if sheet.name + FILES_SHEET in names:
+            continue
+        for name in sheet.col_values(FILES, HEADER_ROWS):
+            if name and name != 'N/A':
+                count(files, name)
+    top = sorted(files.items(), key=lambda item: (-item[1], item[0]))[:TOP_FILES]
+    return {'bugs': bugs, 'status': statuses, 'importance': importances, 'milestone': milestones, 'files': dict(top)}
+
+def _spreadsheet(run_dir, entry):
+    """The .xls or .xlsx report of a run: the one recorded in the manifest, or the one in its directory"""
+    if entry is not None:
+        names = [name for name in entry['artifacts'] if name.endswith(SPREADSHEETS)]
+    else:
+        names = sorted(name for name in os.listdir(run_dir) if name.endswith(SPREADSHEETS))
+    return names and names[0] or None
+
+def _counts(store, column, start, stop, table='bugs'):
+    """{value: rows} of a dictionary-encoded column of the store over rows start to stop"""
+    import numpy
+    names = store.dictionary(table, column)
+    counts = numpy.bincount(store.column(table, column)[start:stop], minlength=len(names))
+    return dict((names[code], int(counts[code])) for code in numpy.flatnonzero(counts))
+
+def summarize_columns(store, run):
+    """The summary of one run from an lpcolumns.ColumnStore, as summarize_spreadsheet makes it"""
+    start, stop = store.run_rows(run)
+    milestones = {}
+    for name, n in _counts(store, 'milestone', start, stop).items():
+        # As written in the spreadsheet, then read back by summarize_spreadsheet
+        name = name.replace('OpenStack ', '').replace('Compute ', '')
+        milestones[name] = milestones.get(name, 0) + n
+    files = _counts(store, 'path', *store.run_rows(run, 'files'), table='files')
+    top = sorted(files.items(), key=lambda item: (-item[1], item[0]))[:TOP_FILES]
+    return {'bugs': stop - start, 'status': _counts(store, 'status', start, stop),
+            'importance': _counts(store, 'importance', start, stop), 'milestone': milestones, 'files': dict(top)}
+
+def load_cached(run_dir, source):
+    """The summary cached for run_dir if it was made from source (name, size) by this version, or None"""
+    try:
+        f = open(os.path.join(run_dir, SUMMARY), 'rb')
+        try:
+            summary = json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+    if summary.get('version') != VERSION or summary.get('source') != list(source):
+        return None
+    return summary
+
+def summarize_run(args):
+    """Summarize one run and cache the summary next to it; returns (run, summary). Runs in a pool worker."""
+    run, run_dir, source, when = args
+    summary = summarize_spreadsheet(os.path.join(run_dir, source[0]))
+    summary.update({'version': VERSION, 'run': run, 'source': list(source), 'time': when})
+    path = os.path.join(run_dir, SUMMARY)
+    temp = '%s.%s.tmp' % (path, os.getpid())
+    try:
+        out = open(temp, 'wb')
+        try:
+            json.dump(summary, out)
+        finally:
+            out.close()
+        os.rename(temp, path)
+    except (IOError, OSError):
+        # A run directory we may not write to is summarized again next time
+        pass
+    return run, summary
+
+def collect(root, processes=None):
+    """Summaries of every run under root, oldest first, and the number computed in this call (from
+    spreadsheets or from the column store)"""
+    manifest = lpmanifest.Manifest(root)
+    cached, todo = {}, []
+    runs = artifactstore.run_directories(root, manifest)
+    store = None
+    if os.path.exists(os.path.join(root, COLUMN_STORE, 'meta.json')):
+        import lpcolumns
+        store = lpcolumns.ColumnStore(os.path.join(root, COLUMN_STORE))
+    from_columns = 0
+    for when, run in runs:
+        run_dir = os.path.join(root, run)
+        if store is not None and store.run_rows(run) is not None:
+            summary = cached[run] = summarize_columns(store, run)
+            summary.update({'version': VERSION, 'run': run, 'source': [COLUMN_STORE], 'time': when})
+            from_columns += 1
+            continue
+        name = _spreadsheet(run_dir, manifest.get(run))
+        if name is None:
+            continue
+        source = (name, os.path.getsize(os.path.join(run_dir, name)))
+        summary = load_cached(run_dir, source)
+        if summary is not None:
+            cached[run] = summary
+        else:
+            todo.append((run, run_dir, source, when))
+    manifest.close()
+    if processes == 1 or len(todo) <= 1:
+        computed = map(summarize_run, todo)
+    else:
+        pool = Pool(processes)
+        try:
+            computed = pool.map(summarize_run, todo)
+        finally:
+            pool.close()
+            pool.join()
+    cached.update(computed)
+    return [cached[run] for when, run in runs if run in cached], len(todo) + from_columns
+
+def series(summaries, field, keys):
+    """{key: [count in each run]} of the counts by field (status, importance, milestone or files)"""
+    return dict((key, [summary[field].get(key, 0) for summary in summaries]) for key in keys)
+
+def largest(summary, field, k):
+    """The k keys with the highest counts by field in one summary"""
+    return [key for key, n in sorted(summary[field].items(), key=lambda item: (-item[1], item[0]))[:k]]
+
+def _labels(summaries, count=12):
+    every = max(len(summaries) // count, 1)
+    return [time.strftime("%d-%m-%Y", time.localtime(summary['time'])) if i % every == 0 else ''
+            for i, summary in enumerate(summaries)]
+
+def render_charts(summaries, output, top=6, width=1200, height=480):
+    """Draw one DotLinePlot per field (and one of the bug total) in output, plus an index.html
+    showing them; returns the paths of the charts"""
+    import cairoplot
+    import markup
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    latest = summaries[-1]
+    labels = _labels(summaries)
+    charts = [('bugs.png', 'Bugs in the report', {'Bugs': [summary['bugs'] for summary in summaries]})]
+    for field, title in (('status', 'Bugs by status'), ('importance', 'Bugs by importance'),
+                         ('milestone', 'Bugs by milestone (the %s largest)' % top),
+                         ('files', 'Bugs modifying each of the %s most modified files' % top)):
+        charts.append((field + '.png', title, series(summaries, field, largest(latest, field, top))))
+    page = markup.page()
+    page.init(title="Launchpad Bug report trends")
+    page.h1("LAUNCHPAD BUG REPORT TRENDS - %s runs, %s to %s" % (len(summaries), labels[0], time.strftime("%d-%m-%Y", time.localtime(latest['time']))),
+            style="font-family:Verdana,sans-serif; font-size:18pt; color:rgb(96,0,0)")
+    paths = []
+    for name, title, data in charts:
+        path = os.path.join(output, name)
+        chart = cairoplot.DotLinePlot(path, data, width, height, background=None, border=20, axis=True, grid=True,
+                                      series_legend=True, x_labels=labels, series_colors="custom")
+        chart.render()
+        chart.commit()
+        paths.append(path)
+        page.h1(title, style="font-family:Verdana,sans-serif; font-size:14pt; color:rgb(136,0,0)")
+        page.img(src=name, alt=title)
+    html = open(os.path.join(output, 'index.html'), 'w')
+    html.write(str(page))
+    html.close()
+    return paths
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] [reports root]")
+    parser.add_option("-o", "--output", help="Directory the trend charts and index.html are written to. Default: trends", dest="output", default='trends')
+    parser.add_option("-j", "--jobs", help="Number of processes summarizing runs. Default: one per CPU", dest="jobs", type="int", default=None)
+    parser.add_option("-t", "--top", help="Milestones and files charted. Default: 6", dest="top", type="int", default=6)
+    parser.add_option("-n", "--no-charts", help="Only bring the cached summaries up to date", dest="charts", action="store_false", default=True)
+    (options, args) = parser.parse_args()
+    if len(args) > 1:
+        sys.exit(parser.print_usage())
+    root = args[0] if args else REPORTS_ROOT
+    start = time.time()
+    summaries, computed = collect(root, options.jobs)
+    print "%s runs, %s summarized now and %s from their cache, in %.2f seconds" % (
+        len(summaries), computed, len(summaries) - computed, time.time() - start)
+    if not summaries:
+        sys.exit("No report runs under %s" % root)
+    if options.charts:
+        for path in render_charts(summaries, options.output, options.top):
+            print "Wrote %s" % path
+
+if __name__ == '__main__':
+    main()
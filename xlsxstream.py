@@ -0,0 +1,253 @@
+"""Streaming .xlsx writer
+
+xlwt keeps the whole workbook in memory until save() and stops at 65,536 rows
+per sheet. XlsxWriter writes each row of a sheet to a temporary file as it is
+given and only zips the parts together in close(), so memory use does not grow
+with the number of rows, and a sheet holds up to 1,048,576 of them.
+
+Cells take one of the fixed formats in STYLES, written once to styles.xml and
+referred to by index. Strings are written inline, so no shared string table is
+kept in memory. Hyperlink cells become native hyperlink records (the first
+MAX_HYPERLINKS of a sheet, which is as many as Excel reads; the rest fall back
+on HYPERLINK formulas).
+
+    writer = XlsxWriter('report.xlsx')
+    sheet = writer.add_sheet('nova', widths={2: 60}, freeze_rows=2)
+    sheet.write_row([("Bug Report for Project: 'NOVA'", HEADING)])
+    sheet.merge_cells(0, 0, 1)
+    sheet.write_row([('Bug ID', HEADER), ('Title', HEADER)])
+    sheet.write_row([(Hyperlink('https://...', 700001), LINK), (u'Title', DATA)])
+    writer.close()
+
+Dependent Packages: none (zipfile and tempfile from the standard library)
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+# Cell formats, by index into cellXfs
+DEFAULT, HEADING, HEADER, DATA, LINK = range(5)
+
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="5">
+<font><sz val="10"/><name val="Arial"/></font>
+<font><b/><u/><sz val="16"/><name val="Calibri"/></font>
+<font><b/><sz val="10"/><name val="Verdana"/></font>
+<font><sz val="10"/><name val="Arial"/></font>
+<font><u/><sz val="10"/><color rgb="FF0000FF"/><name val="Arial"/></font>
+</fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="3">
+<border><left/><right/><top/><bottom/><diagonal/></border>
+<border><left style="medium"/><right style="medium"/><top style="medium"/><bottom style="medium"/><diagonal/></border>
+<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>
+</borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="5">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1"><alignment horizontal="left" vertical="justify" wrapText="1"/></xf>
+<xf numFmtId="0" fontId="2" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="center"/></xf>
+<xf numFmtId="0" fontId="3" fillId="0" borderId="2" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="justify" wrapText="1"/></xf>
+<xf numFmtId="0" fontId="4" fillId="0" borderId="2" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="justify" wrapText="1"/></xf>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>
+'''
+
+MAX_ROWS = 1048576
+MAX_HYPERLINKS = 65530
+
+NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+HYPERLINK_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink'
+# Characters XML 1.0 does not allow, even escaped
+_INVALID = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def column_letter(index):
+    """'A' for column 0, 'Z' for 25, 'AA' for 26, ..."""
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+_COLUMNS = [column_letter(i) for i in range(256)]
+
+def _clean(value):
+    """value as unicode without the characters XML does not allow"""
+    if isinstance(value, str):
+        value = value.decode('utf-8', 'replace')
+    return _INVALID.sub(u'', value)
+
+def _text(value):
+    """value escaped for element content"""
+    return escape(_clean(value)).encode('utf-8')
+
+def _attribute(value):
+    """value escaped and quoted for an attribute"""
+    return quoteattr(_clean(value)).encode('utf-8')
+
+class Hyperlink(object):
+    """A cell value linking to url and showing text (a string or number)"""
+    __slots__ = ('url', 'text')
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+
+class Sheet(object):
+    """One worksheet, written a row at a time; made by XlsxWriter.add_sheet"""
+
+    def __init__(self, name, directory, widths=None, freeze_rows=0):
+        self.name = name[:31]
+        self.rows = 0
+        self.links = 0
+        self.merges = []
+        self._body = tempfile.NamedTemporaryFile(dir=directory, suffix='.sheet', delete=False)
+        self._hyperlinks = tempfile.NamedTemporaryFile(dir=directory, suffix='.links', delete=False)
+        self._rels = tempfile.NamedTemporaryFile(dir=directory, suffix='.rels', delete=False)
+        out = self._body
+        out.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet %s>' % NS)
+        if freeze_rows:
+            out.write('<sheetViews><sheetView workbookViewId="0"><pane ySplit="%s" topLeftCell="A%s" activePane="bottomLeft" state="frozen"/>'
+                      '</sheetView></sheetViews>' % (freeze_rows, freeze_rows + 1))
+        if widths:
+            out.write('<cols>%s</cols>' % ''.join('<col min="%s" max="%s" width="%s" customWidth="1"/>' % (col + 1, col + 1, width)
+                                                  for col, width in sorted(widths.items())))
+        out.write('<sheetData>')
+
+    def merge_cells(self, row, first_col, last_col):
+        """Merge columns first_col to last_col of an already written row (0 based)"""
+        self.merges.append('%s%s:%s%s' % (_COLUMNS[first_col], row + 1, _COLUMNS[last_col], row + 1))
+
+    def write_row(self, cells):
+        """Write the next row: a list of (value, style) or None for an empty cell. A value is a
+        number, a string, None (a formatted empty cell) or a Hyperlink."""
+        if self.rows == MAX_ROWS:
+            raise ValueError("sheet %r is full: %s rows" % (self.name, MAX_ROWS))
+        self.rows += 1
+        r = str(self.rows)
+        parts = ['<row r="%s">' % r]
+        append = parts.append
+        for col, cell in enumerate(cells):
+            if cell is None:
+                continue
+            value, style = cell
+            ref = _COLUMNS[col] + r
+            if isinstance(value, Hyperlink):
+                if self.links < MAX_HYPERLINKS:
+                    self.links += 1
+                    self._hyperlinks.write('<hyperlink ref="%s" r:id="rId%s"/>' % (ref, self.links))
+                    self._rels.write('<Relationship Id="rId%s" Type="%s" Target=%s TargetMode="External"/>' % (
+                        self.links, HYPERLINK_TYPE, _attribute(value.url)))
+                else:
+                    formula = 'HYPERLINK("%s","%s")' % (value.url.replace('"', '""'), unicode(value.text).replace('"', '""'))
+                    append('<c r="%s" s="%s" t="str"><f>%s</f><v>%s</v></c>' % (ref, style, _text(formula), _text(unicode(value.text))))
+                    continue
+                value = value.text
+            if value is None or value == '':
+                append('<c r="%s" s="%s"/>' % (ref, style))
+            elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+                append('<c r="%s" s="%s"><v>%s</v></c>' % (ref, style, repr(value) if isinstance(value, float) else value))
+            else:
+                append('<c r="%s" s="%s" t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % (ref, style, _text(value)))
+        append('</row>')
+        self._body.write(''.join(parts))
+
+    def _finish(self):
+        """Complete the worksheet part; returns the paths of the worksheet and of its relationships (or None)"""
+        out = self._body
+        out.write('</sheetData>')
+        if self.merges:
+            out.write('<mergeCells count="%s">%s</mergeCells>' % (len(self.merges), ''.join('<mergeCell ref="%s"/>' % ref for ref in self.merges)))
+        self._hyperlinks.close()
+        if self.links:
+            out.write('<hyperlinks>')
+            links = open(self._hyperlinks.name, 'rb')
+            try:
+                shutil.copyfileobj(links, out)
+            finally:
+                links.close()
+            out.write('</hyperlinks>')
+        out.write('</worksheet>')
+        out.close()
+        os.remove(self._hyperlinks.name)
+        self._rels.close()
+        if not self.links:
+            os.remove(self._rels.name)
+            return out.name, None
+        return out.name, self._rels.name
+
+class XlsxWriter(object):
+    """A workbook written to path by close(); its sheets stream their rows to temporary files
+    in the same directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.xlsx')
+        self.sheets = []
+
+    def add_sheet(self, name, widths=None, freeze_rows=0):
+        """A new sheet; widths maps column indices to widths in characters"""
+        sheet = Sheet(name, self.directory, widths, freeze_rows)
+        self.sheets.append(sheet)
+        return sheet
+
+    def close(self):
+        try:
+            temp = self.path + '.tmp'
+            book = zipfile.ZipFile(temp, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+            try:
+                self._write_parts(book)
+            finally:
+                book.close()
+            os.rename(temp, self.path)
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _write_parts(self, book):
+        sheets = self.sheets
+        book.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + ''.join('<Override PartName="/xl/worksheets/sheet%s.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' % (i + 1)
+                      for i in range(len(sheets))) +
+            '</Types>')
+        book.writestr('_rels/.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        book.writestr('xl/workbook.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook %s><sheets>%s</sheets></workbook>' % (
+            NS, ''.join('<sheet name=%s sheetId="%s" r:id="rId%s"/>' % (_attribute(sheet.name), i + 1, i + 1) for i, sheet in enumerate(sheets))))
+        book.writestr('xl/_rels/workbook.xml.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join('<Relationship Id="rId%s" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet%s.xml"/>' % (i + 1, i + 1)
+                      for i in range(len(sheets))) +
+            '<Relationship Id="rId%s" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>' % (len(sheets) + 1) +
+            '</Relationships>')
+        book.writestr('xl/styles.xml', STYLES)
+        for i, sheet in enumerate(sheets):
+            body, rels = sheet._finish()
+            book.write(body, 'xl/worksheets/sheet%s.xml' % (i + 1))
+            if rels is not None:
+                rels_part = open(rels + '.xml', 'wb')
+                try:
+                    rels_part.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">')
+                    body_rels = open(rels, 'rb')
+                    try:
+                        shutil.copyfileobj(body_rels, rels_part)
+                    finally:
+                        body_rels.close()
+                    rels_part.write('</Relationships>')
+                finally:
+                    rels_part.close()
+                book.write(rels + '.xml', 'xl/worksheets/_rels/sheet%s.xml.rels' % (i + 1))